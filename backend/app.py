@@ -15,6 +15,9 @@ from core.data_manager import DataManager
 from core.session_manager import SessionManager
 from utils.command_runner import CommandRunner
 from core.context_protocol import ModelContextProtocol
+from core.llm_metrics import LLMMetricsStore
+from core.model_backends import create_model_backend
+from core.model_call_guard import ModelCallGuard
 from reports.report_formatter import ReportFormatter
 from reports.report_generator import ReportGenerator
 
@@ -71,12 +74,36 @@ def create_app():
 
     gemini_api_key = os.getenv("GEMINI_API_KEY")
     if not gemini_api_key:
-        logger.error("ERROR: GEMINI_API_KEY no encontrada en .env")
         gemini_api_key = ""
+        # Con el modelo local (MODEL_BACKEND: stub) no hace falta clave
+        if app.config.get('MODEL_BACKEND', 'gemini') == 'gemini':
+            logger.error("ERROR: GEMINI_API_KEY no encontrada en .env")
+
+    app.model_backend = create_model_backend(app.config, gemini_api_key)
+
+    # Latencia, tokens y coste de cada llamada al modelo (ver core/llm_metrics.py)
+    app.llm_metrics = LLMMetricsStore(
+        pricing=app.config.get('LLM_PRICING_PER_MILLION')
+    ) if app.config.get('LLM_METRICS_ENABLED', True) else None
+
+    # Plazo por llamada y réplica opcional en un modelo más rápido (ver core/model_call_guard.py)
+    app.model_call_guard = ModelCallGuard(
+        deadline_seconds=app.config.get('MODEL_CALL_DEADLINE_SECONDS', 30),
+        hedge_model_name=app.config.get('GEMINI_HEDGE_MODEL'),
+        hedge_percentile=app.config.get('GEMINI_HEDGE_PERCENTILE', 95),
+        initial_hedge_delay_seconds=app.config.get('GEMINI_HEDGE_INITIAL_DELAY_SECONDS', 5),
+        min_hedge_delay_seconds=app.config.get('GEMINI_HEDGE_MIN_DELAY_SECONDS', 0.5)
+    )
 
     app.model_context_protocol = ModelContextProtocol(
         api_key=gemini_api_key,
-        model_name=app.config.get('GEMINI_MODEL', 'gemini-2.5-flash-preview-09-2025')
+        model_name=app.config.get('GEMINI_MODEL', 'gemini-2.5-flash-preview-09-2025'),
+        history_token_budget=app.config.get('CHAT_HISTORY_TOKEN_BUDGET', 32000),
+        history_keep_recent_turns=app.config.get('CHAT_HISTORY_KEEP_RECENT_TURNS', 6),
+        tool_output_max_chars=app.config.get('CONTEXT_TOOL_OUTPUT_MAX_CHARS', 12000),
+        metrics=app.llm_metrics,
+        backend=app.model_backend,
+        call_guard=app.model_call_guard
     )
 
     app.orchestrator = MainOrchestrator(
@@ -85,7 +112,8 @@ def create_app():
         model_context_protocol=app.model_context_protocol,
         command_runner=app.command_runner,
         report_formatter=app.report_formatter,
-        report_generator=app.report_generator
+        report_generator=app.report_generator,
+        config=app.config
     )
 
     app.config["GEMINI_API_KEY"] = gemini_api_key
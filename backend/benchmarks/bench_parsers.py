@@ -0,0 +1,195 @@
+# src/benchmarks/bench_parsers.py
+"""
+Benchmark de rendimiento de los parsers de Molly con salidas Nmap sintéticas.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_parsers                       # compara con benchmarks/baseline.json los casos que tienen línea base
+    python -m benchmarks.bench_parsers --only report_markdown_parser
+    python -m benchmarks.bench_parsers --hosts 65536 --ports 8
+    python -m benchmarks.bench_parsers --update-baseline     # regenera la línea base en esta máquina
+
+Mide throughput (hosts/s y MB/s) y memoria pico (tracemalloc) de:
+    - NmapParser.parse_nmap_output (texto)
+    - NmapParser.parse_nmap_xml_output (XML)
+    - construct_cpe_name_simplified
+    - ReportGenerator._parse_markdown
+Sin --only se ejecutan los casos que tienen línea base para el tamaño elegido (todos si no hay ninguna o con
+--update-baseline). Sale con código 1 si algún caso empeora más allá de la tolerancia respecto a la línea base,
+si no tiene línea base o si no se puede ejecutar por falta de dependencias.
+Las líneas base dependen del hardware: generarlas en la misma máquina donde se comparan.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Any, Callable, List, Optional
+
+from benchmarks.synthetic_nmap import generate_nmap_text, generate_nmap_xml, generate_service_pairs
+from modules.nmap_tool.nmap_parser import NmapParser
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Por debajo de este margen absoluto las diferencias de memoria pico son ruido (ej. casos que apenas reservan memoria)
+MEMORY_NOISE_MB = 1.0
+
+
+def _measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Ejecuta la función `repeat` veces (mejor tiempo) y una vez más bajo tracemalloc para la memoria pico."""
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best_time, "peak_mb": peak / (1024 * 1024)}
+
+
+def bench_text_parser(hosts: int, ports: int, repeat: int) -> Dict[str, Any]:
+    parser = NmapParser()
+    data = generate_nmap_text(hosts, ports)
+    result = _measure(lambda: parser.parse_nmap_output(data), repeat)
+    size_mb = len(data.encode('utf-8')) / (1024 * 1024)
+    return {**result, "hosts_per_s": hosts / result["seconds"], "mb_per_s": size_mb / result["seconds"], "input_mb": size_mb}
+
+
+def bench_xml_parser(hosts: int, ports: int, repeat: int) -> Dict[str, Any]:
+    parser = NmapParser()
+    data = generate_nmap_xml(hosts, ports)
+    result = _measure(lambda: parser.parse_nmap_xml_output(data), repeat)
+    size_mb = len(data.encode('utf-8')) / (1024 * 1024)
+    return {**result, "hosts_per_s": hosts / result["seconds"], "mb_per_s": size_mb / result["seconds"], "input_mb": size_mb}
+
+
+def bench_cpe_construction(hosts: int, ports: int, repeat: int) -> Dict[str, Any]:
+    from modules.cve_lookup.nvd_client import construct_cpe_name_simplified
+    # construct_cpe_name_simplified registra cada CPE (y las versiones no normalizables): se silencia para no medir el logging
+    logging.getLogger('modules.cve_lookup.nvd_client').setLevel(logging.ERROR)
+    pairs = generate_service_pairs(hosts, ports)
+
+    def run():
+        for service_name, version in pairs:
+            construct_cpe_name_simplified(service_name, version)
+            construct_cpe_name_simplified(service_name, version, generic=True)
+
+    result = _measure(run, repeat)
+    return {**result, "hosts_per_s": hosts / result["seconds"], "calls_per_s": 2 * len(pairs) / result["seconds"]}
+
+
+def bench_markdown_parser(hosts: int, ports: int, repeat: int) -> Dict[str, Any]:
+    from reports.report_formatter import ReportFormatter
+    from reports.report_generator import ReportGenerator
+
+    parsed = NmapParser().parse_nmap_output(generate_nmap_text(hosts, ports))
+    host_rows = [{"ip_address": ip, "hostname": h["hostname"], "os_info": h["os_info"] or 'N/A'} for ip, h in parsed["hosts"].items()]
+    services = {ip: h["ports"] for ip, h in parsed["hosts"].items()}
+    scan_info = {"session_name": "benchmark", "scan_type": "Network Scan", "target": "10.0.0.0/8", "start_time": "N/A", "status": "completed"}
+
+    formatter = ReportFormatter()
+    markdown = formatter.format_network_scan_summary(scan_info, host_rows, services)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        generator = ReportGenerator(report_path_root=tmp_dir, report_formatter=formatter)
+        result = _measure(lambda: generator._parse_markdown(markdown), repeat)
+    size_mb = len(markdown.encode('utf-8')) / (1024 * 1024)
+    return {**result, "hosts_per_s": hosts / result["seconds"], "mb_per_s": size_mb / result["seconds"], "input_mb": size_mb}
+
+
+BENCHMARKS: Dict[str, Callable[[int, int, int], Dict[str, Any]]] = {
+    "nmap_text_parser": bench_text_parser,
+    "nmap_xml_parser": bench_xml_parser,
+    "cpe_construction": bench_cpe_construction,
+    "report_markdown_parser": bench_markdown_parser,
+}
+
+
+def compare_with_baseline(case_key: str, metrics: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Retorna la lista de regresiones del caso respecto a la línea base (vacía si no hay)."""
+    reference = baseline.get(case_key)
+    if not reference:
+        return []
+    regressions = []
+    if metrics["hosts_per_s"] < reference["hosts_per_s"] * (1 - tolerance):
+        regressions.append(f"throughput {metrics['hosts_per_s']:.0f} hosts/s < línea base {reference['hosts_per_s']:.0f} hosts/s")
+    if metrics["peak_mb"] > max(reference["peak_mb"] * (1 + tolerance), reference["peak_mb"] + MEMORY_NOISE_MB):
+        regressions.append(f"memoria pico {metrics['peak_mb']:.1f} MB > línea base {reference['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark de parsers de Molly con salidas Nmap sintéticas.")
+    arg_parser.add_argument('--hosts', type=int, default=5000, help="Número de hosts sintéticos (ej. 65536).")
+    arg_parser.add_argument('--ports', type=int, default=5, help="Puertos abiertos por host.")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="Repeticiones por caso (se toma el mejor tiempo).")
+    arg_parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help="Ejecutar solo estos casos (por defecto, los que tienen línea base).")
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Ruta del JSON de línea base.")
+    arg_parser.add_argument('--tolerance', type=float, default=0.25, help="Margen de regresión permitido (0.25 = 25%%).")
+    arg_parser.add_argument('--update-baseline', action='store_true', help="Guardar los resultados como nueva línea base.")
+    args = arg_parser.parse_args(argv)
+
+    # Los constructores de Molly imprimen mensajes de inicialización; no interesan aquí
+    logging.basicConfig(level=logging.WARNING)
+
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f).get("cases", {})
+
+    results: Dict[str, Any] = {}
+    failures: List[str] = []
+    print(f"Benchmark de parsers: {args.hosts} hosts x {args.ports} puertos, mejor de {args.repeat} ejecuciones\n")
+    print(f"{'caso':<40} {'hosts/s':>12} {'MB/s':>8} {'pico MB':>9}  estado")
+
+    case_names = args.only
+    if not case_names:
+        with_baseline = [name for name in BENCHMARKS if f"{name}[{args.hosts}x{args.ports}]" in baseline]
+        case_names = list(BENCHMARKS) if args.update_baseline or not with_baseline else with_baseline
+        skipped = [name for name in BENCHMARKS if name not in case_names]
+        if skipped:
+            print(f"Casos sin línea base para este tamaño (ejecutarlos con --only): {', '.join(skipped)}\n")
+
+    for name in case_names:
+        case_key = f"{name}[{args.hosts}x{args.ports}]"
+        try:
+            metrics = BENCHMARKS[name](args.hosts, args.ports, args.repeat)
+        except ImportError as e:
+            print(f"{case_key:<40} {'-':>12} {'-':>8} {'-':>9}  omitido (dependencia no disponible: {e.name})")
+            failures.append(f"{case_key}: no se pudo ejecutar (dependencia no disponible: {e.name})")
+            continue
+
+        results[case_key] = {k: round(v, 4) for k, v in metrics.items()}
+        regressions = compare_with_baseline(case_key, metrics, baseline, args.tolerance)
+        status = "REGRESIÓN" if regressions else ("ok" if case_key in baseline else "sin línea base")
+        mb_per_s = f"{metrics['mb_per_s']:.1f}" if 'mb_per_s' in metrics else '-'
+        print(f"{case_key:<40} {metrics['hosts_per_s']:>12.0f} {mb_per_s:>8} {metrics['peak_mb']:>9.1f}  {status}")
+        failures.extend(f"{case_key}: {r}" for r in regressions)
+        if case_key not in baseline:
+            # Un caso sin línea base no puede detectar regresiones: no debe pasar la comprobación en silencio
+            failures.append(f"{case_key}: sin línea base (generarla con --update-baseline)")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                "machine": f"{platform.system()} {platform.machine()} / Python {platform.python_version()}",
+                "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "cases": {**baseline, **results}
+            }, f, indent=2, sort_keys=True)
+        print(f"\nLínea base actualizada: {args.baseline}")
+        return 0
+
+    if failures:
+        print("\n*** REGRESIONES DE RENDIMIENTO O CASOS SIN COMPROBAR ***")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
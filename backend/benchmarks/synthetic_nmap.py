@@ -0,0 +1,111 @@
+# src/benchmarks/synthetic_nmap.py
+import ipaddress
+import random
+from typing import Dict, Any, Iterator, List, Tuple
+from xml.sax.saxutils import quoteattr
+
+# Catálogo de servicios realistas: (puerto, servicio, producto, versión, extrainfo)
+SERVICE_CATALOG: List[Tuple[int, str, str, str, str]] = [
+    (21, "ftp", "vsftpd", "3.0.3", ""),
+    (22, "ssh", "OpenSSH", "7.6p1 Ubuntu 4ubuntu0.3", "Ubuntu Linux; protocol 2.0"),
+    (22, "ssh", "OpenSSH", "8.9p1 Ubuntu 3ubuntu0.1", "Ubuntu Linux; protocol 2.0"),
+    (25, "smtp", "Postfix smtpd", "", ""),
+    (53, "domain", "ISC BIND", "9.16.1", "Ubuntu Linux"),
+    (80, "http", "Apache httpd", "2.4.52", "(Ubuntu)"),
+    (80, "http", "nginx", "1.18.0", "Ubuntu"),
+    (110, "pop3", "Dovecot pop3d", "", ""),
+    (139, "netbios-ssn", "Samba smbd", "4.6.2", ""),
+    (443, "https", "Apache httpd", "2.4.41", "(Ubuntu)"),
+    (445, "microsoft-ds", "Microsoft Windows Server 2008 R2 - 2012 microsoft-ds", "", ""),
+    (3306, "mysql", "MySQL", "5.7.33-0ubuntu0.18.04.1", ""),
+    (3389, "ms-wbt-server", "Microsoft Terminal Services", "", ""),
+    (5432, "postgresql", "PostgreSQL DB", "12.2 - 12.4", ""),
+    (6379, "redis", "Redis key-value store", "6.0.16", ""),
+    (8080, "http", "Apache Tomcat", "9.0.31", ""),
+]
+
+OS_CATALOG = ["Linux 4.15 - 5.10", "Linux 5.0 - 5.4", "Microsoft Windows Server 2016", "FreeBSD 12.0-RELEASE"]
+
+
+def generate_hosts(host_count: int, ports_per_host: int, seed: int = 42) -> Iterator[Dict[str, Any]]:
+    """
+    Genera hosts sintéticos de forma determinista. Cada host es
+    {"ip", "hostname", "os_info", "ports": [(puerto, servicio, producto, versión, extrainfo), ...]}.
+    """
+    rng = random.Random(seed)
+    base = ipaddress.ip_address("10.0.0.1")
+    for index in range(host_count):
+        ip = str(base + index)
+        services = rng.sample(SERVICE_CATALOG, k=min(ports_per_host, len(SERVICE_CATALOG)))
+        # Si se piden más puertos que servicios del catálogo, se añaden puertos altos genéricos
+        extra = [(10000 + n, "unknown", "", "", "") for n in range(max(0, ports_per_host - len(services)))]
+        yield {
+            "ip": ip,
+            "hostname": f"host-{index}.lab.local" if index % 3 else None,
+            "os_info": rng.choice(OS_CATALOG) if index % 2 else None,
+            "ports": sorted(services + extra, key=lambda s: s[0])
+        }
+
+
+def _version_field(product: str, version: str, extrainfo: str) -> str:
+    parts = [product, version, f"({extrainfo})" if extrainfo else ""]
+    return " ".join(p for p in parts if p)
+
+
+def generate_nmap_text(host_count: int, ports_per_host: int, seed: int = 42) -> str:
+    """Genera una salida de texto de Nmap (-oN) con el formato que consume NmapParser.parse_nmap_output."""
+    lines = [f"# Nmap 7.94 scan initiated as: nmap -sS -sV -O --open 10.0.0.0/8 (sintético: {host_count} hosts)"]
+    for host in generate_hosts(host_count, ports_per_host, seed):
+        lines.append(f"Nmap scan report for {host['ip']}" + (f" ({host['hostname']})" if host['hostname'] else ""))
+        lines.append("Host is up (0.00040s latency).")
+        lines.append(f"Not shown: {1000 - len(host['ports'])} closed tcp ports (reset)")
+        lines.append("PORT      STATE SERVICE       VERSION")
+        for port, service, product, version, extrainfo in host['ports']:
+            lines.append(f"{f'{port}/tcp':<9} open  {service:<13} {_version_field(product, version, extrainfo)}".rstrip())
+        if host['os_info']:
+            lines.append(f"OS details: {host['os_info']}")
+        lines.append("")
+    lines.append(f"Nmap done: {host_count} IP addresses ({host_count} hosts up) scanned in 123.45 seconds")
+    return "\n".join(lines)
+
+
+def generate_nmap_xml(host_count: int, ports_per_host: int, seed: int = 42) -> str:
+    """Genera una salida XML de Nmap (-oX) con el formato que consume NmapParser.parse_nmap_xml_output."""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<nmaprun scanner="nmap" args="nmap -sS -sV -O --open -oX - 10.0.0.0/8" version="7.94">']
+    for host in generate_hosts(host_count, ports_per_host, seed):
+        parts.append('<host><status state="up" reason="echo-reply"/>')
+        parts.append(f'<address addr="{host["ip"]}" addrtype="ipv4"/>')
+        if host['hostname']:
+            parts.append(f'<hostnames><hostname name="{host["hostname"]}" type="PTR"/></hostnames>')
+        parts.append('<ports>')
+        for port, service, product, version, extrainfo in host['ports']:
+            attributes = f'name={quoteattr(service)}'
+            if product:
+                attributes += f' product={quoteattr(product)}'
+            if version:
+                attributes += f' version={quoteattr(version)}'
+            if extrainfo:
+                attributes += f' extrainfo={quoteattr(extrainfo)}'
+            parts.append(f'<port protocol="tcp" portid="{port}"><state state="open" reason="syn-ack"/>'
+                         f'<service {attributes} method="probed" conf="10"/></port>')
+        parts.append('</ports>')
+        if host['os_info']:
+            parts.append(f'<os><osmatch name={quoteattr(host["os_info"])} accuracy="95"/></os>')
+        parts.append('</host>')
+    parts.append(f'<runstats><hosts up="{host_count}" down="0" total="{host_count}"/></runstats></nmaprun>')
+    return "\n".join(parts)
+
+
+def generate_service_pairs(host_count: int, ports_per_host: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """Pares (service_name, version) tal como los produce NmapParser, para medir construct_cpe_name_simplified."""
+    return [
+        (service, _version_field(product, version, extrainfo) or "N/A")
+        for host in generate_hosts(host_count, ports_per_host, seed)
+        for _, service, product, version, extrainfo in host['ports']
+    ]
+
+
+if __name__ == '__main__':
+    print(generate_nmap_text(3, 3))
+    print(generate_nmap_xml(2, 2))
@@ -0,0 +1,106 @@
+# src/core/ai_analysis_queue.py
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AIAnalysisQueue:
+    """
+    Cola persistente de análisis de servicios aplazados por cuota agotada del modelo.
+    Cada entrada guarda lo necesario para completar el hallazgo más tarde (escaneo, host,
+    servicio y datos del puerto); un servicio solo puede estar encolado una vez.
+    Estados: 'pending' (por analizar), 'done' (hallazgo registrado) y 'failed' (la IA no dio un resultado válido).
+    """
+    def __init__(self, db_name: str = 'ai_analysis_queue.db'):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ai_analysis_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scan_id INTEGER NOT NULL,
+                    host_id INTEGER NOT NULL,
+                    service_id INTEGER NOT NULL UNIQUE,
+                    port_info_json TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_queue_status ON ai_analysis_queue (status, created_at)")
+            conn.commit()
+
+    def enqueue(self, services: List[Dict[str, Any]], error: Optional[str] = None) -> int:
+        """
+        Encola servicios {"scan_id", "host_id", "service_id", "port_info"}. Los ya encolados se ignoran.
+        Retorna cuántos se añadieron.
+        """
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            before = conn.total_changes
+            cursor.executemany(
+                "INSERT OR IGNORE INTO ai_analysis_queue (scan_id, host_id, service_id, port_info_json, attempts, last_error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?, ?)",
+                [(s['scan_id'], s['host_id'], s['service_id'], json.dumps(s['port_info']), error, now, now) for s in services]
+            )
+            conn.commit()
+            added = conn.total_changes - before
+        logger.info(f"[AIAnalysisQueue] {added} análisis aplazados por cuota agotada.")
+        return added
+
+    def get_pending(self, limit: int = 200) -> List[Dict[str, Any]]:
+        """Entradas pendientes, las más antiguas primero, con el mismo formato que `enqueue` más "queue_id"."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, scan_id, host_id, service_id, port_info_json FROM ai_analysis_queue "
+                "WHERE status = 'pending' ORDER BY created_at LIMIT ?",
+                (limit,)
+            )
+            return [
+                {"queue_id": row[0], "scan_id": row[1], "host_id": row[2], "service_id": row[3], "port_info": json.loads(row[4])}
+                for row in cursor.fetchall()
+            ]
+
+    def _update(self, queue_ids: List[int], status: str, error: Optional[str] = None, count_attempt: bool = False):
+        if not queue_ids:
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"UPDATE ai_analysis_queue SET status = ?, last_error = ?, updated_at = ?"
+                f"{', attempts = attempts + 1' if count_attempt else ''} WHERE id = ?",
+                [(status, error, time.time(), queue_id) for queue_id in queue_ids]
+            )
+            conn.commit()
+
+    def mark_done(self, queue_ids: List[int]):
+        self._update(queue_ids, 'done')
+
+    def mark_failed(self, queue_ids: List[int], error: str):
+        self._update(queue_ids, 'failed', error, count_attempt=True)
+
+    def mark_deferred(self, queue_ids: List[int], error: str):
+        """La cuota volvió a agotarse: las entradas siguen pendientes para el próximo intento."""
+        self._update(queue_ids, 'pending', error, count_attempt=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Número de entradas por estado."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM ai_analysis_queue GROUP BY status")
+            stats = {"pending": 0, "done": 0, "failed": 0}
+            stats.update(dict(cursor.fetchall()))
+            return stats
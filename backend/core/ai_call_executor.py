@@ -0,0 +1,160 @@
+# src/core/ai_call_executor.py
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+from utils.rate_limiter import SlidingWindowLimiter
+from core.llm_metrics import llm_call_context
+from core.model_call_guard import ModelDeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Errores de google.api_core por nombre, para no depender del paquete al clasificar
+QUOTA_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests"}
+TRANSIENT_ERROR_NAMES = {"ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "BadGateway", "Aborted"}
+
+
+class AICallError(Exception):
+    """Llamada al modelo fallida de forma definitiva (error no recuperable o reintentos agotados)."""
+
+
+class AIQuotaExhaustedError(AICallError):
+    """La cuota del modelo sigue agotada tras los reintentos: el trabajo debe aplazarse."""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Retorna 'quota' (429), 'transient' (5xx, timeouts), 'deadline' (plazo de ModelCallGuard vencido) o 'fatal'.
+    Los 'deadline' no se reintentan: la llamada abandonada sigue en curso y un reintento se sumaría a ella.
+    """
+    if isinstance(error, ModelDeadlineExceeded):
+        return 'deadline'
+    code = getattr(error, 'code', None)
+    code = code if isinstance(code, int) else None
+    name = type(error).__name__
+    if code == 429 or name in QUOTA_ERROR_NAMES or '429' in str(error)[:200]:
+        return 'quota'
+    if (code is not None and 500 <= code < 600) or name in TRANSIENT_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError)):
+        return 'transient'
+    return 'fatal'
+
+
+class AICallExecutor:
+    """
+    Ejecutor acotado para llamadas al modelo: un número máximo de llamadas simultáneas y límites
+    compartidos de peticiones y tokens por minuto (ventana deslizante), de modo que varios hilos
+    pueden agotar la cuota sin superarla. Los 429 y 5xx se reintentan con espera exponencial
+    con jitter; un 429 además pausa a todos los hilos.
+    """
+    def __init__(self, max_workers: int = 4, requests_per_minute: Optional[int] = 15,
+                 tokens_per_minute: Optional[int] = None, max_retries: int = 4,
+                 backoff_base_seconds: float = 2.0, backoff_max_seconds: float = 60.0):
+        """
+        :param max_workers: Llamadas simultáneas como máximo.
+        :param requests_per_minute: Cuota RPM del modelo (None = sin límite).
+        :param tokens_per_minute: Cuota TPM del modelo (None = sin límite).
+        :param max_retries: Reintentos por llamada ante 429/5xx.
+        """
+        self.max_workers = max(1, max_workers)
+        self.request_limiter = SlidingWindowLimiter(requests_per_minute, 60) if requests_per_minute else None
+        self.token_limiter = SlidingWindowLimiter(tokens_per_minute, 60) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-call")
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"calls": 0, "succeeded": 0, "retries": 0, "quota_errors": 0, "transient_errors": 0,
+                         "deadline_errors": 0, "failed": 0, "throttle_wait_seconds": 0.0}
+
+    def _count(self, key: str, amount: float = 1):
+        with self._metrics_lock:
+            self._metrics[key] += amount
+
+    def _wait_for_quota(self, estimated_tokens: int):
+        start = time.monotonic()
+        if self.request_limiter:
+            self.request_limiter.acquire()
+        if self.token_limiter and estimated_tokens:
+            self.token_limiter.acquire(estimated_tokens)
+        self._count("throttle_wait_seconds", time.monotonic() - start)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: evita que todos los hilos reintenten a la vez
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt)))
+
+    def call(self, fn: Callable[..., Any], *args, estimated_tokens: int = 0, **kwargs) -> Any:
+        """
+        Ejecuta `fn(*args, **kwargs)` en el hilo actual respetando las cuotas y reintentando 429/5xx
+        (no los plazos vencidos de ModelCallGuard).
+        Lanza AIQuotaExhaustedError si la cuota sigue agotada al final y AICallError en otros fallos.
+        """
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_quota(estimated_tokens)
+            try:
+                with llm_call_context(attempt=attempt):
+                    result = fn(*args, **kwargs)
+                self._count("succeeded")
+                return result
+            except Exception as e:
+                kind = classify_error(e)
+                if kind in ('fatal', 'deadline'):
+                    if kind == 'deadline':
+                        self._count("deadline_errors")
+                    self._count("failed")
+                    raise AICallError(str(e)) from e
+                self._count("quota_errors" if kind == 'quota' else "transient_errors")
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    if kind == 'quota':
+                        raise AIQuotaExhaustedError(str(e)) from e
+                    raise AICallError(str(e)) from e
+                delay = self._backoff(attempt)
+                if kind == 'quota' and self.request_limiter:
+                    # El servidor ya ha dicho que no: nadie debe volver a intentarlo hasta que pase la espera
+                    self.request_limiter.penalize(delay)
+                self._count("retries")
+                logger.warning(f"[AICallExecutor] Error {kind} ({type(e).__name__}); reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s.")
+                time.sleep(delay)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Ejecuta `fn` en el pool acotado. `fn` puede usar `call` para sus llamadas al modelo.
+        Se ejecuta con una copia del contexto actual, para conservar las etiquetas de métricas (llm_call_context).
+        """
+        return self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["throttle_wait_seconds"] = round(metrics["throttle_wait_seconds"], 2)
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+if __name__ == '__main__':
+    # Demostración: 30 llamadas simuladas con 120 RPM, 8 hilos y un 429 ocasional
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    class ResourceExhausted(Exception):
+        code = 429
+
+    def fake_model_call(index: int) -> int:
+        time.sleep(0.05)
+        if index % 10 == 3 and random.random() < 0.7:
+            raise ResourceExhausted("429 Quota exceeded")
+        return index
+
+    executor = AICallExecutor(max_workers=8, requests_per_minute=120, max_retries=3, backoff_base_seconds=0.2, backoff_max_seconds=1)
+    demo_start = time.time()
+    futures = [executor.submit(executor.call, fake_model_call, i) for i in range(30)]
+    completed = sum(1 for f in futures if f.exception() is None)
+    print(f"{completed}/30 llamadas completadas en {time.time() - demo_start:.1f}s (cuota: 120 peticiones/min)")
+    print(executor.get_metrics())
+    executor.shutdown()
@@ -0,0 +1,128 @@
+# src/core/analysis_cache.py
+"""
+Caché persistente de análisis de la IA.
+
+Invalidar entradas (desde backend/):
+    python -m core.analysis_cache invalidate                      # todo
+    python -m core.analysis_cache invalidate --namespace service_banner
+    python -m core.analysis_cache invalidate --older-than-hours 24
+    python -m core.analysis_cache stats
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """
+    Guarda respuestas ya analizadas por la IA, agrupadas por namespace (tipo de análisis) y una clave
+    derivada de las entradas normalizadas. Si otra petición tiene las mismas entradas (ej. 300 hosts con
+    el mismo banner de OpenSSH), se reutiliza el resultado en lugar de volver a llamar a Gemini.
+    """
+    def __init__(self, db_name: str = 'analysis_cache.db', ttl_hours: float = 720):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self.ttl_seconds = ttl_hours * 3600
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    namespace TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    value_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, cache_key)
+                )
+            """)
+            conn.commit()
+
+    @staticmethod
+    def make_key(*parts: Optional[str]) -> str:
+        """
+        Clave estable a partir de las entradas del análisis: minúsculas, espacios colapsados y
+        None como cadena vacía, para que variaciones triviales compartan la misma entrada.
+        """
+        normalized = [re.sub(r"\s+", " ", str(part or "")).strip().lower() for part in parts]
+        return hashlib.sha256("\x1f".join(normalized).encode('utf-8')).hexdigest()
+
+    def get(self, namespace: str, cache_key: str) -> Optional[Any]:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT value_json FROM analysis_cache WHERE namespace = ? AND cache_key = ? AND created_at >= ?",
+                (namespace, cache_key, time.time() - self.ttl_seconds)
+            )
+            row = cursor.fetchone()
+            return json.loads(row[0]) if row else None
+
+    def store(self, namespace: str, cache_key: str, value: Any):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (namespace, cache_key, value_json, created_at) VALUES (?, ?, ?, ?)",
+                    (namespace, cache_key, json.dumps(value), time.time())
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            # Un fallo de la caché no debe interrumpir el análisis
+            logger.error(f"[AnalysisCache] Error al guardar la entrada {namespace}/{cache_key[:12]}: {e}")
+
+    def invalidate(self, namespace: Optional[str] = None, older_than_hours: Optional[float] = None) -> int:
+        """Borra entradas (todas, las de un namespace y/o las más antiguas que N horas). Retorna cuántas."""
+        conditions, params = [], []
+        if namespace:
+            conditions.append("namespace = ?")
+            params.append(namespace)
+        if older_than_hours is not None:
+            conditions.append("created_at < ?")
+            params.append(time.time() - older_than_hours * 3600)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM analysis_cache{where}", params)
+            conn.commit()
+            deleted = cursor.rowcount
+        logger.info(f"[AnalysisCache] {deleted} entradas invalidadas (namespace={namespace}, older_than_hours={older_than_hours}).")
+        return deleted
+
+    def get_stats(self) -> Dict[str, int]:
+        """Número de entradas por namespace."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT namespace, COUNT(*) FROM analysis_cache GROUP BY namespace")
+            return dict(cursor.fetchall())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gestión de la caché de análisis de la IA.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    invalidate_parser = subparsers.add_parser("invalidate", help="Borrar entradas de la caché.")
+    invalidate_parser.add_argument("--namespace", help="Solo este tipo de análisis (ej. service_banner).")
+    invalidate_parser.add_argument("--older-than-hours", type=float, help="Solo entradas más antiguas que N horas.")
+    subparsers.add_parser("stats", help="Mostrar entradas por namespace.")
+    args = parser.parse_args(argv)
+
+    cache = AnalysisCache()
+    if args.command == "invalidate":
+        print(f"{cache.invalidate(args.namespace, args.older_than_hours)} entradas eliminadas.")
+    else:
+        print(cache.get_stats())
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# src/core/chat_history_manager.py
+import json
+import logging
+import re
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from core.context_encoder import summarize_encoded_output
+
+logger = logging.getLogger(__name__)
+
+# Cabecera con la que ModelContextProtocol inyecta los resultados de herramientas en el chat
+TOOL_RESULTS_HEADER = "Aquí están los resultados de la acción solicitada:"
+SUMMARY_HEADER = "[Resumen de la conversación anterior]"
+SUMMARY_ACK = "Entendido. Tendré en cuenta este resumen; si necesito datos completos de un escaneo los pediré con get_scan_results."
+COMPACTED_TOOL_HEADER = "[Resultados de herramienta compactados]"
+
+# Campos que identifican un resultado de herramienta y sobreviven a la compactación
+IDENTITY_KEYS = ("action_completed", "action", "status", "scan_id", "target", "session_name", "hosts_found_count", "error")
+
+# Turno: {"role": "user" | "model", "parts": [str | dict ({"function_call": ...} / {"function_response": ...}) | parte no textual]}
+Turn = Dict[str, Any]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación aproximada (~4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+def summarize_tool_payload(text: str) -> str:
+    """
+    Resumen compacto de un mensaje de resultados de herramienta: solo los campos que identifican
+    la acción y sus totales. El detalle sigue en DataManager y se recupera con get_scan_results.
+    """
+    match = re.search(r"```json\s*(.*?)\s*```", text, re.S)
+    if not match:
+        # Salida codificada con ToolOutputEncoder (formato por líneas)
+        block = re.search(r"```\s*(.*?)\s*```", text, re.S)
+        summary = summarize_encoded_output(block.group(1) if block else text, IDENTITY_KEYS)
+        if not summary:
+            return f"{COMPACTED_TOOL_HEADER} {text[:300]}…"
+        refetch = f" Datos completos: get_scan_results con scan_id={summary['scan_id']}." if summary.get('scan_id') else ""
+        return f"{COMPACTED_TOOL_HEADER} {json.dumps(summary, ensure_ascii=False)}{refetch}"
+    try:
+        payload = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        payload = None
+    if not isinstance(payload, dict):
+        return f"{COMPACTED_TOOL_HEADER} {text[:300]}…"
+
+    summary: Dict[str, Any] = {}
+    for key in IDENTITY_KEYS:
+        if payload.get(key) not in (None, "", [], {}):
+            summary[key] = payload[key]
+    for key, value in payload.items():
+        if isinstance(value, list) and key not in summary:
+            summary[f"{key}_count"] = len(value)
+    cves = payload.get('parsed_data_summary', {}).get('cves_found_by_service') if isinstance(payload.get('parsed_data_summary'), dict) else None
+    if isinstance(cves, dict):
+        summary["services_with_cves"] = len(cves)
+        summary["cves_count"] = sum(len(v) for v in cves.values() if isinstance(v, list))
+    refetch = f" Datos completos: get_scan_results con scan_id={payload['scan_id']}." if payload.get('scan_id') else ""
+    return f"{COMPACTED_TOOL_HEADER} {json.dumps(summary, ensure_ascii=False)}{refetch}"
+
+
+class ChatHistoryManager:
+    """
+    Mantiene el historial de un chat por debajo de un presupuesto de tokens estimados.
+    Si se supera el presupuesto:
+      1. Los resultados de herramientas que el modelo ya ha respondido (seguidos de un turno del modelo)
+         se sustituyen por un resumen compacto; los datos completos se vuelven a pedir a DataManager con get_scan_results.
+      2. Los textos muy largos fuera de los últimos `keep_recent_turns` turnos se recortan.
+      3. Si aún no basta, los turnos más antiguos se pliegan en un único turno de resumen acumulado,
+         hasta bajar a `target_ratio` del presupuesto (margen para no compactar en cada turno).
+    """
+    def __init__(self, token_budget: int = 32000, keep_recent_turns: int = 6, max_old_turn_chars: int = 2000,
+                 max_summary_chars: int = 6000, target_ratio: float = 0.7,
+                 summarizer: Optional[Callable[[str], str]] = None):
+        """
+        :param summarizer: Función opcional (texto -> resumen) para el pliegue de turnos, ej. una llamada
+                           sin estado al modelo. Sin ella (o si falla) se usa un resumen extractivo.
+        """
+        self.token_budget = token_budget
+        self.keep_recent_turns = max(2, keep_recent_turns)
+        self.max_old_turn_chars = max_old_turn_chars
+        self.max_summary_chars = max_summary_chars
+        self.target_ratio = target_ratio
+        self.summarizer = summarizer
+        self.last_stats: Dict[str, int] = {}
+
+    @staticmethod
+    def turn_tokens(turn: Turn) -> int:
+        return sum(
+            estimate_tokens(part if isinstance(part, str) else json.dumps(part, ensure_ascii=False, default=str) if isinstance(part, dict) else str(part))
+            for part in turn.get('parts', [])
+        )
+
+    @staticmethod
+    def _starts_exchange(turn: Turn) -> bool:
+        # Un turno de usuario que responde a una llamada a función no puede separarse de esa llamada
+        return turn.get('role') == 'user' and not any(isinstance(part, dict) and 'function_response' in part for part in turn.get('parts', []))
+
+    def _compact_part(self, part: Any, compact_tool_payload: bool, truncate: bool) -> Any:
+        if isinstance(part, str):
+            return self._compact_text(part, compact_tool_payload, truncate)
+        function_response = part.get('function_response') if isinstance(part, dict) else None
+        if compact_tool_payload and function_response and isinstance((function_response.get('response') or {}).get('resultado'), str):
+            # Solo se sustituye el resultado: la respuesta debe seguir emparejada con su llamada
+            response = dict(function_response['response'])
+            response['resultado'] = summarize_tool_payload(f"{TOOL_RESULTS_HEADER}\n```\n{response['resultado']}\n```")
+            response.pop('instrucciones', None)
+            return {**part, "function_response": {**function_response, "response": response}}
+        return part
+
+    def history_tokens(self, history: List[Turn]) -> int:
+        return sum(self.turn_tokens(turn) for turn in history)
+
+    def _compact_text(self, text: str, compact_tool_payload: bool, truncate: bool) -> str:
+        if text.startswith(TOOL_RESULTS_HEADER):
+            return summarize_tool_payload(text) if compact_tool_payload else text
+        if truncate and len(text) > self.max_old_turn_chars and not text.startswith(SUMMARY_HEADER):
+            return text[:self.max_old_turn_chars] + " … [recortado]"
+        return text
+
+    def _extractive_summary(self, turns: List[Turn]) -> str:
+        lines = []
+        for turn in turns:
+            speaker = "Usuario" if turn.get('role') == 'user' else "Molly"
+            for part in turn.get('parts', []):
+                if isinstance(part, dict) and 'function_call' in part:
+                    call = part['function_call']
+                    lines.append(f"- Molly ejecutó {call.get('name')}({json.dumps(call.get('args') or {}, ensure_ascii=False)})")
+                    continue
+                if not isinstance(part, str) or not part.strip():
+                    continue
+                if part.startswith(SUMMARY_HEADER):
+                    lines.append(part[len(SUMMARY_HEADER):].strip())
+                elif part == SUMMARY_ACK:
+                    continue
+                else:
+                    lines.append(f"- {speaker}: {' '.join(part.split())[:240]}")
+        return "\n".join(lines)
+
+    def _build_summary(self, turns: List[Turn]) -> str:
+        extractive = self._extractive_summary(turns)
+        text = extractive
+        if self.summarizer:
+            try:
+                text = self.summarizer(extractive) or extractive
+            except Exception as e:
+                logger.warning(f"[ChatHistoryManager] Resumen con el modelo fallido, se usa el extractivo: {e}")
+        # Se conserva lo más reciente si el resumen acumulado crece demasiado
+        if len(text) > self.max_summary_chars:
+            text = "…\n" + text[-self.max_summary_chars:]
+        return f"{SUMMARY_HEADER}\n{text}"
+
+    def compact(self, history: List[Turn]) -> Tuple[List[Turn], bool]:
+        """Retorna (historial, cambiado). Si el historial cabe en el presupuesto se devuelve tal cual."""
+        tokens_before = self.history_tokens(history)
+        if tokens_before <= self.token_budget:
+            return history, False
+
+        recent_start = max(0, len(history) - self.keep_recent_turns)
+        # Un resultado de herramienta sin respuesta del modelo todavía se necesita completo
+        answered_end = len(history) - 1 if history and history[-1].get('role') == 'user' else len(history)
+        compacted = [
+            {"role": turn['role'], "parts": [
+                self._compact_part(p, compact_tool_payload=index < answered_end, truncate=index < recent_start)
+                for p in turn['parts']
+            ]}
+            if index < answered_end else turn
+            for index, turn in enumerate(history)
+        ]
+
+        folded = 0
+        target = self.token_budget * self.target_ratio
+        if self.history_tokens(compacted) > target:
+            # Se pliegan turnos antiguos hasta bajar del objetivo; el corte cae antes de un turno de usuario
+            # (que no sea una respuesta de función) para que el historial restante siga alternando
+            # usuario/modelo tras el resumen y ninguna llamada a función quede sin su respuesta
+            cut = 0
+            remaining = self.history_tokens(compacted)
+            while cut < recent_start and remaining > target:
+                remaining -= self.turn_tokens(compacted[cut])
+                cut += 1
+            while cut < recent_start and not self._starts_exchange(compacted[cut]):
+                cut += 1
+            while cut > 0 and cut < len(compacted) and not self._starts_exchange(compacted[cut]):
+                cut -= 1
+            if cut > 0:
+                folded = cut
+                summary_turns = [
+                    {"role": "user", "parts": [self._build_summary(compacted[:cut])]},
+                    {"role": "model", "parts": [SUMMARY_ACK]}
+                ]
+                compacted = summary_turns + compacted[cut:]
+
+        tokens_after = self.history_tokens(compacted)
+        if tokens_after == tokens_before:
+            return history, False
+        self.last_stats = {"tokens_before": tokens_before, "tokens_after": tokens_after, "turns_folded": folded}
+        logger.info(f"[ChatHistoryManager] Historial compactado: {tokens_before} -> {tokens_after} tokens estimados "
+                    f"({folded} turnos plegados en el resumen).")
+        return compacted, True
+
+
+if __name__ == '__main__':
+    # Demostración: 3 escaneos con salida grande seguidos de preguntas; el tamaño por turno se mantiene estable
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    manager = ChatHistoryManager(token_budget=4000, keep_recent_turns=4)
+    demo_history: List[Turn] = []
+    for scan_number in range(1, 4):
+        tool_output = {"action_completed": "start_network_scan", "scan_id": scan_number, "target": f"10.0.{scan_number}.0/24",
+                       "hosts_found_count": 40, "nmap_raw_output": "PORT STATE SERVICE\n" * 800,
+                       "vulnerabilities_found": [{"vulnerability": "x"}] * 25}
+        demo_history += [
+            {"role": "user", "parts": [f"Escanea 10.0.{scan_number}.0/24"]},
+            {"role": "model", "parts": ['```json\n{"action": "start_network_scan"}\n```']},
+            {"role": "user", "parts": [f"{TOOL_RESULTS_HEADER}\n```json\n{json.dumps(tool_output, indent=2)}\n```\n"]},
+            {"role": "model", "parts": [f"Resumen del escaneo {scan_number}: 40 hosts, 25 vulnerabilidades."]},
+        ]
+        demo_history, _ = manager.compact(demo_history)
+        print(f"Tras el escaneo {scan_number}: {manager.history_tokens(demo_history)} tokens, {len(demo_history)} turnos")
+    print(demo_history[0]['parts'][0][:400])
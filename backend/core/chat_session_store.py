@@ -0,0 +1,195 @@
+# src/core/chat_session_store.py
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fábrica de sesiones: historial a restaurar (o None) -> sesión de chat (ej. ModelContextProtocol.new_session)
+SessionFactory = Callable[[Optional[List[Dict[str, Any]]]], Any]
+
+
+class ChatSessionStore:
+    """
+    Almacén acotado de sesiones de chat en memoria, con desalojo LRU y por inactividad.
+    Al desalojar una sesión su historial se guarda comprimido en SQLite y se rehidrata de forma
+    perezosa la próxima vez que se pide, de modo que un usuario inactivo no ocupa memoria y el
+    historial sobrevive a los reinicios (al salir del proceso se guardan las sesiones activas).
+    Las sesiones deben exponer `export_history()` (ver ModelContextProtocol).
+    """
+    def __init__(self, factory: SessionFactory, max_sessions: int = 100, idle_timeout_seconds: int = 1800,
+                 max_persisted_age_days: Optional[int] = 30, db_name: str = 'chat_sessions.db'):
+        """
+        :param max_sessions: Sesiones en memoria como máximo; al superarlo se desaloja la usada hace más tiempo.
+        :param idle_timeout_seconds: Las sesiones sin uso durante este tiempo se desalojan (None = nunca).
+        :param max_persisted_age_days: Los historiales guardados más antiguos se descartan (None = nunca).
+        """
+        self.factory = factory
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.max_persisted_age_days = max_persisted_age_days
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self._create_tables()
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Sesiones desalojadas que alguien sigue usando (ej. un escaneo en curso): se reutilizan en
+        # lugar de rehidratar una copia que no tendría sus últimos turnos
+        self._detached: "weakref.WeakValueDictionary[str, Any]" = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+        self.stats = {"created": 0, "rehydrated": 0, "evicted_lru": 0, "evicted_idle": 0, "persisted": 0}
+        self._purge_expired()
+        atexit.register(self.flush)
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    history_blob BLOB NOT NULL,
+                    turns INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.commit()
+
+    def _purge_expired(self):
+        if not self.max_persisted_age_days:
+            return
+        cutoff = time.time() - self.max_persisted_age_days * 86400
+        with sqlite3.connect(self.db_path) as conn:
+            deleted = conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.commit()
+        if deleted:
+            logger.info(f"[ChatSessionStore] {deleted} historiales guardados caducados eliminados.")
+
+    def _persist(self, session_id: str, session: Any):
+        try:
+            history = session.export_history()
+        except Exception as e:
+            logger.error(f"[ChatSessionStore] No se pudo exportar el historial de {session_id}: {e}")
+            return
+        if not history:
+            return
+        blob = zlib.compress(json.dumps(history, ensure_ascii=False, separators=(",", ":")).encode('utf-8'))
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, history_blob, turns, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, blob, len(history), time.time())
+            )
+            conn.commit()
+        self.stats["persisted"] += 1
+        logger.debug(f"[ChatSessionStore] Historial de {session_id} guardado ({len(history)} turnos, {len(blob)} bytes).")
+
+    def _load(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT history_blob FROM chat_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        except (zlib.error, ValueError) as e:
+            logger.warning(f"[ChatSessionStore] Historial guardado de {session_id} ilegible, se descarta: {e}")
+            return None
+
+    def _delete_persisted(self, session_id: str):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+            conn.commit()
+
+    def _evict(self, session_id: str, reason: str):
+        session = self._sessions.pop(session_id)
+        self._last_used.pop(session_id, None)
+        self._persist(session_id, session)
+        self._detached[session_id] = session
+        self.stats[f"evicted_{reason}"] += 1
+        logger.info(f"[ChatSessionStore] Sesión {session_id} desalojada ({reason}); historial guardado.")
+
+    def evict_idle(self) -> int:
+        """Desaloja las sesiones inactivas. Se llama en cada `get`; retorna cuántas se desalojaron."""
+        if not self.idle_timeout_seconds:
+            return 0
+        cutoff = time.monotonic() - self.idle_timeout_seconds
+        with self._lock:
+            # El OrderedDict está en orden de uso: las inactivas están al principio
+            idle = []
+            for session_id in self._sessions:
+                if self._last_used[session_id] >= cutoff:
+                    break
+                idle.append(session_id)
+            for session_id in idle:
+                self._evict(session_id, "idle")
+        return len(idle)
+
+    def get(self, session_id: str) -> Any:
+        """Retorna la sesión en memoria, la rehidratada desde SQLite o una nueva."""
+        with self._lock:
+            self.evict_idle()
+            session = self._sessions.get(session_id) or self._detached.pop(session_id, None)
+            if session is None:
+                history = self._load(session_id)
+                session = self.factory(history)
+                self.stats["rehydrated" if history else "created"] += 1
+                if history:
+                    logger.info(f"[ChatSessionStore] Sesión {session_id} rehidratada con {len(history)} turnos.")
+            if session_id not in self._sessions:
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._evict(next(iter(self._sessions)), "lru")
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = time.monotonic()
+            return session
+
+    def reset(self, session_id: str) -> Any:
+        """Descarta la sesión (en memoria y guardada) y crea una nueva con el historial vacío."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._detached.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+            self._delete_persisted(session_id)
+        return self.get(session_id)
+
+    def flush(self):
+        """Guarda el historial de todas las sesiones en memoria sin desalojarlas."""
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                self._persist(session_id, session)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with sqlite3.connect(self.db_path) as conn:
+            persisted, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(history_blob)), 0) FROM chat_sessions").fetchone()
+        with self._lock:
+            return {"in_memory": len(self._sessions), "persisted": persisted, "persisted_bytes": size, **self.stats}
+
+
+if __name__ == '__main__':
+    # Demostración con sesiones simuladas: 5 usuarios, máximo 2 en memoria
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    class DemoSession:
+        def __init__(self, history):
+            self.history = list(history or [])
+
+        def export_history(self):
+            return self.history
+
+    store = ChatSessionStore(DemoSession, max_sessions=2, idle_timeout_seconds=60, db_name='chat_sessions_demo.db')
+    for user in range(5):
+        store.get(f"chat-{user}").history.append({"role": "user", "parts": [{"text": f"Hola, soy el usuario {user}"}]})
+    print(f"Historial rehidratado de chat-0: {store.get('chat-0').history}")
+    print(store.get_stats())
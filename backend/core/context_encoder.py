@@ -0,0 +1,189 @@
+# src/core/context_encoder.py
+"""
+Codificación compacta de resultados de herramientas para inyectarlos en el contexto del modelo.
+
+Formato (una línea por dato, sangría de dos espacios por nivel):
+    action_completed: start_network_scan
+    hosts[2]{ip,ports}:
+      10.0.0.1|22,80
+      10.0.0.2|443
+    vulnerabilities_found[40]{impact,vulnerability,target_host}:
+      High|OpenSSH 7.2 ...|10.0.0.1
+      ... +15 más (usa get_scan_results con scan_id=3)
+Las listas de objetos homogéneos se escriben como tabla (cabecera con las columnas y una fila por
+elemento separada por '|'), las listas largas se ordenan por severidad y se recortan, y el total
+se limita a `max_chars` con un marcador explícito de que hay más datos disponibles.
+"""
+import json
+import logging
+import re
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Campos que no aportan al modelo o duplican otros (ej. la salida cruda de Nmap ya está parseada)
+DROP_FIELDS = {"nmap_raw_output", "ai_raw_response", "references", "ai_analysis_cache"}
+SEVERITY_FIELDS = ("cvss_score", "cvss_severity", "severity", "impact")
+SEVERITY_RANK = {"critical": 5, "critica": 5, "crítica": 5, "high": 4, "alta": 4, "medium": 3, "media": 3,
+                 "moderate": 3, "low": 2, "baja": 2, "informational": 1, "info": 1, "none": 0}
+MORE_MARKER = "... +{count} más"
+TRUNCATED_MARKER = "[... salida truncada: {count} caracteres más disponibles{refetch}]"
+
+
+def _severity_key(item: Any) -> float:
+    if not isinstance(item, dict):
+        return 0.0
+    for field in SEVERITY_FIELDS:
+        value = item.get(field)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                rank = SEVERITY_RANK.get(value.strip().lower())
+                if rank is not None:
+                    return rank * 2.0  # Escala comparable a CVSS (0-10)
+    return 0.0
+
+
+class ToolOutputEncoder:
+    def __init__(self, max_chars: int = 12000, max_list_items: int = 25, max_value_chars: int = 240):
+        """
+        :param max_chars: Tamaño máximo de la salida codificada.
+        :param max_list_items: Elementos que se muestran de cada lista antes de recortar (los más severos primero).
+        :param max_value_chars: Longitud máxima de cada valor de texto.
+        """
+        self.max_chars = max_chars
+        self.max_list_items = max_list_items
+        self.max_value_chars = max_value_chars
+        self.last_stats: Dict[str, int] = {}
+
+    def _scalar(self, value: Any) -> str:
+        if value is None:
+            return "-"
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (list, tuple)) and all(not isinstance(v, (dict, list)) for v in value):
+            return ",".join(self._scalar(v) for v in value)
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        text = " ".join(str(value).split()).replace("|", "/")
+        return text if len(text) <= self.max_value_chars else text[:self.max_value_chars] + "…"
+
+    @staticmethod
+    def _is_table(items: List[Any]) -> bool:
+        return bool(items) and all(isinstance(item, dict) for item in items)
+
+    def _encode_list(self, key: str, items: List[Any], indent: str, list_limit: int, refetch: str, lines: List[str]):
+        items = [{k: v for k, v in item.items() if k not in DROP_FIELDS} if isinstance(item, dict) else item for item in items]
+        if any(_severity_key(item) for item in items):
+            items = sorted(items, key=_severity_key, reverse=True)
+        shown, hidden = items[:list_limit], len(items) - min(len(items), list_limit)
+
+        if self._is_table(shown):
+            columns: List[str] = []
+            for item in shown:
+                columns.extend(column for column in item if column not in columns)
+            lines.append(f"{indent}{key}[{len(items)}]{{{','.join(columns)}}}:")
+            for item in shown:
+                lines.append(f"{indent}  " + "|".join(self._scalar(item.get(column)) for column in columns))
+        elif all(not isinstance(item, (dict, list)) for item in shown):
+            lines.append(f"{indent}{key}[{len(items)}]: {self._scalar(shown)}")
+        else:
+            lines.append(f"{indent}{key}[{len(items)}]:")
+            for item in shown:
+                self._encode_value("-", item, indent + "  ", list_limit, refetch, lines)
+        if hidden:
+            lines.append(f"{indent}  {MORE_MARKER.format(count=hidden)}{refetch}")
+
+    def _encode_value(self, key: str, value: Any, indent: str, list_limit: int, refetch: str, lines: List[str]):
+        if isinstance(value, dict):
+            lines.append(f"{indent}{key}:")
+            for child_key, child_value in value.items():
+                if child_key not in DROP_FIELDS and child_value not in (None, "", [], {}):
+                    self._encode_value(child_key, child_value, indent + "  ", list_limit, refetch, lines)
+        elif isinstance(value, list):
+            self._encode_list(key, value, indent, list_limit, refetch, lines)
+        else:
+            lines.append(f"{indent}{key}: {self._scalar(value)}")
+
+    def _encode_with_limit(self, tool_output: Dict[str, Any], list_limit: int, refetch: str) -> str:
+        lines: List[str] = []
+        for key, value in tool_output.items():
+            if key not in DROP_FIELDS and value not in (None, "", [], {}):
+                self._encode_value(key, value, "", list_limit, refetch, lines)
+        return "\n".join(lines)
+
+    def encode(self, tool_output: Dict[str, Any]) -> str:
+        """Retorna la codificación compacta; el tamaño antes/después queda en `last_stats`."""
+        original_size = len(json.dumps(tool_output, indent=2, ensure_ascii=False, default=str))
+        scan_id = tool_output.get('scan_id') or (tool_output.get('scan_details') or {}).get('id')
+        refetch = f" (usa get_scan_results con scan_id={scan_id})" if scan_id else ""
+
+        # Si no cabe, se reducen los elementos por lista antes de recurrir al recorte duro
+        list_limit = self.max_list_items
+        encoded = self._encode_with_limit(tool_output, list_limit, refetch)
+        while len(encoded) > self.max_chars and list_limit > 3:
+            list_limit = max(3, list_limit // 2)
+            encoded = self._encode_with_limit(tool_output, list_limit, refetch)
+        if len(encoded) > self.max_chars:
+            # Se reserva sitio para el marcador y se corta en un final de línea
+            kept = encoded[:self.max_chars - len(TRUNCATED_MARKER) - len(refetch) - 12].rsplit("\n", 1)[0]
+            encoded = kept + "\n" + TRUNCATED_MARKER.format(count=len(encoded) - len(kept), refetch=refetch)
+
+        self.last_stats = {
+            "chars_before": original_size,
+            "chars_after": len(encoded),
+            "tokens_before": original_size // 4 + 1,
+            "tokens_after": len(encoded) // 4 + 1,
+        }
+        saved = 1 - len(encoded) / original_size if original_size else 0
+        logger.info(f"[ToolOutputEncoder] {original_size} -> {len(encoded)} caracteres ({saved:.0%} menos, límite por lista {list_limit}).")
+        return encoded
+
+
+def summarize_encoded_output(encoded: str, identity_keys: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Extrae de una salida codificada los campos escalares de primer nivel indicados y el tamaño de
+    las listas de primer nivel (ej. {"scan_id": "3", "hosts_count": 2}). Lo usa la compactación del historial.
+    """
+    summary: Dict[str, Any] = {}
+    for line in encoded.splitlines():
+        if not line or line.startswith(" "):
+            continue
+        list_header = re.match(r"^(\w+)\[(\d+)\]", line)
+        if list_header:
+            summary[f"{list_header.group(1)}_count"] = int(list_header.group(2))
+            continue
+        key, _, value = line.partition(": ")
+        if key in identity_keys and value.strip():
+            summary[key] = value.strip()
+    return summary
+
+
+if __name__ == '__main__':
+    # Demostración con una salida de escaneo sintética de 60 hosts
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    demo_output = {
+        "action_completed": "start_network_scan",
+        "target": "10.0.0.0/24",
+        "scan_id": 7,
+        "hosts_found_count": 60,
+        "nmap_raw_output": "Nmap scan report for 10.0.0.1\nPORT   STATE SERVICE VERSION\n22/tcp open  ssh OpenSSH 7.2\n" * 60,
+        "parsed_data_summary": {
+            "hosts": [{"ip": f"10.0.0.{i}", "ports": [22, 80, 443]} for i in range(1, 61)],
+            "cves_found_by_service": {
+                "ssh OpenSSH 7.2": [{"cve_id": f"CVE-2016-{i:04d}", "description": "Descripción larga " * 20, "cvss_score": (i % 10) + 0.5,
+                                     "cvss_severity": "HIGH", "references": ["https://nvd.nist.gov/"] * 5} for i in range(40)]
+            }
+        },
+        "vulnerabilities_found": [{"vulnerability": f"Hallazgo {i}", "impact": ["Low", "High", "Critical"][i % 3],
+                                   "recommendation": "Actualizar", "target_host": f"10.0.0.{i}", "target_service": "ssh:22"} for i in range(60)]
+    }
+    encoder = ToolOutputEncoder(max_chars=6000)
+    encoded_demo = encoder.encode(demo_output)
+    print(encoded_demo[:1500])
+    print("...")
+    print(encoder.last_stats)
+    print(summarize_encoded_output(encoded_demo, ("action_completed", "scan_id", "target")))
@@ -2,118 +2,448 @@
 
 import json
 import logging
-import google.generativeai as genai
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional
 
 # Importar SYSTEM_PROMPT y TOOLS desde prompts.py
 from utils.prompts import SYSTEM_PROMPT, TOOLS
+from core.chat_history_manager import ChatHistoryManager, TOOL_RESULTS_HEADER
+from core.context_encoder import ToolOutputEncoder
+from core.ai_call_executor import classify_error
+from core.llm_metrics import LLMMetricsStore, usage_from_response
+from core.model_backends import ModelBackend, GeminiBackend
+from core.model_call_guard import ModelCallGuard
 
 class ModelContextProtocol:
-    def __init__(self, api_key: str, model_name: str = 'models/gemini-1.5-flash-latest'):
-        if not api_key:
-            raise ValueError("La clave de API de Gemini no puede estar vacía.")
-        
-        self.api_key = api_key 
-        
-        genai.configure(api_key=self.api_key)
-        
-        self.model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=SYSTEM_PROMPT, 
-            tools=TOOLS 
-        )
+    def __init__(self, api_key: str, model_name: str = 'models/gemini-1.5-flash-latest',
+                 history_token_budget: int = 32000, history_keep_recent_turns: int = 6,
+                 tool_output_max_chars: int = 12000, model: Optional[Any] = None,
+                 history: Optional[List[Dict[str, Any]]] = None, metrics: Optional[LLMMetricsStore] = None,
+                 backend: Optional[ModelBackend] = None, call_guard: Optional[ModelCallGuard] = None,
+                 hedge_model: Optional[Any] = None):
+        """
+        :param model: GenerativeModel ya configurado para compartir entre sesiones (ver `new_session`).
+                      Sin él se configura la API y se crea uno nuevo.
+        :param history: Historial inicial del chat (formato de `export_history`), ej. al rehidratar una sesión.
+        :param metrics: Registro de latencia, tokens y coste de cada llamada al modelo (None = sin registro).
+        :param backend: Backend del modelo (ver core/model_backends.py). Sin él se usa la API de Gemini,
+                        que exige `api_key`; con LocalStubBackend la clave puede estar vacía.
+        :param call_guard: Plazo y réplica de las llamadas (ver core/model_call_guard.py). None = sin plazo.
+        :param hedge_model: Modelo de réplica ya construido para compartir entre sesiones. Sin él, si
+                            `call_guard` define un modelo de réplica, se crea aquí.
+        """
+        self.api_key = api_key
+        self.backend = backend or GeminiBackend(api_key)
+
+        if model is None:
+            model = self.backend.create_model(
+                model_name=model_name,
+                system_instruction=SYSTEM_PROMPT,
+                tools=TOOLS
+            )
+        self.model = model
         self.model_name = model_name
+        self.call_guard = call_guard
+        if hedge_model is None and call_guard and call_guard.hedge_model_name:
+            hedge_model = self.backend.create_model(
+                model_name=call_guard.hedge_model_name,
+                system_instruction=SYSTEM_PROMPT,
+                tools=TOOLS
+            )
+        self.hedge_model = hedge_model
         
-        self.chat = self.model.start_chat(history=[])
+        self.chat = self.model.start_chat(history=history or [])
+        # Presupuesto de tokens del historial: los turnos antiguos y los resultados de herramientas se compactan
+        self.history_manager = ChatHistoryManager(token_budget=history_token_budget, keep_recent_turns=history_keep_recent_turns)
+        # Los resultados de herramientas se inyectan con una codificación compacta y con tamaño máximo
+        self.tool_output_encoder = ToolOutputEncoder(max_chars=tool_output_max_chars)
+        self.metrics = metrics
         self.logger = logging.getLogger(__name__)
-        self.logger.info(f"[MCP] Inicializado con modelo: {self.model_name}. Historial de chat iniciado con SYSTEM_PROMPT y TOOLS.")
+        self.logger.info(f"[MCP] Inicializado con modelo: {self.model_name} (backend {self.backend.name}). Historial de chat iniciado con SYSTEM_PROMPT y TOOLS"
+                         f"{f' ({len(history)} turnos restaurados)' if history else ''}.")
 
-    def ask_gemini(self, objective: str, input_type: str, input_data: str, response_requirements: str) -> str | Dict[str, Any]:
+    def new_session(self, history: Optional[List[Dict[str, Any]]] = None) -> 'ModelContextProtocol':
         """
-        Envía una consulta a Gemini. Las instrucciones estáticas (rol, herramientas)
-        ya están configuradas en el modelo. Este método solo construye el prompt
-        con el contexto dinámico de la interacción actual.
+        Crea una sesión de chat independiente que comparte este GenerativeModel y su configuración:
+        no vuelve a configurar el backend ni a construir el modelo, solo un ChatSession nuevo.
+        """
+        return ModelContextProtocol(
+            api_key=self.api_key,
+            model_name=self.model_name,
+            history_token_budget=self.history_manager.token_budget,
+            history_keep_recent_turns=self.history_manager.keep_recent_turns,
+            tool_output_max_chars=self.tool_output_encoder.max_chars,
+            model=self.model,
+            history=history,
+            metrics=self.metrics,
+            backend=self.backend,
+            call_guard=self.call_guard,
+            hedge_model=self.hedge_model
+        )
+
+    def export_history(self) -> List[Dict[str, Any]]:
+        """Historial del chat como dicts serializables a JSON, aptos para `history` al rehidratar."""
+        return [type(content).to_dict(content) for content in self.chat.history]
+
+    def _timed_call(self, method: str, fn: Callable[..., Any], *args, model_name: Optional[str] = None, **kwargs) -> Any:
+        """
+        Ejecuta una llamada al modelo y registra su duración, tokens y error en `self.metrics`.
+        Con stream=True la llamada retorna al empezar la respuesta: se registra al agotar los fragmentos.
+        `model_name` indica el modelo realmente usado si no es el de la sesión (ej. la réplica).
+        """
+        if self.metrics is None:
+            return fn(*args, **kwargs)
+        model_name = self.backend.model_id(model_name or self.model_name)
+        started_at, start = time.time(), time.monotonic()
+        try:
+            response = fn(*args, **kwargs)
+        except Exception as e:
+            self._record_call(method, model_name, started_at, start, error=e)
+            raise
+        if kwargs.get('stream'):
+            return self._timed_stream(method, model_name, response, started_at, start)
+        self._record_call(method, model_name, started_at, start, usage=usage_from_response(response))
+        return response
+
+    def _timed_stream(self, method: str, model_name: str, response: Iterable[Any], started_at: float, start: float) -> Iterator[Any]:
+        first_token_ms, last_chunk, error = None, None, None
+        try:
+            for chunk in response:
+                if first_token_ms is None:
+                    first_token_ms = (time.monotonic() - start) * 1000
+                last_chunk = chunk
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # El usage_metadata acumulado llega en el último fragmento
+            self._record_call(method, model_name, started_at, start, usage=usage_from_response(last_chunk) if last_chunk is not None else None,
+                              first_token_ms=first_token_ms, error=error)
+
+    def _record_call(self, method: str, model_name: str, started_at: float, start: float, usage: Optional[Dict[str, Optional[int]]] = None,
+                     first_token_ms: Optional[float] = None, error: Optional[Exception] = None):
+        self.metrics.record(
+            method=method, model=model_name, started_at=started_at, wall_ms=(time.monotonic() - start) * 1000,
+            usage=usage, first_token_ms=first_token_ms,
+            error_kind=classify_error(error) if error else None, error_type=type(error).__name__ if error else None
+        )
+
+    def _enforce_history_budget(self):
+        """
+        Compacta el historial del chat si supera el presupuesto de tokens, antes de cada envío.
+        El chat se recrea con el historial compactado (las partes no textuales se conservan tal cual).
         """
-        prompt_content = (
+        # Texto como str; llamadas y respuestas de funciones como dict (la compactación reduce también las respuestas)
+        history = [
+            {"role": content.role, "parts": [part.text if part.text else type(part).to_dict(part) for part in content.parts]}
+            for content in self.chat.history
+        ]
+        compacted, changed = self.history_manager.compact(history)
+        if changed:
+            self.chat = self.model.start_chat(history=compacted)
+        else:
+            self.logger.debug(f"[MCP] Historial: {len(history)} turnos, ~{self.history_manager.history_tokens(history)} tokens estimados.")
+
+    @staticmethod
+    def build_prompt(objective: str, input_type: str, input_data: str, response_requirements: str) -> str:
+        """Prompt con el contexto dinámico de una interacción (el rol y las herramientas ya están en el modelo)."""
+        return (
             f"**Objetivo actual de esta interacción:** {objective}\n"
             f"**Tipo de entrada:** {input_type}\n"
             f"**Petición del usuario:** {input_data}\n"
             f"**Requisitos de respuesta específicos:** {response_requirements}\n"
         )
 
+    @staticmethod
+    def parse_action_response(text_response: str) -> Optional[Dict[str, Any]]:
+        """Retorna la acción si la respuesta contiene un bloque ```json con una clave 'action'; si no, None."""
+        logger = logging.getLogger(__name__)
+        if '```json' not in text_response:
+            return None
         try:
-            self.logger.info(f"Enviando a Gemini (vía chat.send_message):\n---PROMPT INICIO---\n{prompt_content}\n---PROMPT FIN---")
-            
-            response = self.chat.send_message(prompt_content)
+            json_start = text_response.find('```json') + len('```json')
+            json_end = text_response.find('```', json_start)
+            json_str = text_response[json_start:json_end].strip()
+
+            parsed_json = json.loads(json_str)
+
+            if isinstance(parsed_json, dict) and 'action' in parsed_json:
+                logger.info(f"Gemini sugirió una acción parseable: {parsed_json}")
+                return parsed_json
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.warning(f"Gemini intentó devolver JSON pero el formato es inválido o hubo error al parsear: {e}. Tratando como texto normal.")
+        except Exception as e:
+            logger.error(f"Error inesperado al intentar parsear JSON de Gemini: {e}")
+        return None
+
+    @staticmethod
+    def _plain_value(value: Any) -> Any:
+        # Los argumentos llegan como Struct de protobuf: los números son float (3.0 -> 3)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, dict):
+            return {k: ModelContextProtocol._plain_value(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [ModelContextProtocol._plain_value(v) for v in value]
+        return value
+
+    @staticmethod
+    def _function_calls(parts: Iterable[Any]) -> List[Any]:
+        return [part.function_call for part in parts if getattr(part, 'function_call', None) and part.function_call.name]
+
+    @classmethod
+    def extract_function_call(cls, response: Any) -> Optional[Dict[str, Any]]:
+        """
+        Acción solicitada por el modelo mediante function calling nativo, con el mismo formato que
+        las acciones en JSON ({"action": ..., "parameters": {...}}), o None si respondió con texto.
+        """
+        calls = cls._function_calls(part for candidate in getattr(response, 'candidates', None) or [] for part in candidate.content.parts)
+        if not calls:
+            return None
+        function_call = calls[0]
+        arguments = type(function_call).to_dict(function_call).get('args') or {}
+        action = {"action": function_call.name, "parameters": cls._plain_value(arguments)}
+        logging.getLogger(__name__).info(f"Gemini solicitó la función: {action}")
+        return action
+
+    def _pending_function_calls(self) -> List[str]:
+        """Funciones que el modelo llamó en su último turno y que aún no tienen respuesta."""
+        if not self.chat.history or self.chat.history[-1].role != 'model':
+            return []
+        return [function_call.name for function_call in self._function_calls(self.chat.history[-1].parts)]
+
+    def record_local_action(self, user_query: str, action: str, parameters: Dict[str, Any]):
+        """
+        Registra en el historial una acción resuelta sin el modelo (ej. por el enrutador local de intenciones):
+        el mensaje del usuario y la llamada a función equivalente. Así los resultados se devuelven como
+        function_response y el modelo conserva el contexto de la conversación.
+        """
+        history = self.export_history()
+        history.append({"role": "user", "parts": [{"text": user_query}]})
+        history.append({"role": "model", "parts": [{"function_call": {"name": action, "args": parameters}}]})
+        self.chat = self.model.start_chat(history=history)
+
+    def record_function_result(self, response_text: Optional[str]):
+        """
+        Si la acción terminó sin devolver sus resultados al modelo (ej. un informe PDF o un error de parámetros),
+        cierra en el historial la llamada a función pendiente con el texto mostrado al usuario, sin llamar al modelo.
+        """
+        pending = self._pending_function_calls()
+        if not pending:
+            return
+        text = response_text or "Acción finalizada sin resultados."
+        history = self.export_history()
+        history.append({"role": "user", "parts": [
+            type(part).to_dict(part) for part in self._function_response_parts(pending, {"resultado": text})
+        ]})
+        history.append({"role": "model", "parts": [{"text": text}]})
+        self.chat = self.model.start_chat(history=history)
+
+    def _function_response_parts(self, names: List[str], result: Dict[str, Any]) -> List[Any]:
+        # La primera llamada recibe el resultado; si el modelo pidió varias a la vez, el resto no se ejecuta
+        return [
+            self.backend.function_response_part(
+                name,
+                result if index == 0 else {"estado": "no_ejecutada", "motivo": "Solo se ejecuta una acción por mensaje."}
+            )
+            for index, name in enumerate(names)
+        ]
+
+    def _send_message(self, content: Any, stream: bool = False) -> Any:
+        """
+        Envía `content` al chat. Con `call_guard` la llamada tiene plazo y, si tarda más de lo habitual,
+        se replica en el modelo de réplica: cada intento usa una copia del chat y se adopta la del que
+        responde primero, así un intento abandonado no altera el historial. Con streaming el plazo
+        cubre hasta el primer fragmento. Lanza ModelDeadlineExceeded si vence el plazo.
+        """
+        method = "chat_stream" if stream else "chat"
+        if self.call_guard is None:
+            return self._timed_call(method, self.chat.send_message, content, stream=stream)
+
+        history = list(self.chat.history)
+
+        def attempt(model: Any, model_name: str) -> Callable[[], Any]:
+            def call():
+                chat = model.start_chat(history=list(history))
+                response = self._timed_call(method, chat.send_message, content, stream=stream, model_name=model_name)
+                if not stream:
+                    return chat, response, None
+                chunks = iter(response)
+                return chat, next(chunks, None), chunks
+            return call
+
+        hedge = attempt(self.hedge_model, self.call_guard.hedge_model_name) if self.hedge_model is not None else None
+        (chat, first, chunks), hedged = self.call_guard.run(method, attempt(self.model, self.model_name), hedge)
+        if not stream:
+            self._adopt_chat(chat, hedged)
+            return first
+        return self._adopting_stream(chat, hedged, first, chunks)
+
+    def _adopting_stream(self, chat: Any, hedged: bool, first: Any, chunks: Iterator[Any]) -> Iterator[Any]:
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        finally:
+            # El turno se añade al historial al agotar los fragmentos
+            self._adopt_chat(chat, hedged)
+
+    def _adopt_chat(self, chat: Any, hedged: bool):
+        # El chat de la réplica se recrea sobre el modelo principal para los mensajes siguientes
+        self.chat = self.model.start_chat(history=list(chat.history)) if hedged else chat
+
+    def _send(self, message: str, function_result: Optional[Dict[str, Any]] = None, stream: bool = False) -> Any:
+        """
+        Envía un mensaje al chat. Si el último turno del modelo fue una llamada a función, la API exige
+        responderla antes de continuar: el mensaje se envía como su function_response, junto al resultado.
+        """
+        self._enforce_history_budget()
+        pending = self._pending_function_calls()
+        if pending:
+            result = dict(function_result) if function_result else {"estado": "sin_resultado"}
+            if message:
+                result["instrucciones"] = message
+            message = self._function_response_parts(pending, result)
+        return self._send_message(message, stream=stream)
+
+    def ask_gemini(self, objective: str, input_type: str, input_data: str, response_requirements: str) -> str | Dict[str, Any]:
+        """
+        Envía una consulta a Gemini. Las instrucciones estáticas (rol, herramientas)
+        ya están configuradas en el modelo. Este método solo construye el prompt
+        con el contexto dinámico de la interacción actual.
+        Una sola llamada devuelve la acción (llamada a función, dict) o la respuesta final (texto).
+        """
+        prompt_content = self.build_prompt(objective, input_type, input_data, response_requirements)
 
-            text_response = response.text.strip()
-            self.logger.info(f"Respuesta cruda de Gemini:\n{text_response}")
+        try:
+            self.logger.info(f"Enviando a Gemini (vía chat.send_message): {len(prompt_content)} caracteres.")
+            self.logger.debug(f"---PROMPT INICIO---\n{prompt_content}\n---PROMPT FIN---")
+            
+            response = self._send(prompt_content)
 
-            if '```json' in text_response and '```' in text_response:
-                try:
-                    json_start = text_response.find('```json') + len('```json')
-                    json_end = text_response.find('```', json_start)
-                    json_str = text_response[json_start:json_end].strip()
+            action = self.extract_function_call(response)
+            if action:
+                return action
 
-                    parsed_json = json.loads(json_str)
+            text_response = self._response_text(response).strip()
+            self.logger.debug(f"Respuesta cruda de Gemini:\n{text_response}")
 
-                    if isinstance(parsed_json, dict) and 'action' in parsed_json:
-                        self.logger.info(f"Gemini sugirió una acción parseable: {parsed_json}")
-                        return parsed_json
-                except (json.JSONDecodeError, ValueError) as e:
-                    self.logger.warning(f"Gemini intentó devolver JSON pero el formato es inválido o hubo error al parsear: {e}. Tratando como texto normal.")
-                except Exception as e:
-                    self.logger.error(f"Error inesperado al intentar parsear JSON de Gemini: {e}")
+            # Compatibilidad: acciones devueltas como bloque ```json en el texto
+            action = self.parse_action_response(text_response)
+            if action:
+                return action
 
-            self.logger.info(f"Gemini respondió con texto (o JSON no parseable/accionable): {text_response}")
+            self.logger.info(f"Gemini respondió con texto (o JSON no parseable/accionable): {len(text_response)} caracteres.")
             return text_response
 
         except Exception as e:
             self.logger.error(f"Error al llamar a Gemini API: {e}")
             return "Lo siento, no pude comunicarme con la IA en este momento. Por favor, inténtalo de nuevo más tarde."
 
-    def inject_tool_results_into_chat(self, tool_output: Dict[str, Any], user_follow_up_prompt: str = ""):
+    def ask_gemini_stream(self, objective: str, input_type: str, input_data: str, response_requirements: str) -> Iterator[str | Dict[str, Any]]:
+        """
+        Igual que `ask_gemini`, pero genera los fragmentos de texto a medida que el modelo los produce.
+        Si el modelo llama a una función se genera la acción (dict) en lugar de texto. El texto no se
+        interpreta: el llamador lo junta y puede usar `parse_action_response`.
+        Lanza la excepción de la API si la llamada falla.
+        """
+        prompt_content = self.build_prompt(objective, input_type, input_data, response_requirements)
+        self.logger.info(f"Enviando a Gemini (vía chat.send_message, streaming): {len(prompt_content)} caracteres.")
+        self.logger.debug(f"---PROMPT INICIO---\n{prompt_content}\n---PROMPT FIN---")
+
+        for chunk in self._send(prompt_content, stream=True):
+            action = self.extract_function_call(chunk)
+            if action:
+                yield action
+                continue
+            text = self._response_text(chunk)
+            if text:
+                yield text
+
+    @staticmethod
+    def _response_text(response: Any) -> str:
+        # Una respuesta o fragmento sin partes de texto (ej. una llamada a función) lanza ValueError al leer .text
+        try:
+            return response.text
+        except ValueError:
+            return ""
+
+    def generate_stateless(self, prompt: str, system_instruction: str = None, response_mime_type: str = None) -> str:
+        """
+        Llamada única a Gemini fuera del chat: no usa ni modifica el historial de la sesión
+        ni las herramientas configuradas. Pensada para análisis por lotes (ej. core/vulnerability_analyzer.py).
+        Lanza la excepción de la API si la llamada falla (o ModelDeadlineExceeded si vence el plazo de
+        `call_guard`), para que el llamador decida si reintentar.
+        """
+        generation_config = {"response_mime_type": response_mime_type} if response_mime_type else None
+        self.logger.debug(f"[MCP] Llamada sin estado a Gemini ({len(prompt)} caracteres).")
+
+        def attempt(model_name: str) -> Callable[[], Any]:
+            model = self.backend.create_model(model_name=model_name, system_instruction=system_instruction)
+            return lambda: self._timed_call("stateless", model.generate_content, prompt, generation_config=generation_config,
+                                            model_name=model_name)
+
+        if self.call_guard is None:
+            response = attempt(self.model_name)()
+        else:
+            hedge = attempt(self.call_guard.hedge_model_name) if self.call_guard.hedge_model_name else None
+            response, _ = self.call_guard.run("stateless", attempt(self.model_name), hedge)
+        return response.text.strip()
+
+    def inject_tool_results_into_chat(self, tool_output: Dict[str, Any], user_follow_up_prompt: str = "",
+                                      on_token: Optional[Callable[[str], None]] = None):
         """
         Inyecta los resultados de una herramienta ejecutada en el historial de chat de Gemini
         como un mensaje de usuario (representando la salida de la herramienta).
         Esto permite a Gemini "saber" qué ocurrió después de que sugirió una acción.
         El user_follow_up_prompt permite añadir una pregunta o instrucción adicional
         justo después de los resultados de la herramienta.
+        Con `on_token`, la respuesta al seguimiento se genera en streaming y cada fragmento se
+        entrega a `on_token` según llega; el texto completo se devuelve igualmente.
+        Retorna None si el modelo no responde (error o plazo vencido).
         """
         # Aseguramos que el tool_output sea un diccionario serializable a JSON.
         # Si tool_output no es un dict, lo convertimos para evitar errores de serialización.
         if not isinstance(tool_output, dict):
             tool_output = {"result": str(tool_output)} 
 
-        # Formateamos la salida de la herramienta como un bloque de código JSON
-        formatted_tool_output_message = f"Aquí están los resultados de la acción solicitada:\n```json\n{json.dumps(tool_output, indent=2)}\n```\n"
+        # Formateamos la salida de la herramienta con la codificación compacta (ver core/context_encoder.py)
+        encoded_tool_output = self.tool_output_encoder.encode(tool_output)
+        formatted_tool_output_message = f"{TOOL_RESULTS_HEADER}\n```\n{encoded_tool_output}\n```\n"
+        self.logger.info(f"[MCP] Resultados de herramienta codificados: {self.tool_output_encoder.last_stats}")
 
-        self.logger.info(f"[MCP] Inyectando resultados de herramienta como mensaje de usuario en el chat.")
         try:
-            # Enviamos los resultados de la herramienta como un mensaje de usuario normal.
-            # Esto evita el error "function response parts" porque no estamos respondiendo
-            # directamente a una function_call en este punto de la conversación.
-            self.chat.send_message(formatted_tool_output_message)
-
-            # Si hay un prompt de seguimiento, lo enviamos después de la inyección de resultados.
-            if user_follow_up_prompt:
-                self.logger.info(f"[MCP] Enviando seguimiento de usuario después de resultados de herramienta.")
-                response = self.chat.send_message(user_follow_up_prompt)
-                return response.text
-            
-            # Si la inyección de la herramienta genera una respuesta de texto inmediata de Gemini, la devolvemos.
-            # Esto es un caso borde, pero es posible que Gemini responda directamente.
-            if self.chat.history and self.chat.history[-1].role == 'model' and self.chat.history[-1].parts:
-                # Verificamos si el último mensaje del modelo tiene contenido de texto después de la salida de la herramienta.
-                # Esta es una heurística; una solución más robusta podría implicar otra llamada al modelo
-                # para resumir la salida de la herramienta si no se genera una respuesta de texto directa.
-                return self.chat.history[-1].parts[0].text
-            
-            return None # No hay respuesta de texto de seguimiento.
+            self._enforce_history_budget()
+            pending = self._pending_function_calls()
+            if pending:
+                # Respuesta nativa a la llamada a función del modelo; el seguimiento viaja en la misma respuesta
+                self.logger.info(f"[MCP] Enviando resultados de herramienta como function_response de '{pending[0]}'.")
+                result = {"resultado": encoded_tool_output}
+                if user_follow_up_prompt:
+                    result["instrucciones"] = user_follow_up_prompt
+                content = self._function_response_parts(pending, result)
+            else:
+                # Sin llamada pendiente (ej. acción en JSON) los resultados van como mensaje de usuario,
+                # con el seguimiento en el mismo mensaje: una sola llamada al modelo
+                self.logger.info(f"[MCP] Inyectando resultados de herramienta como mensaje de usuario en el chat.")
+                content = formatted_tool_output_message + (f"\n{user_follow_up_prompt}" if user_follow_up_prompt else "")
+
+            if on_token:
+                chunks = []
+                for chunk in self._send_message(content, stream=True):
+                    text = self._response_text(chunk)
+                    if text:
+                        chunks.append(text)
+                        on_token(text)
+                return "".join(chunks) or None
+            response = self._send_message(content)
+            return self._response_text(response) or None
         except Exception as e:
+            # Sin texto: el llamador responde con su alternativa (ej. el resumen determinista del escaneo)
             self.logger.error(f"[MCP ERROR] Error al inyectar resultados de herramienta en el chat: {e}")
-            return f"Error al procesar resultados de herramienta: {e}"
+            return None
 
     def reset_chat_history(self):
         """Resetea el historial de chat de la sesión actual."""
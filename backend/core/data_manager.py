@@ -2,7 +2,7 @@
 import sqlite3
 import os
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
 
 class DataManager:
@@ -92,6 +92,56 @@ class DataManager:
                     FOREIGN KEY (service_id) REFERENCES services(id)
                 )
             """)
+            # Tabla de paquetes instalados (inventario autenticado por SSH)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS packages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    host_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    version TEXT,
+                    package_manager TEXT,
+                    FOREIGN KEY (host_id) REFERENCES hosts(id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_packages_host ON packages(host_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_packages_name_version ON packages(name, version)")
+            # CPE resuelto de cada servicio, para cruzar los servicios guardados con CVEs nuevos sin reescanear
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS service_cpes (
+                    service_id INTEGER PRIMARY KEY,
+                    part TEXT,
+                    vendor TEXT,
+                    product TEXT,
+                    version TEXT,
+                    FOREIGN KEY (service_id) REFERENCES services(id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_service_cpes_product ON service_cpes(vendor, product)")
+            # Igual para los paquetes del inventario SSH (service_cpes está indexada por service_id)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS package_cpes (
+                    package_id INTEGER PRIMARY KEY,
+                    part TEXT,
+                    vendor TEXT,
+                    product TEXT,
+                    version TEXT,
+                    FOREIGN KEY (package_id) REFERENCES packages(id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_package_cpes_product ON package_cpes(vendor, product)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_findings_service ON findings(service_id)")
+            # CVEs que ya se mostraron al usuario al terminar el escaneo (solo viajan en tool_output, no como hallazgos):
+            # la sincronización incremental no debe presentarlos como nuevos
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS service_scan_cves (
+                    service_id INTEGER NOT NULL,
+                    cve_id TEXT NOT NULL,
+                    PRIMARY KEY (service_id, cve_id),
+                    FOREIGN KEY (service_id) REFERENCES services(id)
+                )
+            """)
+            # Para quedarse con el escaneo más reciente de cada host en la sincronización
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_hosts_ip_address ON hosts(ip_address)")
             conn.commit()
 
     def get_findings_for_scan_and_host(self, scan_id: int, host_id: int) -> List[Dict[str, Any]]:
@@ -210,6 +260,183 @@ class DataManager:
             print(f"[DataManager ERROR] Error al añadir servicio {port}/{protocol} para host {host_id}: {e}")
             return None
 
+    def add_packages(self, host_id: int, packages: List[Dict[str, Any]]) -> int:
+        """
+        Añade en bloque los paquetes instalados de un host (reemplaza el inventario anterior del host).
+        Cada paquete es {"name", "version", "package_manager"}.
+        Retorna el número de paquetes insertados.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM package_cpes WHERE package_id IN (SELECT id FROM packages WHERE host_id = ?)", (host_id,))
+                cursor.execute("DELETE FROM packages WHERE host_id = ?", (host_id,))
+                cursor.executemany(
+                    "INSERT INTO packages (host_id, name, version, package_manager) VALUES (?, ?, ?, ?)",
+                    [(host_id, p['name'], p.get('version'), p.get('package_manager')) for p in packages]
+                )
+                conn.commit()
+                return len(packages)
+        except Exception as e:
+            print(f"[DataManager ERROR] Error al añadir paquetes para host {host_id}: {e}")
+            return 0
+
+    def get_services_without_cpe(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene los servicios con versión que todavía no tienen CPE resuelto en service_cpes.
+        Las filas antiguas sin vendor (servicios no resueltos) se vuelven a intentar.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT s.* FROM services s LEFT JOIN service_cpes sc ON sc.service_id = s.id
+                WHERE (sc.service_id IS NULL OR sc.vendor IS NULL) AND s.version IS NOT NULL AND s.version != ''
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def add_service_cpes(self, service_cpes: List[Dict[str, Any]]) -> int:
+        """
+        Guarda en bloque el CPE resuelto de varios servicios. Cada elemento es
+        {"service_id", "part", "vendor", "product", "version"}.
+        Retorna el número de filas guardadas.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO service_cpes (service_id, part, vendor, product, version) VALUES (?, ?, ?, ?, ?)",
+                    [(c['service_id'], c.get('part'), c.get('vendor'), c.get('product'), c.get('version')) for c in service_cpes]
+                )
+                conn.commit()
+                return len(service_cpes)
+        except Exception as e:
+            print(f"[DataManager ERROR] Error al guardar CPEs de servicios: {e}")
+            return 0
+
+    def get_packages_without_cpe(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene los paquetes con versión que todavía no tienen CPE resuelto en package_cpes.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT p.* FROM packages p LEFT JOIN package_cpes pc ON pc.package_id = p.id
+                WHERE pc.package_id IS NULL AND p.version IS NOT NULL AND p.version != ''
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def add_package_cpes(self, package_cpes: List[Dict[str, Any]]) -> int:
+        """
+        Guarda en bloque el CPE resuelto de varios paquetes. Cada elemento es
+        {"package_id", "part", "vendor", "product", "version"}. Retorna el número de filas guardadas.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO package_cpes (package_id, part, vendor, product, version) VALUES (?, ?, ?, ?, ?)",
+                    [(c['package_id'], c.get('part'), c.get('vendor'), c.get('product'), c.get('version')) for c in package_cpes]
+                )
+                conn.commit()
+                return len(package_cpes)
+        except Exception as e:
+            print(f"[DataManager ERROR] Error al guardar CPEs de paquetes: {e}")
+            return 0
+
+    def get_packages_by_product(self, vendor: str, product: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene los paquetes guardados cuyo CPE es vendor/product, junto con su host y escaneo.
+        Solo se devuelve el inventario más reciente de cada host (ip_address).
+        Usa el índice (vendor, product) de package_cpes.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT pc.package_id, pc.version AS cpe_version, p.name, p.version, p.package_manager,
+                       h.id AS host_id, h.scan_id, h.ip_address, h.hostname
+                FROM package_cpes pc
+                JOIN packages p ON p.id = pc.package_id
+                JOIN hosts h ON h.id = p.host_id
+                WHERE pc.vendor = ? AND pc.product = ?
+                  AND h.scan_id = (SELECT MAX(h2.scan_id) FROM hosts h2 JOIN packages p2 ON p2.host_id = h2.id
+                                   WHERE h2.ip_address = h.ip_address)
+            """, (vendor, product))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_cve_ids_for_package(self, host_id: int, package_name: str) -> set:
+        """
+        Obtiene los IDs de CVE ya registrados como hallazgos (type='cve') de un paquete de un host.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT json_extract(details, '$.cve_id') FROM findings "
+                "WHERE host_id = ? AND type = 'cve' AND json_extract(details, '$.package_info.name') = ?",
+                (host_id, package_name)
+            )
+            return {row[0] for row in cursor.fetchall() if row[0]}
+
+    def get_services_by_product(self, vendor: str, product: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene los servicios guardados cuyo CPE es vendor/product, junto con su host y escaneo.
+        Solo se devuelven los del escaneo más reciente de cada host (ip_address), para no repetir
+        el mismo hallazgo en escaneos antiguos. Usa el índice (vendor, product) de service_cpes.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT sc.service_id, sc.version AS cpe_version, s.port, s.protocol, s.service_name, s.version,
+                       h.id AS host_id, h.scan_id, h.ip_address, h.hostname
+                FROM service_cpes sc
+                JOIN services s ON s.id = sc.service_id
+                JOIN hosts h ON h.id = s.host_id
+                WHERE sc.vendor = ? AND sc.product = ?
+                  AND h.scan_id = (SELECT MAX(h2.scan_id) FROM hosts h2 WHERE h2.ip_address = h.ip_address)
+            """, (vendor, product))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_cve_ids_for_service(self, service_id: int) -> set:
+        """
+        Obtiene los IDs de CVE ya conocidos de un servicio: los registrados como hallazgos (type='cve')
+        y los que se mostraron al terminar su escaneo (service_scan_cves).
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT json_extract(details, '$.cve_id') FROM findings WHERE service_id = ? AND type = 'cve' "
+                "UNION SELECT cve_id FROM service_scan_cves WHERE service_id = ?",
+                (service_id, service_id)
+            )
+            return {row[0] for row in cursor.fetchall() if row[0]}
+
+    def add_service_scan_cves(self, service_cves: List[Tuple[int, str]]) -> int:
+        """
+        Guarda en bloque los pares (service_id, cve_id) encontrados durante el escaneo.
+        Retorna el número de pares guardados.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.executemany("INSERT OR IGNORE INTO service_scan_cves (service_id, cve_id) VALUES (?, ?)", service_cves)
+                conn.commit()
+                return len(service_cves)
+        except Exception as e:
+            print(f"[DataManager ERROR] Error al guardar los CVEs del escaneo: {e}")
+            return 0
+
+    def update_host_os_info(self, host_id: int, os_info: str):
+        """
+        Actualiza la información de sistema operativo de un host (ej. con datos del inventario autenticado).
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE hosts SET os_info = ? WHERE id = ?", (os_info, host_id))
+            conn.commit()
+
     def add_finding(self, scan_id: int, host_id: int, type: str, title: str, description: str, severity: Optional[str] = None, recommendation: Optional[str] = None, details: Optional[Dict[str, Any]] = None, service_id: Optional[int] = None) -> Optional[int]:
         """
         Añade un hallazgo de seguridad.
@@ -273,6 +500,31 @@ class DataManager:
             cursor.execute("SELECT * FROM services WHERE host_id = ?", (host_id,))
             return [dict(row) for row in cursor.fetchall()]
 
+    def get_packages_for_host(self, host_id: int) -> List[Dict[str, Any]]:
+        """
+        Obtiene los paquetes instalados registrados para un host.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM packages WHERE host_id = ? ORDER BY name", (host_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_packages_for_scan(self, scan_id: int) -> List[Dict[str, Any]]:
+        """
+        Obtiene los paquetes instalados (con versión) de los hosts de un escaneo, junto con su host.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT p.id AS package_id, p.name, p.version, p.package_manager,
+                       h.id AS host_id, h.scan_id, h.ip_address, h.hostname
+                FROM packages p JOIN hosts h ON h.id = p.host_id
+                WHERE h.scan_id = ? AND p.version IS NOT NULL AND p.version != ''
+            """, (scan_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
     def get_findings_for_scan(self, scan_id: int) -> List[Dict[str, Any]]:
         """
         Obtiene todos los hallazgos de seguridad asociados a un ID de escaneo.
@@ -0,0 +1,242 @@
+# src/core/intent_router.py
+"""
+Enrutado local de intenciones, por delante del modelo.
+
+Las órdenes evidentes ("escanea 192.168.1.0/24", "resultados del escaneo 42",
+"informe del host 10.0.0.5 en la sesión X") se convierten en la acción con sus parámetros
+sin pasar por Gemini. Cada acción conocida puntúa según las palabras clave que aparecen en
+el mensaje; la confianza combina la puntuación, la ventaja sobre la segunda acción y unas
+penalizaciones (preguntas, negaciones, mensajes largos). Solo se despacha directamente si
+la confianza supera el umbral y están todos los parámetros obligatorios; el resto va al modelo.
+"""
+import ipaddress
+import json
+import logging
+import re
+import threading
+import unicodedata
+from typing import Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+# Palabras clave (sin tildes, en minúsculas) y su peso para cada acción
+ACTION_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "start_network_scan": {
+        "escanea": 3, "escanear": 3, "escaneame": 3, "escanees": 3, "scanea": 3, "scan": 2, "escanee": 3,
+        "lanza un escaneo": 3, "inicia un escaneo": 3, "haz un escaneo": 3, "nuevo escaneo": 2.5,
+        "analiza la red": 2, "descubre": 1.5, "nmap": 1,
+    },
+    "get_scan_results": {
+        "resultados": 3, "resultado": 3, "hallazgos": 2, "vulnerabilidades encontradas": 2,
+        "muestrame": 1, "ensename": 1, "dame": 0.5, "ver": 0.5, "escaneo": 0.5, "sesion": 0.5,
+    },
+    "generate_detailed_host_report": {
+        "informe": 3, "reporte": 3, "pdf": 2, "detallado": 1.5, "genera": 1, "host": 1,
+    },
+}
+
+# Parámetros que acepta cada acción (del resto de datos extraídos se prescinde)
+ACTION_PARAMETERS: Dict[str, tuple] = {
+    "start_network_scan": ("target", "session_name"),
+    "get_scan_results": ("scan_id", "session_name"),
+    "generate_detailed_host_report": ("host_ip", "session_name"),
+}
+
+# Parámetros obligatorios para poder despachar sin el modelo (tupla = basta con uno de ellos)
+REQUIRED_PARAMETERS: Dict[str, List[Any]] = {
+    "start_network_scan": ["target"],
+    "get_scan_results": [("scan_id", "session_name")],
+    "generate_detailed_host_report": ["host_ip", "session_name"],
+}
+
+QUESTION_WORDS = ("que ", "como ", "cual ", "cuales ", "por que ", "porque ", "cuando ", "donde ", "explica", "deberia", "puedo ", "se puede")
+NEGATION_RE = re.compile(r"\bno\s+(?:\w+\s+){0,2}?(escane\w*|scan\w*|genere\w*|generes|hagas|lances|muestres)\b")
+IP_RE = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?(?![\d.])")
+SCAN_ID_RE = re.compile(r"\b(?:escaneo|scan|sesion|id)\s*(?:n[o°º]?\.?\s*|numero\s*|#\s*|id\s*)?(\d+)\b")
+# Nombre de sesión entre comillas (group 1) o como palabra suelta (group 2) tras "sesión"
+SESSION_RE = re.compile(r"\bsesi[oó]n\s+(?:llamada\s+|denominada\s+|de\s+nombre\s+)?"
+                        r"(?:[\"'“‘]([\w][\w\-. ]*?)[\"'”’]|([\w][\w\-.]*))", re.IGNORECASE)
+SESSION_MENTION_RE = re.compile(r"\bsesion\b")
+# Palabras sueltas tras "sesión" que no son un nombre ("la sesión de ayer", "en la sesión de pruebas"):
+# el mensaje se deja al modelo en lugar de adivinar el nombre
+SESSION_NAME_STOPWORDS = {"de", "del", "la", "el", "los", "las", "un", "una", "en", "con", "para", "por", "que",
+                          "mi", "su", "esta", "este", "esa", "ese", "actual", "anterior", "ultima", "ultimo"}
+# Exclusiones dentro del alcance ("escanea 10.0.0.0/24 pero no el 10.0.0.1"): el router no sabe restarlas
+EXCLUSION_RE = re.compile(r"\b(?:pero\s+no|excepto|salvo|menos|excluyendo|sin\s+incluir)\b")
+# Nombres de sesión generados automáticamente (ej. Escaneo_IA_192_168_1_1_20250711_115855)
+AUTO_SESSION_RE = re.compile(r"\b(Escaneo_IA_[\w]+)\b")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes, para comparar palabras clave."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class IntentRouter:
+    def __init__(self, confidence_threshold: float = 0.8, max_words: int = 25):
+        """
+        :param confidence_threshold: Confianza mínima (0-1) para despachar sin el modelo.
+        :param max_words: Por encima de este número de palabras el mensaje se considera complejo y se penaliza.
+        """
+        self.confidence_threshold = confidence_threshold
+        self.max_words = max_words
+        self._patterns = {
+            action: [(re.compile(rf"\b{re.escape(keyword)}\b"), weight) for keyword, weight in keywords.items()]
+            for action, keywords in ACTION_KEYWORDS.items()
+        }
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"routed": 0, "to_model": 0, "by_action": {}}
+
+    @staticmethod
+    def count_scope(text: str) -> Dict[str, int]:
+        """Número de IPs/CIDR y de IDs de escaneo distintos del mensaje (extract_parameters solo toma el primero)."""
+        addresses = set()
+        for candidate in IP_RE.findall(text):
+            try:
+                addresses.add(str(ipaddress.ip_network(candidate, strict=False)))
+            except ValueError:
+                continue
+        scan_ids = set(SCAN_ID_RE.findall(IP_RE.sub(" ", normalize(text))))
+        return {"targets": len(addresses), "scan_ids": len(scan_ids)}
+
+    @staticmethod
+    def extract_parameters(text: str) -> Dict[str, Any]:
+        """IPs/CIDR, ID de escaneo y nombre de sesión presentes en el mensaje."""
+        parameters: Dict[str, Any] = {}
+        addresses = []
+        for candidate in IP_RE.findall(text):
+            try:
+                network = ipaddress.ip_network(candidate, strict=False) if '/' in candidate else ipaddress.ip_address(candidate)
+            except ValueError:
+                continue
+            addresses.append(candidate if '/' not in candidate else str(network))
+        if addresses:
+            parameters["target"] = addresses[0]
+            host_ips = [address for address in addresses if '/' not in address]
+            if host_ips:
+                parameters["host_ip"] = host_ips[0]
+
+        auto_session_match = AUTO_SESSION_RE.search(text)
+        if auto_session_match:
+            parameters["session_name"] = auto_session_match.group(1)
+        else:
+            session_match = SESSION_RE.search(text)
+            if session_match and session_match.group(1):
+                parameters["session_name"] = session_match.group(1).strip()
+            elif session_match:
+                name = session_match.group(2).rstrip(".")
+                if not name.isdigit() and normalize(name) not in SESSION_NAME_STOPWORDS:
+                    parameters["session_name"] = name
+
+        # Sin IPs en el texto normalizado no se confunde "escaneo 10.0.0.1" con un ID
+        scan_id_match = SCAN_ID_RE.search(IP_RE.sub(" ", normalize(text)))
+        if scan_id_match:
+            parameters["scan_id"] = int(scan_id_match.group(1))
+        return parameters
+
+    def _score(self, normalized: str) -> Dict[str, float]:
+        return {
+            action: sum(weight for pattern, weight in patterns if pattern.search(normalized))
+            for action, patterns in self._patterns.items()
+        }
+
+    @staticmethod
+    def _missing_parameters(action: str, parameters: Dict[str, Any]) -> List[str]:
+        missing = []
+        for requirement in REQUIRED_PARAMETERS.get(action, []):
+            options = requirement if isinstance(requirement, tuple) else (requirement,)
+            if not any(parameters.get(option) not in (None, "") for option in options):
+                missing.append("|".join(options))
+        return missing
+
+    def route(self, text: str) -> Dict[str, Any]:
+        """
+        Retorna la decisión: {"routed", "action", "parameters", "confidence", "scores", "reason"}.
+        Con "routed" = False el mensaje debe ir al modelo.
+        """
+        normalized = normalize(text).strip()
+        scores = self._score(normalized)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (action, best), (_, second) = ranked[0], ranked[1]
+
+        decision: Dict[str, Any] = {"routed": False, "action": None, "parameters": {}, "confidence": 0.0,
+                                    "scores": {k: round(v, 2) for k, v in scores.items() if v}}
+        if best <= 0:
+            decision["reason"] = "sin_palabras_clave"
+            return self._log(text, decision)
+
+        # Intensidad de la intención (3 = una palabra clave fuerte) y ventaja sobre la segunda acción
+        confidence = min(1.0, best / 3.0) * (0.5 + 0.5 * (best - second) / best)
+        reasons = []
+        if '?' in text or normalized.startswith(QUESTION_WORDS):
+            confidence *= 0.5
+            reasons.append("pregunta")
+        if NEGATION_RE.search(normalized):
+            confidence = 0.0
+            reasons.append("negacion")
+        if len(normalized.split()) > self.max_words:
+            confidence *= 0.7
+            reasons.append("mensaje_largo")
+
+        extracted = self.extract_parameters(text)
+        parameters = {k: v for k, v in extracted.items() if k in ACTION_PARAMETERS[action]}
+        missing = self._missing_parameters(action, parameters)
+        if missing:
+            reasons.append(f"faltan_parametros:{','.join(missing)}")
+        # Varios objetivos o IDs, o exclusiones: despachar solo el primero cambiaría el alcance pedido
+        scope = self.count_scope(text)
+        ambiguous_scope = scope["targets"] > 1 or scope["scan_ids"] > 1
+        if ambiguous_scope:
+            reasons.append("multiples_objetivos")
+        if EXCLUSION_RE.search(normalized):
+            ambiguous_scope = True
+            reasons.append("exclusion")
+        # Se menciona una sesión pero no se reconoce su nombre (ni un ID): mejor que la interprete el modelo
+        ambiguous_session = bool(SESSION_MENTION_RE.search(normalized)) and not ({"session_name", "scan_id"} & extracted.keys())
+        if ambiguous_session:
+            reasons.append("sesion_ambigua")
+
+        decision.update({"action": action, "parameters": parameters, "confidence": round(confidence, 3)})
+        decision["routed"] = not missing and not ambiguous_session and not ambiguous_scope and confidence >= self.confidence_threshold
+        decision["reason"] = ";".join(reasons) if reasons else ("confianza_alta" if decision["routed"] else "confianza_baja")
+        return self._log(text, decision)
+
+    def _log(self, text: str, decision: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.stats["routed" if decision["routed"] else "to_model"] += 1
+            if decision["routed"]:
+                self.stats["by_action"][decision["action"]] = self.stats["by_action"].get(decision["action"], 0) + 1
+        # Una línea JSON por decisión, para ajustar pesos y umbral a partir de los logs
+        logger.info(f"[IntentRouter] {json.dumps({'text': text[:200], **decision}, ensure_ascii=False)}")
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "by_action": dict(self.stats["by_action"])}
+
+
+if __name__ == '__main__':
+    # Demostración con mensajes típicos: los evidentes se despachan, el resto va al modelo
+    logging.basicConfig(level=logging.WARNING)
+    router = IntentRouter()
+    for message in [
+        "escanea 192.168.1.0/24",
+        "Escanea 10.0.0.1 en la sesión Laboratorio",
+        "resultados del escaneo 42",
+        "muéstrame los resultados de la sesión Escaneo_IA_10_0_0_1_20250711_115855",
+        "informe del host 10.0.0.5 en la sesión Oficina",
+        "resultados de la sesión de ayer",
+        "escanea 10.0.0.1, 10.0.0.2 y 10.0.0.3",
+        "escanea 10.0.0.0/24 pero no el 10.0.0.1",
+        "dame los resultados del escaneo 3 y compáralos con el escaneo 5",
+        "escanea 10.0.0.1 en la sesión \"de pruebas\"",
+        "¿Qué es un escaneo de puertos?",
+        "no escanees 10.0.0.1 todavía",
+        "escanea la red de la oficina",
+        "¿Qué es CVE-2007-2768?",
+    ]:
+        result = router.route(message)
+        print(f"{'DIRECTO' if result['routed'] else 'MODELO ':7} {result['confidence']:.2f} {result['action'] or '-':30} "
+              f"{json.dumps(result['parameters'], ensure_ascii=False):60} {result['reason']} <- {message}")
+    print(router.get_stats())
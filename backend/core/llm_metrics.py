@@ -0,0 +1,179 @@
+# src/core/llm_metrics.py
+"""
+Instrumentación de las llamadas al modelo: una fila por llamada en SQLite con el tiempo total,
+el tiempo hasta el primer fragmento (streaming), los tokens de entrada/salida del usage_metadata,
+el intento (0 = primero, >0 = reintento), la clase de error y el coste estimado.
+
+Cada llamada se etiqueta con chat_session_id, scan_id y propósito (routing, banner_analysis,
+scan_summary, ...) tomados del contexto activo: el código que origina las llamadas usa
+`llm_call_context(...)` y las etiquetas llegan hasta ModelContextProtocol sin pasarlas por
+parámetro. El contexto se propaga a otros hilos con `contextvars.copy_context().run`.
+"""
+import contextvars
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PURPOSE = "chat"
+GROUP_BY_FIELDS = ("purpose", "scan_id", "chat_session_id", "model", "method", "error_kind")
+
+_call_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def llm_call_context(**tags):
+    """
+    Etiqueta las llamadas al modelo hechas dentro del bloque (y en los hilos lanzados con el contexto copiado).
+    Las etiquetas se acumulan con las del bloque exterior: ej. chat_session_id en la consulta y purpose en cada paso.
+    """
+    token = _call_context.set({**_call_context.get(), **{k: v for k, v in tags.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> Dict[str, Any]:
+    return dict(_call_context.get())
+
+
+class LLMMetricsStore:
+    def __init__(self, pricing: Optional[Dict[str, Dict[str, float]]] = None, db_name: str = 'llm_metrics.db'):
+        """
+        :param pricing: Precio por millón de tokens por modelo, ej. {"gemini-2.5-flash": {"input": 0.3, "output": 2.5}}.
+                        Se aplica la clave más larga contenida en el nombre del modelo; sin tarifa el coste queda a None.
+        """
+        self.pricing = pricing or {}
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at REAL NOT NULL,
+                    chat_session_id TEXT,
+                    scan_id INTEGER,
+                    purpose TEXT NOT NULL,
+                    model TEXT,
+                    method TEXT NOT NULL,
+                    wall_ms REAL NOT NULL,
+                    first_token_ms REAL,
+                    prompt_tokens INTEGER,
+                    response_tokens INTEGER,
+                    total_tokens INTEGER,
+                    attempt INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    error_kind TEXT,
+                    error_type TEXT,
+                    cost_usd REAL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_scan ON llm_calls (scan_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_session ON llm_calls (chat_session_id, started_at)")
+            conn.commit()
+
+    def estimate_cost(self, model: Optional[str], prompt_tokens: Optional[int], response_tokens: Optional[int]) -> Optional[float]:
+        matches = [key for key in self.pricing if model and key in model]
+        if not matches or prompt_tokens is None:
+            return None
+        price = self.pricing[max(matches, key=len)]
+        return (prompt_tokens * price.get('input', 0) + (response_tokens or 0) * price.get('output', 0)) / 1_000_000
+
+    def record(self, method: str, model: Optional[str], started_at: float, wall_ms: float,
+               usage: Optional[Dict[str, Optional[int]]] = None, first_token_ms: Optional[float] = None,
+               error_kind: Optional[str] = None, error_type: Optional[str] = None):
+        """Registra una llamada con las etiquetas del contexto activo. Un fallo al registrar nunca afecta a la llamada."""
+        tags = current_call_context()
+        usage = usage or {}
+        prompt_tokens, response_tokens = usage.get('prompt_tokens'), usage.get('response_tokens')
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT INTO llm_calls (started_at, chat_session_id, scan_id, purpose, model, method, wall_ms, first_token_ms, "
+                    "prompt_tokens, response_tokens, total_tokens, attempt, status, error_kind, error_type, cost_usd) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (started_at, tags.get('chat_session_id'), tags.get('scan_id'), tags.get('purpose', DEFAULT_PURPOSE), model,
+                     method, round(wall_ms, 1), round(first_token_ms, 1) if first_token_ms is not None else None,
+                     prompt_tokens, response_tokens, usage.get('total_tokens'), tags.get('attempt', 0),
+                     'error' if error_type else 'ok', error_kind, error_type,
+                     self.estimate_cost(model, prompt_tokens, response_tokens))
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[LLMMetricsStore] No se pudo registrar la llamada al modelo: {e}")
+        logger.info(f"[LLMMetricsStore] {method} {tags.get('purpose', DEFAULT_PURPOSE)} scan={tags.get('scan_id')} "
+                    f"{wall_ms:.0f} ms, tokens {prompt_tokens}/{response_tokens}{f', error {error_type}' if error_type else ''}")
+
+    def get_summary(self, group_by: str = "purpose", scan_id: Optional[int] = None, chat_session_id: Optional[str] = None,
+                    since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Agregados por `group_by` (purpose, scan_id, chat_session_id, model, method o error_kind), los más costosos en tiempo primero."""
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"group_by debe ser uno de {GROUP_BY_FIELDS}")
+        where, params = self._filters(scan_id, chat_session_id, since)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT {group_by} AS grp, COUNT(*) AS calls, SUM(status = 'error') AS errors, SUM(attempt > 0) AS retries, "
+                f"ROUND(SUM(wall_ms), 1) AS total_wall_ms, ROUND(AVG(wall_ms), 1) AS avg_wall_ms, MAX(wall_ms) AS max_wall_ms, "
+                f"ROUND(AVG(first_token_ms), 1) AS avg_first_token_ms, SUM(prompt_tokens) AS prompt_tokens, "
+                f"SUM(response_tokens) AS response_tokens, ROUND(SUM(cost_usd), 6) AS cost_usd "
+                f"FROM llm_calls{where} GROUP BY {group_by} ORDER BY total_wall_ms DESC",
+                params
+            ).fetchall()
+        return [{group_by: row['grp'], **{k: row[k] for k in row.keys() if k != 'grp'}} for row in rows]
+
+    def get_calls(self, scan_id: Optional[int] = None, chat_session_id: Optional[str] = None, since: Optional[float] = None,
+                  limit: int = 200) -> List[Dict[str, Any]]:
+        """Llamadas individuales, las más recientes primero."""
+        where, params = self._filters(scan_id, chat_session_id, since)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f"SELECT * FROM llm_calls{where} ORDER BY started_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _filters(scan_id: Optional[int], chat_session_id: Optional[str], since: Optional[float]):
+        clauses, params = [], []
+        for column, value in (("scan_id = ?", scan_id), ("chat_session_id = ?", chat_session_id), ("started_at >= ?", since)):
+            if value is not None:
+                clauses.append(column)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def usage_from_response(response: Any) -> Dict[str, Optional[int]]:
+    """Tokens del usage_metadata de una respuesta (o del último fragmento de un streaming)."""
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, 'prompt_token_count', None),
+        "response_tokens": getattr(usage, 'candidates_token_count', None),
+        "total_tokens": getattr(usage, 'total_token_count', None),
+    }
+
+
+if __name__ == '__main__':
+    # Consulta de agregados desde la línea de comandos (ej. python core/llm_metrics.py --group-by purpose --scan-id 3)
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Métricas de llamadas al modelo")
+    parser.add_argument("--group-by", default="purpose", choices=GROUP_BY_FIELDS)
+    parser.add_argument("--scan-id", type=int)
+    parser.add_argument("--chat-session-id")
+    parser.add_argument("--hours", type=float, help="Solo las últimas N horas")
+    args = parser.parse_args()
+
+    store = LLMMetricsStore()
+    print(json.dumps(store.get_summary(args.group_by, args.scan_id, args.chat_session_id,
+                                       time.time() - args.hours * 3600 if args.hours else None), indent=2, ensure_ascii=False))
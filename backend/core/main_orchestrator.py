@@ -2,8 +2,10 @@ import os
 import sys
 import json
 import logging
+import queue
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, Iterator, Optional, List
 
 # El path del proyecto es manejado por el nuevo app.py de Flask. 
 # Si la estructura es correcta, las importaciones relativas deberían funcionar.
@@ -12,6 +14,9 @@ from typing import Dict, Any, Optional, List
 from core.data_manager import DataManager
 from core.session_manager import SessionManager
 from core.context_protocol import ModelContextProtocol
+from core.chat_session_store import ChatSessionStore
+from core.intent_router import IntentRouter
+from core.llm_metrics import llm_call_context
 from utils.command_runner import CommandRunner
 from reports.report_formatter import ReportFormatter
 from reports.report_generator import ReportGenerator
@@ -25,23 +30,42 @@ from core.orchestrator_handlers.report_handler import ReportHandler
 
 logger = logging.getLogger(__name__)
 
+# Consulta del usuario: con function calling nativo una sola llamada devuelve la acción o la respuesta final
+USER_QUERY_OBJECTIVE = "Determinar si el usuario solicita una acción del sistema o una respuesta de conocimiento."
+USER_QUERY_REQUIREMENTS = ("Si el usuario solicita una acción del sistema, llama a la función correspondiente; si no, "
+                           "responde directamente con texto. Mantener un historial conversacional.")
+
 class MainOrchestrator:
     def __init__(self, data_manager: DataManager, session_manager: SessionManager,
                  model_context_protocol: ModelContextProtocol, command_runner: CommandRunner,
-                 report_formatter: ReportFormatter, report_generator: ReportGenerator):
+                 report_formatter: ReportFormatter, report_generator: ReportGenerator,
+                 config: Optional[Dict[str, Any]] = None):
         self.data_manager = data_manager
         self.session_manager = session_manager
         self.base_model_context_protocol = model_context_protocol
         self.command_runner = command_runner
         self.report_formatter = report_formatter
         self.report_generator = report_generator
-
-        self.gemini_chat_sessions: Dict[str, ModelContextProtocol] = {}
+        self.config = config or {}
+
+        # Sesiones de chat acotadas: comparten el GenerativeModel del protocolo base y las inactivas
+        # se desalojan a SQLite (se rehidratan al volver a usarse)
+        self.gemini_chat_sessions = ChatSessionStore(
+            factory=model_context_protocol.new_session,
+            max_sessions=self.config.get('CHAT_SESSIONS_MAX_IN_MEMORY', 100),
+            idle_timeout_seconds=self.config.get('CHAT_SESSIONS_IDLE_TIMEOUT_SECONDS', 1800),
+            max_persisted_age_days=self.config.get('CHAT_SESSIONS_PERSISTED_MAX_AGE_DAYS', 30)
+        )
 
         # Inicializar los handlers con las dependencias necesarias
-        self.scan_handler = ScanHandler(data_manager, session_manager, command_runner, self.get_gemini_chat_session, self._process_ai_analysis_with_tool_results, GENERAL_VULNERABILITY_ANALYSIS_PROMPT_TEMPLATE)
-        self.ai_handler = AiHandler(self.get_gemini_chat_session)
         self.report_handler = ReportHandler(data_manager, report_formatter, report_generator)
+        self.scan_handler = ScanHandler(data_manager, session_manager, command_runner, self.get_gemini_chat_session, self._process_ai_analysis_with_tool_results, GENERAL_VULNERABILITY_ANALYSIS_PROMPT_TEMPLATE, config=self.config,
+                                        build_fallback_summary=self.report_handler.build_fallback_summary)
+        self.ai_handler = AiHandler(self.get_gemini_chat_session)
+        # Las órdenes evidentes se despachan sin pasar por el modelo (ver core/intent_router.py)
+        self.intent_router = IntentRouter(
+            confidence_threshold=self.config.get('INTENT_ROUTER_CONFIDENCE_THRESHOLD', 0.8)
+        ) if self.config.get('INTENT_ROUTER_ENABLED', True) else None
 
         logger.info("[MainOrchestrator] Inicializado. Listo para orquestar operaciones.")
 
@@ -49,21 +73,16 @@ class MainOrchestrator:
         logger.info(f"[MainOrchestrator] {message}")
 
     def reset_gemini_chat_session(self, chat_session_id: str):
-        """Reinicia o crea una nueva sesión de chat de Gemini."""
-        self.gemini_chat_sessions[chat_session_id] = ModelContextProtocol(
-            api_key=self.base_model_context_protocol.api_key,
-            model_name=self.base_model_context_protocol.model_name
-        )
+        """Reinicia o crea una nueva sesión de chat de Gemini (descartando también su historial guardado)."""
+        self.gemini_chat_sessions.reset(chat_session_id)
         logger.info(f"[MainOrchestrator] Sesión de chat de Gemini reiniciada/creada para ID: {chat_session_id}")
 
     def get_gemini_chat_session(self, chat_session_id: str) -> ModelContextProtocol:
-        """Obtiene una sesión de chat de Gemini existente o crea una nueva si no existe."""
-        if chat_session_id not in self.gemini_chat_sessions:
-            logger.warning(f"[MainOrchestrator] Sesión de chat de Gemini no encontrada para ID {chat_session_id}. Creando una nueva.")
-            self.reset_gemini_chat_session(chat_session_id)
-        return self.gemini_chat_sessions[chat_session_id]
+        """Obtiene la sesión de chat de Gemini: en memoria, rehidratada desde su historial guardado o nueva."""
+        return self.gemini_chat_sessions.get(chat_session_id)
 
-    def _process_ai_analysis_with_tool_results(self, tool_output_data: Dict[str, Any], user_follow_up_prompt: str = "", chat_session_id: str = None) -> Optional[str]:
+    def _process_ai_analysis_with_tool_results(self, tool_output_data: Dict[str, Any], user_follow_up_prompt: str = "", chat_session_id: str = None,
+                                               on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """
         Procesa los resultados de una herramienta inyectándolos en el historial de chat de Gemini.
         Esta es una función helper que el ScanHandler necesita para comunicarse con la IA.
@@ -72,7 +91,7 @@ class MainOrchestrator:
             logger.error("chat_session_id es requerido para _process_ai_analysis_with_tool_results.")
             return "Error interno: ID de sesión no proporcionado."
 
-        return self.ai_handler.process_tool_results_and_get_ai_response(tool_output_data, user_follow_up_prompt, chat_session_id)
+        return self.ai_handler.process_tool_results_and_get_ai_response(tool_output_data, user_follow_up_prompt, chat_session_id, on_token=on_token)
 
     def start_network_scan(self, target: str, session_name: str, chat_session_id: str, nmap_profile: str = 'default_scan') -> Dict[str, Any]:
         """
@@ -120,7 +139,8 @@ class MainOrchestrator:
                     response_text = f"No se encontraron hosts en el último escaneo de {target}."
             else:
                 # Para otras preguntas que no sean de listado directo, sigue usando la IA
-                response_text = self.ai_handler.ask_gemini_about_data_context(user_query, last_completed_scan, chat_session_id)
+                with llm_call_context(chat_session_id=chat_session_id, scan_id=scan_id, purpose="data_question"):
+                    response_text = self.ai_handler.ask_gemini_about_data_context(user_query, last_completed_scan, chat_session_id)
             
         return {"response": response_text}
 
@@ -133,118 +153,31 @@ class MainOrchestrator:
 
         logger.info(f"[MainOrchestrator] Procesando consulta del usuario para sesión {chat_session_id}: '{user_query}'")
 
+        # Las llamadas al modelo de toda la consulta (incluido un escaneo) quedan asociadas a la sesión de chat
+        with llm_call_context(chat_session_id=chat_session_id):
+            return self._handle_user_query(user_query, chat_session_id, model_context)
+
+    def _handle_user_query(self, user_query: str, chat_session_id: str, model_context: ModelContextProtocol) -> Dict[str, Any]:
         try:
-            ai_response = model_context.ask_gemini(
-                objective="Determinar si el usuario solicita una acción del sistema o una respuesta de conocimiento.",
-                input_type="Comando de usuario",
-                input_data=user_query,
-                response_requirements="Devolver JSON para acción o texto directo para pregunta de conocimiento. Mantener un historial conversacional."
-            )
+            ai_response = self._route_locally(user_query, model_context)
+            if not ai_response:
+                with llm_call_context(purpose="routing"):
+                    ai_response = model_context.ask_gemini(
+                        objective=USER_QUERY_OBJECTIVE,
+                        input_type="Comando de usuario",
+                        input_data=user_query,
+                        response_requirements=USER_QUERY_REQUIREMENTS
+                    )
 
             if isinstance(ai_response, dict) and 'action' in ai_response:
-                action = ai_response['action']
-                params = ai_response.get('parameters', ai_response.get('params', {}))
-                # Fallback por si 'target' o 'session_name' están directamente en la raíz
-                if 'target' in ai_response and 'target' not in params:
-                    params['target'] = ai_response['target']
-                if 'session_name' in ai_response and 'session_name' not in params:
-                    params['session_name'] = ai_response['session_name']
-
-
-                logger.info(f"IA solicitó la acción: {action} con parámetros: {params}")
-
-                if action == 'start_network_scan':
-                    target = params.get('target')
-                    session_name = params.get('session_name')
-
-                    if not target:
-                        ai_clarification = model_context.ask_gemini(
-                            objective="Solicitar al usuario que especifique el objetivo del escaneo, dada la falta de información en la solicitud original.",
-                            input_type="Error de comando: target faltante",
-                            input_data=user_query,
-                            response_requirements="Respuesta amigable solicitando el IP o rango para el escaneo."
-                        )
-                        # --- CORRECCIÓN 1: Envolver la respuesta de clarificación en un dict ---
-                        return {"response": ai_clarification} 
-
-                    if not session_name:
-                        session_name = f"Escaneo_IA_{target.replace('.', '_').replace('/', '_')}_{self.data_manager.generate_timestamp()}"
-
-                    try:
-                        # Delega al ScanHandler para ejecutar el escaneo y análisis de IA
-                        scan_result = self.scan_handler.start_network_scan(target, session_name, chat_session_id)
-
-                        if scan_result['status'] == 'success':
-                            final_ai_summary = scan_result['ai_summary']
-                            scan_id = scan_result['scan_id'] # Obtener el scan_id del resultado del scan_handler
-
-                            # --- ¡NUEVA LÓGICA AQUÍ: GENERAR REPORTE PDF! ---
-                            logger.info(f"[MainOrchestrator] Generando reporte PDF para escaneo {scan_id}...")
-                            pdf_path = self.report_handler.generate_network_summary_report(
-                                scan_id, session_name, target, final_ai_summary # Pasa todos los datos necesarios
-                            )
-                            if pdf_path:
-                                logger.info(f"[MainOrchestrator] Reporte PDF generado en: {pdf_path}")
-                                # Actualizar la sesión en la DB con la ruta del reporte
-                                self.data_manager.update_scan_session(scan_id, status='completed', results_path=pdf_path)
-                            else:
-                                logger.warning(f"[MainOrchestrator] No se pudo generar el reporte PDF para el escaneo {scan_id}.")
-                                # Asegurarse de que el estado sea 'completed' aunque no haya reporte PDF
-                                self.data_manager.update_scan_session(scan_id, status='completed')
-                            # --- FIN NUEVA LÓGICA ---
-                            
-                            # --- CORRECCIÓN 2: Devolver el resumen de la IA + scan_id ---
-                            return {
-                                "response": final_ai_summary,
-                                "scan_id": scan_id,
-                                "pdf_path": pdf_path if pdf_path else "N/A" # Opcional, para mostrar el link si existe
-                            }
-                        else:
-                            # --- CORRECCIÓN 3: Envolver el mensaje de error del scan_result ---
-                            return {"response": scan_result['message']}
-
-                    except Exception as e:
-                        logger.error(f"Error al ejecutar la acción 'start_network_scan' desde la IA: {e}")
-                        model_context.inject_tool_results_into_chat(
-                            {"action": "start_network_scan_error", "target": target, "error": str(e)},
-                            f"Lo siento, hubo un problema técnico al intentar escanear {target}. Por favor, ¿podrías intentarlo de nuevo o especificar un objetivo diferente?"
-                        )
-                        # --- CORRECCIÓN 4: Envolver el mensaje de excepción ---
-                        return {"response": f"Hubo un error al iniciar el escaneo de red: {e}"}
-
-                elif action == 'get_scan_results':
-                    # Delega al ReportHandler para obtener y formatear los resultados
-                    scan_id_param = params.get('scan_id')
-                    session_name_param = params.get('session_name')
-
-                    response = self.report_handler.get_scan_results_for_ai(scan_id_param, session_name_param, chat_session_id, model_context)
-                    # --- CORRECCIÓN 5: Envolver la respuesta de la IA/Reporte ---
-                    return {"response": response}
-
-                elif action == 'generate_detailed_host_report':
-                    host_ip = params.get('host_ip')
-                    session_name = params.get('session_name')
-                    if not host_ip or not session_name:
-                        # --- CORRECCIÓN 6: Envolver el mensaje de error de parámetros ---
-                        return {"response": "Por favor, especifica tanto la IP del host como el nombre de la sesión para generar el informe detallado."}
-                        
-                    pdf_path = self.report_handler.generate_detailed_host_report(host_ip, session_name)
-                    if pdf_path:
-                        # --- CORRECCIÓN 7: Envolver el mensaje de éxito ---
-                        return {"response": f"Informe detallado para {host_ip} en la sesión '{session_name}' generado exitosamente: {pdf_path}"}
-                    else:
-                        # --- CORRECCIÓN 8: Envolver el mensaje de falla ---
-                        return {"response": f"No se pudo generar el informe detallado para {host_ip} en la sesión '{session_name}'. Verifica que el host exista en esa sesión."}
-
-                else:
-                    # --- CORRECCIÓN 9: Envolver el mensaje de acción desconocida ---
-                    return {"response": f"La IA sugirió una acción ('{action}') que aún no puedo ejecutar. Por favor, intenta de nuevo o haz una pregunta diferente."}
-
+                result = self._dispatch_action(ai_response, user_query, chat_session_id, model_context)
+                model_context.record_function_result(result.get('response'))
+                return result
             else:
                 logger.info("Respuesta de la IA es texto directo (no una acción).")
-                # Si la IA no detecta una acción, delega al AiHandler para una respuesta de conocimiento.
+                # La respuesta de texto ya es la respuesta final: no hace falta una segunda llamada
                 # --- CORRECCIÓN 10: Envolver la respuesta general de la IA ---
-                return {"response": self.ai_handler.process_general_query(user_query, chat_session_id)}
+                return {"response": ai_response}
 
         except genai.types.BlockedPromptException as e:
             logger.error(f"Consulta bloqueada por la API de Gemini para sesión {chat_session_id}: {e}")
@@ -258,6 +191,223 @@ class MainOrchestrator:
             # --- CORRECCIÓN 13: Envolver el mensaje de excepción general ---
             return {"response": f"Hubo un error al comunicarse con la IA: {e}"}
 
+    def handle_user_query_stream(self, user_query: str, chat_session_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Variante en streaming de handle_user_query. Genera eventos a medida que se producen:
+          {"type": "status", "message": ...}   etapa en curso de una acción larga (ej. "Buscando CVEs...")
+          {"type": "token", "text": ...}       fragmento de la respuesta de la IA
+          {"type": "done", "response": ...}    respuesta completa (más scan_id/pdf_path si hubo escaneo)
+          {"type": "error", "message": ...}
+        La consulta se procesa en un hilo aparte porque las etapas del escaneo se notifican mediante callbacks.
+        """
+        events: "queue.Queue[Any]" = queue.Queue()
+        end_of_stream = object()
+
+        def worker():
+            try:
+                with llm_call_context(chat_session_id=chat_session_id):
+                    self._run_user_query_stream(user_query, chat_session_id, events.put)
+            except Exception as e:
+                logger.error(f"[MainOrchestrator] Error inesperado en el chat en streaming para sesión {chat_session_id}: {e}")
+                events.put({"type": "error", "message": f"Hubo un error al procesar tu consulta: {e}"})
+            finally:
+                events.put(end_of_stream)
+
+        threading.Thread(target=worker, daemon=True, name=f"chat-stream-{chat_session_id}").start()
+        while True:
+            event = events.get()
+            if event is end_of_stream:
+                return
+            yield event
+
+    def _run_user_query_stream(self, user_query: str, chat_session_id: str, emit: Callable[[Dict[str, Any]], None]):
+        model_context = self.get_gemini_chat_session(chat_session_id)
+        logger.info(f"[MainOrchestrator] Procesando consulta del usuario (streaming) para sesión {chat_session_id}: '{user_query}'")
+
+        def emit_token(text: str):
+            emit({"type": "token", "text": text})
+
+        try:
+            # Se retransmite según llega salvo que la respuesta empiece como bloque de código o JSON:
+            # en ese caso puede ser una acción en texto y se acumula hasta tenerla completa
+            chunks: List[str] = []
+            streaming = None
+            function_call = None
+            ai_response = self._route_locally(user_query, model_context)
+            if not ai_response:
+                with llm_call_context(purpose="routing"):
+                    for chunk in model_context.ask_gemini_stream(
+                        objective=USER_QUERY_OBJECTIVE,
+                        input_type="Comando de usuario",
+                        input_data=user_query,
+                        response_requirements=USER_QUERY_REQUIREMENTS
+                    ):
+                        if isinstance(chunk, dict):
+                            # Llamada a función nativa
+                            function_call = chunk
+                            continue
+                        chunks.append(chunk)
+                        if streaming:
+                            emit_token(chunk)
+                            continue
+                        head = "".join(chunks).lstrip()
+                        if streaming is None and head:
+                            streaming = not head.startswith(('`', '{'))
+                            if streaming:
+                                emit_token("".join(chunks))
+
+            text_response = "".join(chunks).strip()
+            ai_response = ai_response or function_call or (None if streaming else model_context.parse_action_response(text_response))
+            if ai_response:
+                emit({"type": "status", "message": f"Ejecutando la acción '{ai_response['action']}'..."})
+                result = self._dispatch_action(
+                    ai_response, user_query, chat_session_id, model_context,
+                    progress_callback=lambda message: emit({"type": "status", "message": message}),
+                    on_token=emit_token
+                )
+                model_context.record_function_result(result.get('response'))
+            else:
+                logger.info("Respuesta de la IA es texto directo (no una acción).")
+                if not streaming and text_response:
+                    emit_token(text_response)
+                result = {"response": text_response}
+            emit({"type": "done", **result})
+
+        except genai.types.BlockedPromptException as e:
+            logger.error(f"Consulta bloqueada por la API de Gemini para sesión {chat_session_id}: {e}")
+            emit({"type": "error", "message": "Lo siento, tu consulta fue bloqueada por las políticas de seguridad de la IA."})
+        except Exception as e:
+            logger.error(f"Error al llamar a Gemini API para sesión {chat_session_id}: {e}")
+            if "429 You exceeded your current quota" in str(e):
+                emit({"type": "error", "message": "He excedido mi cuota de solicitudes. Por favor, intenta de nuevo más tarde."})
+            else:
+                emit({"type": "error", "message": f"Hubo un error al comunicarse con la IA: {e}"})
+
+    def _route_locally(self, user_query: str, model_context: ModelContextProtocol) -> Optional[Dict[str, Any]]:
+        """
+        Acción resuelta por el enrutador local de intenciones, o None si la consulta debe ir al modelo.
+        La acción se registra en el historial del chat como si el modelo la hubiera llamado.
+        """
+        if not self.intent_router:
+            return None
+        decision = self.intent_router.route(user_query)
+        if not decision['routed']:
+            return None
+        logger.info(f"[MainOrchestrator] Consulta despachada sin el modelo: {decision['action']} "
+                    f"(confianza {decision['confidence']:.2f}) con parámetros {decision['parameters']}")
+        model_context.record_local_action(user_query, decision['action'], decision['parameters'])
+        return {"action": decision['action'], "parameters": dict(decision['parameters'])}
+
+    def _dispatch_action(self, ai_response: Dict[str, Any], user_query: str, chat_session_id: str,
+                         model_context: ModelContextProtocol, progress_callback: Optional[Callable[[str], None]] = None,
+                         on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta la acción que la IA ha solicitado. Con `progress_callback` se notifican las etapas
+        de las acciones largas y con `on_token` se retransmite el resumen final a medida que se genera.
+        """
+        action = ai_response['action']
+        params = ai_response.get('parameters', ai_response.get('params', {}))
+        # Fallback por si 'target' o 'session_name' están directamente en la raíz
+        if 'target' in ai_response and 'target' not in params:
+            params['target'] = ai_response['target']
+        if 'session_name' in ai_response and 'session_name' not in params:
+            params['session_name'] = ai_response['session_name']
+
+
+        logger.info(f"IA solicitó la acción: {action} con parámetros: {params}")
+
+        if action == 'start_network_scan':
+            target = params.get('target')
+            session_name = params.get('session_name')
+
+            if not target:
+                with llm_call_context(purpose="clarification"):
+                    ai_clarification = model_context.ask_gemini(
+                        objective="Solicitar al usuario que especifique el objetivo del escaneo, dada la falta de información en la solicitud original.",
+                        input_type="Error de comando: target faltante",
+                        input_data=user_query,
+                        response_requirements="Respuesta amigable solicitando el IP o rango para el escaneo."
+                    )
+                # --- CORRECCIÓN 1: Envolver la respuesta de clarificación en un dict ---
+                return {"response": ai_clarification} 
+
+            if not session_name:
+                session_name = f"Escaneo_IA_{target.replace('.', '_').replace('/', '_')}_{self.data_manager.generate_timestamp()}"
+
+            try:
+                # Delega al ScanHandler para ejecutar el escaneo y análisis de IA
+                scan_result = self.scan_handler.start_network_scan(target, session_name, chat_session_id,
+                                                                  progress_callback=progress_callback, on_token=on_token)
+
+                if scan_result['status'] == 'success':
+                    final_ai_summary = scan_result['ai_summary']
+                    scan_id = scan_result['scan_id'] # Obtener el scan_id del resultado del scan_handler
+
+                    # --- ¡NUEVA LÓGICA AQUÍ: GENERAR REPORTE PDF! ---
+                    logger.info(f"[MainOrchestrator] Generando reporte PDF para escaneo {scan_id}...")
+                    pdf_path = self.report_handler.generate_network_summary_report(
+                        scan_id, session_name, target, final_ai_summary # Pasa todos los datos necesarios
+                    )
+                    if pdf_path:
+                        logger.info(f"[MainOrchestrator] Reporte PDF generado en: {pdf_path}")
+                        # Actualizar la sesión en la DB con la ruta del reporte
+                        self.data_manager.update_scan_session(scan_id, status='completed', results_path=pdf_path)
+                    else:
+                        logger.warning(f"[MainOrchestrator] No se pudo generar el reporte PDF para el escaneo {scan_id}.")
+                        # Asegurarse de que el estado sea 'completed' aunque no haya reporte PDF
+                        self.data_manager.update_scan_session(scan_id, status='completed')
+                    # --- FIN NUEVA LÓGICA ---
+
+                    # --- CORRECCIÓN 2: Devolver el resumen de la IA + scan_id ---
+                    return {
+                        "response": final_ai_summary,
+                        "scan_id": scan_id,
+                        "pdf_path": pdf_path if pdf_path else "N/A" # Opcional, para mostrar el link si existe
+                    }
+                else:
+                    # --- CORRECCIÓN 3: Envolver el mensaje de error del scan_result ---
+                    return {"response": scan_result['message']}
+
+            except Exception as e:
+                logger.error(f"Error al ejecutar la acción 'start_network_scan' desde la IA: {e}")
+                with llm_call_context(purpose="scan_summary"):
+                    model_context.inject_tool_results_into_chat(
+                        {"action": "start_network_scan_error", "target": target, "error": str(e)},
+                        f"Lo siento, hubo un problema técnico al intentar escanear {target}. Por favor, ¿podrías intentarlo de nuevo o especificar un objetivo diferente?"
+                    )
+                # --- CORRECCIÓN 4: Envolver el mensaje de excepción ---
+                return {"response": f"Hubo un error al iniciar el escaneo de red: {e}"}
+
+        elif action == 'get_scan_results':
+            # Delega al ReportHandler para obtener y formatear los resultados
+            scan_id_param = params.get('scan_id')
+            session_name_param = params.get('session_name')
+
+            with llm_call_context(scan_id=scan_id_param if isinstance(scan_id_param, int) else None, purpose="scan_results"):
+                response = self.report_handler.get_scan_results_for_ai(scan_id_param, session_name_param, chat_session_id, model_context)
+            # --- CORRECCIÓN 5: Envolver la respuesta de la IA/Reporte ---
+            return {"response": response}
+
+        elif action == 'generate_detailed_host_report':
+            host_ip = params.get('host_ip')
+            session_name = params.get('session_name')
+            if not host_ip or not session_name:
+                # --- CORRECCIÓN 6: Envolver el mensaje de error de parámetros ---
+                return {"response": "Por favor, especifica tanto la IP del host como el nombre de la sesión para generar el informe detallado."}
+
+            pdf_path = self.report_handler.generate_detailed_host_report(host_ip, session_name)
+            if pdf_path:
+                # --- CORRECCIÓN 7: Envolver el mensaje de éxito ---
+                return {"response": f"Informe detallado para {host_ip} en la sesión '{session_name}' generado exitosamente: {pdf_path}"}
+            else:
+                # --- CORRECCIÓN 8: Envolver el mensaje de falla ---
+                return {"response": f"No se pudo generar el informe detallado para {host_ip} en la sesión '{session_name}'. Verifica que el host exista en esa sesión."}
+
+        else:
+            # --- CORRECCIÓN 9: Envolver el mensaje de acción desconocida ---
+            return {"response": f"La IA sugirió una acción ('{action}') que aún no puedo ejecutar. Por favor, intenta de nuevo o haz una pregunta diferente."}
+
+
     def generate_detailed_host_report(self, host_ip: str, session_name: str) -> Optional[str]:
         """Delega la generación de informes detallados al ReportHandler."""
         return self.report_handler.generate_detailed_host_report(host_ip, session_name)
\ No newline at end of file
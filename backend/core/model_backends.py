@@ -0,0 +1,453 @@
+# src/core/model_backends.py
+"""
+Backends del modelo para ModelContextProtocol.
+
+- GeminiBackend: la API de Gemini (google.generativeai). Necesita GEMINI_API_KEY y red.
+- LocalStubBackend: modelo local determinista, sin red ni clave, para pruebas de carga y de
+  regresión del flujo completo (chat, acciones, análisis de banners y resúmenes de escaneo).
+  Responde con reglas (acciones con las mismas reglas que core/intent_router.py, hallazgos JSON
+  para los análisis de banners, resúmenes de los resultados de herramientas) o con un guion YAML,
+  con latencia configurable (tiempo hasta el primer token + tokens por segundo) y errores inyectados
+  (429/503) que se clasifican igual que los de la API (ver core/ai_call_executor.classify_error).
+
+Se elige con MODEL_BACKEND en general_config.yaml (ver `create_model_backend`).
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+import types
+from typing import Dict, Any, Iterator, List, Optional
+
+import google.generativeai as genai
+import yaml
+
+from core.chat_history_manager import TOOL_RESULTS_HEADER, estimate_tokens
+from core.intent_router import IntentRouter
+
+logger = logging.getLogger(__name__)
+
+# Identidad de todos los modelos del backend local: no contiene el nombre del modelo de Gemini configurado,
+# para que sus respuestas no se cacheen bajo las claves de Gemini ni se tarifiquen como llamadas de pago
+STUB_MODEL_ID = "local-stub"
+
+
+class ModelBackend:
+    """
+    Interfaz común de los backends: crean los modelos (con la misma API que genai.GenerativeModel:
+    start_chat/send_message/generate_content) y las partes de respuesta a llamadas a función.
+    """
+    name = "base"
+
+    def model_id(self, model_name: str) -> str:
+        """Identidad del modelo en las claves de caché de análisis y en las métricas (y sus tarifas)."""
+        return model_name
+
+    def create_model(self, model_name: str, system_instruction: Optional[str] = None, tools: Optional[List[Any]] = None) -> Any:
+        raise NotImplementedError
+
+    def function_response_part(self, name: str, response: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    name = "gemini"
+
+    def __init__(self, api_key: str):
+        if not api_key:
+            raise ValueError("La clave de API de Gemini no puede estar vacía.")
+        genai.configure(api_key=api_key)
+
+    def create_model(self, model_name: str, system_instruction: Optional[str] = None, tools: Optional[List[Any]] = None) -> Any:
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction, tools=tools)
+
+    def function_response_part(self, name: str, response: Dict[str, Any]) -> Any:
+        return genai.protos.Part(function_response=genai.protos.FunctionResponse(name=name, response=response))
+
+
+# --- Mensajes del modelo local: mismos atributos que los de genai y `type(x).to_dict(x)` ---
+
+class _StubMessage:
+    FIELDS: tuple = ()
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.get(field))
+
+    @classmethod
+    def to_dict(cls, instance: '_StubMessage') -> Dict[str, Any]:
+        def plain(value):
+            if isinstance(value, _StubMessage):
+                return type(value).to_dict(value)
+            if isinstance(value, list):
+                return [plain(v) for v in value]
+            return value
+        return {field: plain(getattr(instance, field)) for field in cls.FIELDS if getattr(instance, field) not in (None, "")}
+
+
+class StubFunctionCall(_StubMessage):
+    FIELDS = ("name", "args")
+
+
+class StubFunctionResponse(_StubMessage):
+    FIELDS = ("name", "response")
+
+
+class StubPart(_StubMessage):
+    FIELDS = ("text", "function_call", "function_response")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.text = self.text or ""
+
+
+class StubContent(_StubMessage):
+    FIELDS = ("role", "parts")
+
+
+class StubResponse:
+    def __init__(self, parts: List[StubPart], prompt_tokens: int, response_tokens: int):
+        self.candidates = [types.SimpleNamespace(content=StubContent(role="model", parts=parts))]
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens
+        )
+
+    @property
+    def text(self) -> str:
+        parts = self.candidates[0].content.parts
+        # Como en genai: una respuesta sin texto (ej. solo una llamada a función) no tiene .text
+        if not any(part.text for part in parts):
+            raise ValueError("La respuesta no contiene texto.")
+        return "".join(part.text for part in parts)
+
+
+class StubAPIError(Exception):
+    """Error inyectado por el modelo local; `code` imita el código HTTP de la API (429 cuota, 503 no disponible)."""
+    def __init__(self, message: str, code: int):
+        super().__init__(message)
+        self.code = code
+
+
+def _to_part(part: Any) -> StubPart:
+    if isinstance(part, StubPart):
+        return part
+    if isinstance(part, str):
+        return StubPart(text=part)
+    if isinstance(part, dict):
+        return StubPart(
+            text=part.get('text'),
+            function_call=StubFunctionCall(**part['function_call']) if part.get('function_call') else None,
+            function_response=StubFunctionResponse(**part['function_response']) if part.get('function_response') else None,
+        )
+    raise TypeError(f"Parte no soportada por el modelo local: {type(part).__name__}")
+
+
+def _to_content(turn: Any) -> StubContent:
+    if isinstance(turn, StubContent):
+        return turn
+    return StubContent(role=turn['role'], parts=[_to_part(part) for part in turn['parts']])
+
+
+def _part_text(part: StubPart) -> str:
+    if part.text:
+        return part.text
+    return json.dumps(type(part).to_dict(part), ensure_ascii=False, default=str)
+
+
+# --- Reglas de respuesta ---
+
+USER_REQUEST_RE = re.compile(r"\*\*Petición del usuario:\*\*\s*(.*?)\n\*\*Requisitos", re.DOTALL)
+SERVICE_LINE_RE = re.compile(r"^(Servicio|Puerto|Protocolo|Versión):\s*(.*)$", re.MULTILINE)
+IP_RE = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
+CVE_RE = re.compile(r"CVE-\d{4}-\d{4,7}")
+
+# Hallazgos por servicio para los análisis de banners (el resto: informativo)
+SERVICE_FINDINGS: Dict[str, tuple] = {
+    "telnet": ("High", "Telnet transmite credenciales y sesiones en texto claro.", ["Deshabilitar Telnet y usar SSH."]),
+    "ftp": ("Medium", "FTP transmite credenciales en texto claro y puede permitir acceso anónimo.",
+            ["Usar SFTP/FTPS.", "Deshabilitar el acceso anónimo."]),
+    "microsoft-ds": ("Medium", "SMB expuesto: superficie habitual de ataques de ejecución remota.",
+                     ["Restringir SMB a la red interna.", "Deshabilitar SMBv1 y aplicar parches."]),
+    "vnc": ("High", "VNC expuesto, con frecuencia sin cifrado ni autenticación robusta.", ["Restringir el acceso o tunelizar por SSH."]),
+    "mysql": ("Medium", "Base de datos accesible desde la red.", ["Restringir el puerto a los hosts de aplicación."]),
+    "http": ("Low", "Servicio web sin cifrado.", ["Redirigir a HTTPS.", "Mantener el servidor actualizado."]),
+}
+
+
+class LocalStubModel:
+    """Modelo local con la API de genai.GenerativeModel que usa ModelContextProtocol."""
+    def __init__(self, backend: 'LocalStubBackend', model_name: str, system_instruction: Optional[str] = None,
+                 tools: Optional[List[Any]] = None):
+        self.backend = backend
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        self.tools = tools
+
+    def start_chat(self, history: Optional[List[Any]] = None) -> 'LocalStubChat':
+        return LocalStubChat(self, [_to_content(turn) for turn in history or []])
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> StubResponse:
+        parts = [_to_part(prompt)]
+        reply = self.backend.reply(parts, can_call_functions=False)
+        prompt_tokens = estimate_tokens(self.system_instruction + prompt)
+        return self.backend.deliver(reply, prompt_tokens, stream=False)
+
+
+class LocalStubChat:
+    def __init__(self, model: LocalStubModel, history: List[StubContent]):
+        self.model = model
+        self.history = history
+
+    def send_message(self, content: Any, stream: bool = False) -> Any:
+        parts = [_to_part(part) for part in content] if isinstance(content, list) else [_to_part(content)]
+        reply = self.model.backend.reply(parts, can_call_functions=bool(self.model.tools))
+        # Como en la API, el historial completo cuenta como tokens de entrada
+        prompt_tokens = estimate_tokens(self.model.system_instruction) + sum(
+            estimate_tokens(_part_text(part)) for turn in self.history for part in turn.parts
+        ) + sum(estimate_tokens(_part_text(part)) for part in parts)
+        response = self.model.backend.deliver(reply, prompt_tokens, stream=stream)
+        user_turn = StubContent(role="user", parts=parts)
+        model_turn = StubContent(role="model", parts=reply)
+        if not stream:
+            self.history.extend([user_turn, model_turn])
+            return response
+
+        def chunks():
+            yield from response
+            # El turno se añade al historial al terminar la respuesta, como en genai
+            self.history.extend([user_turn, model_turn])
+        return chunks()
+
+
+class LocalStubBackend(ModelBackend):
+    """
+    Modelo local determinista. Las respuestas no dependen de la semilla; la latencia y los errores
+    inyectados sí, de modo que dos ejecuciones con la misma semilla y el mismo orden de llamadas coinciden.
+    """
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 800, latency_jitter_ms: float = 300, tokens_per_second: float = 150,
+                 error_rate: float = 0.0, quota_error_rate: float = 0.0, seed: Optional[int] = 42,
+                 script_path: Optional[str] = None):
+        """
+        :param latency_ms: Tiempo medio hasta el primer token.
+        :param latency_jitter_ms: Variación máxima (+/-) del tiempo hasta el primer token.
+        :param tokens_per_second: Velocidad de generación; determina la duración del resto de la respuesta.
+        :param error_rate: Probabilidad de un error transitorio (503) por llamada.
+        :param quota_error_rate: Probabilidad de un error de cuota (429) por llamada.
+        :param script_path: Guion YAML opcional: lista de reglas {match, kind?, text | function_call | json | error}
+                            que se comprueban antes de las reglas incorporadas (la primera que coincide gana).
+                            `match` es una expresión regular sobre el mensaje; `kind` limita la regla a "chat",
+                            "stateless" o "tool_result"; `error` ("quota" o "transient") lanza el error correspondiente.
+        """
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.script = self._load_script(script_path) if script_path else []
+        self.intent_router = IntentRouter(confidence_threshold=0.5)
+        self.stats = {"calls": 0, "injected_errors": 0, "scripted": 0}
+        logger.info(f"[LocalStubBackend] Modelo local activo (latencia {latency_ms}±{latency_jitter_ms} ms, "
+                    f"{tokens_per_second} tokens/s, errores {error_rate:.0%} + cuota {quota_error_rate:.0%}, "
+                    f"{len(self.script)} reglas de guion).")
+
+    @staticmethod
+    def _load_script(script_path: str) -> List[Dict[str, Any]]:
+        with open(script_path, 'r', encoding='utf-8') as f:
+            rules = yaml.safe_load(f) or []
+        for rule in rules:
+            rule['pattern'] = re.compile(rule['match'], re.IGNORECASE | re.DOTALL)
+        return rules
+
+    def model_id(self, model_name: str) -> str:
+        return STUB_MODEL_ID
+
+    def create_model(self, model_name: str, system_instruction: Optional[str] = None, tools: Optional[List[Any]] = None) -> LocalStubModel:
+        return LocalStubModel(self, model_name, system_instruction, tools)
+
+    def function_response_part(self, name: str, response: Dict[str, Any]) -> StubPart:
+        return StubPart(function_response=StubFunctionResponse(name=name, response=response))
+
+    # --- Generación de la respuesta ---
+
+    def reply(self, parts: List[StubPart], can_call_functions: bool) -> List[StubPart]:
+        """Partes de la respuesta del modelo al mensaje `parts` (guion primero, después reglas incorporadas)."""
+        function_responses = [part.function_response for part in parts if part.function_response]
+        text = "\n".join(part.text for part in parts if part.text)
+        if function_responses:
+            kind = "tool_result"
+        elif TOOL_RESULTS_HEADER in text:
+            kind = "tool_result"
+        else:
+            kind = "chat" if can_call_functions else "stateless"
+
+        prompt_text = "\n".join(_part_text(part) for part in parts)
+        for rule in self.script:
+            if rule.get('kind') in (None, kind) and rule['pattern'].search(prompt_text):
+                with self._lock:
+                    self.stats["scripted"] += 1
+                return self._scripted_reply(rule)
+
+        if kind == "tool_result":
+            response = function_responses[0].response if function_responses else {"resultado": text}
+            name = function_responses[0].name if function_responses else "acción"
+            return [StubPart(text=self._summarize_payload(f"He procesado los resultados de '{name}'.",
+                                                          json.dumps(response, ensure_ascii=False, default=str)))]
+        if kind == "stateless":
+            return [StubPart(text=self._analyze_services(text))]
+
+        request_text = USER_REQUEST_RE.search(text)
+        request_text = request_text.group(1).strip() if request_text else text
+        decision = self.intent_router.route(request_text)
+        if decision['routed']:
+            return [StubPart(function_call=StubFunctionCall(name=decision['action'], args=decision['parameters']))]
+        return [StubPart(text=f"(Modelo local de pruebas) Respuesta simulada a: «{request_text[:200]}». "
+                              f"Configura MODEL_BACKEND: gemini para obtener respuestas reales.")]
+
+    def _scripted_reply(self, rule: Dict[str, Any]) -> List[StubPart]:
+        if rule.get('error'):
+            raise StubAPIError(f"Error inyectado por el guion: {rule['error']}", 429 if rule['error'] == 'quota' else 503)
+        if rule.get('function_call'):
+            return [StubPart(function_call=StubFunctionCall(name=rule['function_call']['name'], args=rule['function_call'].get('args') or {}))]
+        if 'json' in rule:
+            return [StubPart(text=json.dumps(rule['json'], ensure_ascii=False))]
+        return [StubPart(text=str(rule.get('text', '')))]
+
+    @staticmethod
+    def _summarize_payload(header: str, payload: str) -> str:
+        """Resumen con los hosts y CVEs que aparecen en el texto (resultados de herramientas o resúmenes de escaneo)."""
+        hosts = list(dict.fromkeys(IP_RE.findall(payload)))
+        cves = list(dict.fromkeys(CVE_RE.findall(payload)))
+        lines = [f"(Modelo local de pruebas) {header}"]
+        if hosts:
+            lines.append(f"Hosts: {', '.join(hosts[:10])}{' y otros' if len(hosts) > 10 else ''} ({len(hosts)} en total).")
+        if cves:
+            lines.append(f"CVEs relevantes: {', '.join(cves[:10])}{' y otros' if len(cves) > 10 else ''}. "
+                         f"Puedes preguntarme por cualquiera de ellos por su ID.")
+        if not hosts and not cves:
+            lines.append("No hay hosts ni CVEs que destacar en los resultados.")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _finding(service_name: Optional[str], version: Optional[str]) -> Dict[str, Any]:
+        impact, vulnerability, mitigations = SERVICE_FINDINGS.get((service_name or "").lower(), (
+            "Informational", f"Sin vulnerabilidades conocidas para {service_name or 'el servicio'} {version or ''}".strip() + ".",
+            ["Mantener el servicio actualizado."]
+        ))
+        return {"vulnerability": vulnerability, "impact": impact, "mitigations": mitigations}
+
+    def _analyze_services(self, prompt: str) -> str:
+        """
+        Análisis de banners: array JSON para los lotes (core/vulnerability_analyzer.py) u objeto para un servicio.
+        Cualquier otra llamada sin estado (ej. resúmenes de core/scan_summarizer.py) recibe un resumen en texto.
+        """
+        start, end = prompt.find('[{'), prompt.find('}]')
+        if start != -1 and end > start:
+            try:
+                services = json.loads(prompt[start:end + 2])
+            except ValueError:
+                services = None
+            if isinstance(services, list) and services and all(isinstance(service, dict) and 'id' in service for service in services):
+                return json.dumps([{"id": service['id'], **self._finding(service.get('service_name'), service.get('version'))}
+                                   for service in services], ensure_ascii=False)
+        fields = dict(SERVICE_LINE_RE.findall(prompt))
+        if fields:
+            return json.dumps(self._finding(fields.get('Servicio'), fields.get('Versión')), ensure_ascii=False)
+        return self._summarize_payload("Resumen simulado de los datos recibidos.", prompt)
+
+    # --- Latencia y errores ---
+
+    def deliver(self, reply: List[StubPart], prompt_tokens: int, stream: bool) -> Any:
+        """
+        Espera el tiempo hasta el primer token (y, sin streaming, el de toda la respuesta) o lanza el error
+        inyectado. Con streaming retorna los fragmentos, cada uno tras el tiempo que tarda en generarse.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            first_token_seconds = max(0.0, self.latency_ms + self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)) / 1000
+            draw = self._random.random()
+        time.sleep(first_token_seconds)
+        if draw < self.quota_error_rate + self.error_rate:
+            with self._lock:
+                self.stats["injected_errors"] += 1
+            if draw < self.quota_error_rate:
+                raise StubAPIError("429 Cuota del modelo local agotada (error inyectado).", 429)
+            raise StubAPIError("503 Modelo local no disponible (error inyectado).", 503)
+
+        response_tokens = sum(estimate_tokens(_part_text(part)) for part in reply)
+        if not stream:
+            time.sleep(response_tokens / self.tokens_per_second)
+            return StubResponse(reply, prompt_tokens, response_tokens)
+        return self._stream(reply, prompt_tokens, response_tokens)
+
+    def _stream(self, reply: List[StubPart], prompt_tokens: int, response_tokens: int) -> Iterator[StubResponse]:
+        text_parts = [part for part in reply if part.text]
+        if not text_parts:
+            yield StubResponse(reply, prompt_tokens, response_tokens)
+            return
+        words = "".join(part.text for part in text_parts).split(" ")
+        chunks = [" ".join(words[i:i + 8]) + (" " if i + 8 < len(words) else "") for i in range(0, len(words), 8)]
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(estimate_tokens(chunk) / self.tokens_per_second)
+            # El usage_metadata acumulado llega en el último fragmento
+            yield StubResponse([StubPart(text=chunk)], prompt_tokens, response_tokens if index == len(chunks) - 1 else 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def configured_model_id(config: Dict[str, Any]) -> str:
+    """Identidad (ver ModelBackend.model_id) del modelo principal según MODEL_BACKEND y GEMINI_MODEL."""
+    if (config.get('MODEL_BACKEND') or 'gemini').lower() == 'stub':
+        return STUB_MODEL_ID
+    return config.get('GEMINI_MODEL')
+
+
+def create_model_backend(config: Dict[str, Any], api_key: Optional[str]) -> ModelBackend:
+    """Backend indicado por MODEL_BACKEND ('gemini' por defecto o 'stub') con su configuración MODEL_STUB_*."""
+    backend_name = (config.get('MODEL_BACKEND') or 'gemini').lower()
+    if backend_name == 'stub':
+        return LocalStubBackend(
+            latency_ms=config.get('MODEL_STUB_LATENCY_MS', 800),
+            latency_jitter_ms=config.get('MODEL_STUB_LATENCY_JITTER_MS', 300),
+            tokens_per_second=config.get('MODEL_STUB_TOKENS_PER_SECOND', 150),
+            error_rate=config.get('MODEL_STUB_ERROR_RATE', 0.0),
+            quota_error_rate=config.get('MODEL_STUB_QUOTA_ERROR_RATE', 0.0),
+            seed=config.get('MODEL_STUB_SEED', 42),
+            script_path=config.get('MODEL_STUB_SCRIPT')
+        )
+    if backend_name != 'gemini':
+        raise ValueError(f"MODEL_BACKEND desconocido: '{backend_name}' (opciones: gemini, stub).")
+    return GeminiBackend(api_key)
+
+
+if __name__ == '__main__':
+    # Demostración: conversación completa contra el modelo local, sin red ni clave de API
+    # (desde backend/: python -m core.model_backends)
+    logging.basicConfig(level=logging.WARNING)
+    from core.context_protocol import ModelContextProtocol
+
+    backend = LocalStubBackend(latency_ms=200, latency_jitter_ms=50, tokens_per_second=400)
+    mcp = ModelContextProtocol(api_key="", backend=backend)
+    for query in ["¿Qué es un escaneo de puertos?", "escanea 10.0.0.0/30"]:
+        start = time.monotonic()
+        answer = mcp.ask_gemini("Responder al usuario", "Comando de usuario", query, "Respuesta breve")
+        print(f"{(time.monotonic() - start) * 1000:6.0f} ms  {query!r} -> {answer}")
+    start = time.monotonic()
+    summary = mcp.inject_tool_results_into_chat(
+        {"action_completed": "start_network_scan", "hosts": ["10.0.0.1", "10.0.0.2"], "cves": ["CVE-2023-38408"]},
+        "Resume el escaneo.", on_token=lambda text: None
+    )
+    print(f"{(time.monotonic() - start) * 1000:6.0f} ms  resumen -> {summary}")
+    services = json.dumps([{"id": "s0", "service_name": "telnet", "port": 23}, {"id": "s1", "service_name": "ssh", "version": "OpenSSH 9.6"}])
+    print(mcp.generate_stateless(f"[DATOS_ENTRADA]:\n{services}\n", response_mime_type="application/json"))
+    print(backend.get_stats())
@@ -0,0 +1,154 @@
+# src/core/model_call_guard.py
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from typing import Dict, Any, Callable, Deque, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ModelDeadlineExceeded(TimeoutError):
+    """La llamada al modelo (y su réplica, si la hubo) no terminó dentro del plazo."""
+
+
+class ModelCallGuard:
+    """
+    Plazo máximo y réplica (hedging) para las llamadas al modelo.
+
+    Cada llamada se ejecuta en un hilo y se espera como mucho `deadline_seconds`; al vencer se lanza
+    ModelDeadlineExceeded (AICallExecutor no la reintenta) y la llamada abandonada termina en segundo
+    plano. Las llamadas en curso, abandonadas incluidas, ocupan una de las `max_workers` plazas: cuando
+    no quedan, las nuevas esperan plaza dentro de su propio plazo en lugar de encolarse en el pool
+    detrás de las abandonadas (y la réplica no se lanza). Si hay modelo de réplica y la llamada
+    principal supera el percentil `hedge_percentile` de las latencias recientes de ese tipo de llamada,
+    se lanza una segunda petición al modelo de réplica y se usa la primera respuesta que llegue.
+    Mientras no hay muestras suficientes se usa `initial_hedge_delay_seconds`.
+    """
+    def __init__(self, deadline_seconds: Optional[float] = 30, hedge_model_name: Optional[str] = None,
+                 hedge_percentile: float = 95, initial_hedge_delay_seconds: float = 5, min_hedge_delay_seconds: float = 0.5,
+                 min_samples: int = 20, window: int = 200, max_workers: int = 32):
+        """
+        :param deadline_seconds: Plazo de cada llamada, réplica incluida (None = sin plazo).
+        :param hedge_model_name: Modelo más rápido para la réplica (None = sin réplica).
+        :param hedge_percentile: Percentil de latencia de la llamada principal a partir del cual se lanza la réplica.
+        :param window: Latencias recientes que se conservan por tipo de llamada.
+        :param max_workers: Llamadas al modelo en curso como máximo (abandonadas incluidas).
+        """
+        self.deadline_seconds = deadline_seconds
+        self.hedge_model_name = hedge_model_name
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay_seconds = initial_hedge_delay_seconds
+        self.min_hedge_delay_seconds = min_hedge_delay_seconds
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+        # Una plaza por hilo del pool: se libera cuando la llamada termina, aunque se haya abandonado
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._abandoned = 0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0, "failed": 0, "hedge_skipped": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _record_latency(self, kind: str, started: float, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=self.window)).append(time.monotonic() - started)
+
+    def hedge_delay(self, kind: str) -> float:
+        """Segundos de espera antes de lanzar la réplica para este tipo de llamada."""
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        return self._percentile_delay(samples)
+
+    def _percentile_delay(self, samples) -> float:
+        if len(samples) < self.min_samples:
+            return self.initial_hedge_delay_seconds
+        index = min(len(samples) - 1, math.ceil(self.hedge_percentile / 100 * len(samples)) - 1)
+        return max(self.min_hedge_delay_seconds, samples[index])
+
+    def _submit(self, fn: Callable[[], T]) -> Future:
+        """Lanza `fn` en el pool; el llamador ya ha reservado una plaza, que se libera al terminar."""
+        # Con el contexto copiado, las llamadas conservan las etiquetas de métricas (llm_call_context)
+        future = self._pool.submit(contextvars.copy_context().run, fn)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _abandon(self, futures):
+        """Lleva la cuenta de las llamadas abandonadas que siguen ocupando plaza."""
+        with self._lock:
+            self._abandoned += len(futures)
+
+        def finished(_):
+            with self._lock:
+                self._abandoned -= 1
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def run(self, kind: str, primary: Callable[[], T], hedge: Optional[Callable[[], T]] = None) -> Tuple[T, bool]:
+        """
+        Ejecuta `primary` (y `hedge` si tarda) dentro del plazo. Retorna (resultado, si ganó la réplica).
+        Si ambas fallan se relanza el error de la principal; si vence el plazo, ModelDeadlineExceeded.
+        """
+        self._count("calls")
+        start = time.monotonic()
+        deadline = start + self.deadline_seconds if self.deadline_seconds else None
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic()) if deadline else None):
+            self._count("deadline_exceeded")
+            raise ModelDeadlineExceeded(f"La llamada '{kind}' al modelo no obtuvo plaza en {self.deadline_seconds}s "
+                                        f"({self._abandoned} llamadas abandonadas siguen en curso).")
+        primary_future = self._submit(primary)
+        # Las latencias de la principal se registran aunque se abandone, para que el percentil sea real
+        primary_future.add_done_callback(lambda future: self._record_latency(kind, start, future))
+        futures = {primary_future: False}
+
+        if hedge:
+            delay = self.hedge_delay(kind)
+            if deadline:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            done, _ = wait([primary_future], timeout=delay)
+            needs_hedge = not done or primary_future.exception() is not None
+            if needs_hedge and self._slots.acquire(blocking=False):
+                self._count("hedged")
+                logger.info(f"[ModelCallGuard] Llamada '{kind}' sin respuesta tras {delay:.2f}s: réplica con {self.hedge_model_name}.")
+                futures[self._submit(hedge)] = True
+            elif needs_hedge:
+                # Sin plazas libres la réplica solo añadiría otra petición en curso
+                self._count("hedge_skipped")
+
+        pending = set(futures)
+        while pending:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if futures[future]:
+                        self._count("hedge_wins")
+                    return future.result(), futures[future]
+
+        if pending:
+            self._count("deadline_exceeded")
+            self._abandon(pending)
+            raise ModelDeadlineExceeded(f"La llamada '{kind}' al modelo superó el plazo de {self.deadline_seconds}s.")
+        self._count("failed")
+        raise primary_future.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["abandoned_in_flight"] = self._abandoned
+            samples_by_kind = {kind: sorted(samples) for kind, samples in self._latencies.items()}
+        stats["hedge_delay_seconds"] = {kind: round(self._percentile_delay(samples), 3) for kind, samples in samples_by_kind.items()}
+        return stats
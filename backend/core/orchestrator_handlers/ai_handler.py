@@ -14,10 +14,11 @@ class AiHandler:
         self.get_gemini_chat_session = get_gemini_chat_session
         logger.info("[AiHandler] Inicializado.")
 
-    def process_tool_results_and_get_ai_response(self, tool_output_data: Dict[str, Any], user_follow_up_prompt: str = "", chat_session_id: str = None) -> Optional[str]:
+    def process_tool_results_and_get_ai_response(self, tool_output_data: Dict[str, Any], user_follow_up_prompt: str = "", chat_session_id: str = None,
+                                                 on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """
         Inyecta los resultados de una herramienta en el historial de chat de Gemini
-        y obtiene una respuesta de seguimiento de la IA.
+        y obtiene una respuesta de seguimiento de la IA (en streaming hacia `on_token` si se indica).
         """
         if chat_session_id is None:
             logger.error("chat_session_id es requerido para process_tool_results_and_get_ai_response.")
@@ -26,7 +27,7 @@ class AiHandler:
         model_context = self.get_gemini_chat_session(chat_session_id)
         logger.info(f"[AiHandler] Inyectando resultados de herramienta en el historial de Gemini para sesión {chat_session_id}...")
 
-        response = model_context.inject_tool_results_into_chat(tool_output_data, user_follow_up_prompt)
+        response = model_context.inject_tool_results_into_chat(tool_output_data, user_follow_up_prompt, on_token=on_token)
 
         if response:
             logger.info(f"[AiHandler] Respuesta de seguimiento de Gemini después de resultados de herramienta para sesión {chat_session_id}: {response}")
@@ -82,17 +83,3 @@ class AiHandler:
         )
 
         return {"response": response_text}
-
-    def process_general_query(self, user_query: str, chat_session_id: str) -> str:
-        """
-        Procesa una consulta de usuario general con la IA cuando no se detecta una acción específica.
-        """
-        model_context = self.get_gemini_chat_session(chat_session_id)
-        logger.info(f"[AiHandler] Procesando consulta general de usuario con IA para sesión {chat_session_id}: '{user_query}'")
-        ai_response = model_context.ask_gemini(
-            objective="Responder a la pregunta general del usuario.",
-            input_type="Consulta de usuario",
-            input_data=user_query,
-            response_requirements="Respuesta detallada y útil."
-        )
-        return ai_response
\ No newline at end of file
@@ -11,6 +11,8 @@ from core.context_protocol import ModelContextProtocol # Importar para type hint
 
 logger = logging.getLogger(__name__)
 
+FALLBACK_SUMMARY_NOTE = "No pude obtener a tiempo el resumen de la IA; este es un resumen automático de los resultados guardados:"
+
 class ReportHandler:
     def __init__(self, data_manager: DataManager, report_formatter: ReportFormatter, report_generator: ReportGenerator):
         self.data_manager = data_manager
@@ -43,16 +45,32 @@ class ReportHandler:
                 "findings": [{"title": f.get('title'), "severity": f.get('severity'), "description": f.get('description')} for f in findings]
             }
 
-            tool_output_content = json.dumps(formatted_results, indent=2)
-
+            # Se pasa el diccionario tal cual: la codificación la hace ModelContextProtocol (antes se serializaba dos veces)
             response_from_tool_injection = model_context.inject_tool_results_into_chat(
-                {"action_completed": "get_scan_results", "data": tool_output_content},
+                {"action_completed": "get_scan_results", "scan_id": scan_details['id'], **formatted_results},
                 f"He recuperado los detalles del escaneo. Por favor, genera un resumen conversacional de estos resultados para el usuario."
             )
-            return response_from_tool_injection if response_from_tool_injection else "Resultados recuperados, pero la IA no generó un resumen de seguimiento."
+            if response_from_tool_injection:
+                return response_from_tool_injection
+            return self.build_fallback_summary(scan_details['id']) or "Resultados recuperados, pero la IA no generó un resumen de seguimiento."
         else:
             return "No se encontraron resultados para el escaneo solicitado. Por favor, verifica el ID o nombre."
 
+    def build_fallback_summary(self, scan_id: int, cves_by_service: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Optional[str]:
+        """
+        Resumen determinista de un escaneo a partir de la base de datos, para responder en el chat
+        cuando el modelo falla o no responde dentro del plazo. Retorna None si el escaneo no existe.
+        """
+        scan_details = self.data_manager.get_scan_details(scan_id)
+        if not scan_details:
+            return None
+        hosts = self.data_manager.get_hosts_for_scan(scan_id)
+        services_by_host = {host['ip_address']: self.data_manager.get_services_for_host(host['id']) for host in hosts}
+        findings = self.data_manager.get_findings_for_scan(scan_id)
+        summary = self.report_formatter.format_scan_chat_summary(scan_details, hosts, services_by_host, findings, cves_by_service)
+        logger.info(f"[ReportHandler] Resumen determinista del escaneo {scan_id} generado sin IA.")
+        return f"{FALLBACK_SUMMARY_NOTE}\n\n{summary}"
+
     def generate_network_summary_report(self, scan_id: int, session_name: str, target: str, ai_summary: str) -> Optional[str]:
         """
         Genera un informe PDF de resumen de escaneo de red.
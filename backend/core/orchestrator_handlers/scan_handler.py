@@ -1,57 +1,289 @@
 # src/core/orchestrator_handlers/scan_handler.py
+import contextvars
+import ipaddress
 import logging
-from typing import Dict, Any, Optional, Callable, List
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, List, Tuple
 import json
 
 # Importar módulos necesarios
 from core.data_manager import DataManager
 from core.session_manager import SessionManager
 from utils.command_runner import CommandRunner
-from modules.nmap_tool.nmap_runner import NmapRunner
-from modules.nmap_tool.nmap_parser import NmapParser
+from modules.nmap_tool.rate_governor import ScanRateGovernor
+from modules.scan_engines.scanner_engine import NmapScannerEngine
+from modules.scan_engines.async_connect_scanner import AsyncConnectScanner, DEFAULT_CONNECT_PORTS
+from modules.scan_engines.banner_grabber import AsyncBannerGrabber, BannerCache
+from modules.ssh_inventory.ssh_inventory import SSHInventoryCollector, SSHConnectionPool
 from core.context_protocol import ModelContextProtocol
-# Importar el cliente NVD y la función para construir CPEs
-from modules.cve_lookup.nvd_client import SimpleNVDAPIClient, construct_cpe_name_simplified
+from core.model_backends import configured_model_id
+from core.analysis_cache import AnalysisCache
+from core.vulnerability_analyzer import BatchVulnerabilityAnalyzer
+from core.ai_call_executor import AICallExecutor
+from core.llm_metrics import llm_call_context
+from core.ai_analysis_queue import AIAnalysisQueue
+from core.scan_summarizer import ScanSummarizer
+from utils.prompts import VULNERABILITY_ANALYSIS_PROMPT_VERSION, BATCH_VULNERABILITY_ANALYSIS_PROMPT_VERSION
+# Importar el cliente NVD y la resolución de CVEs (API, caché y réplica local)
+from modules.cve_lookup.nvd_client import SimpleNVDAPIClient
+from modules.cve_lookup.cve_cache import CVECache
+from modules.cve_lookup.nvd_mirror import NVDMirror, LocalCVEMatcher
+from modules.cve_lookup.cve_resolver import CVEResolver
+from modules.cve_lookup.cpe_dictionary import CPEDictionary
+from modules.cve_lookup.cve_feed_sync import CVEFeedSync, package_cve_finding
+from utils.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# Perfiles que el motor 'connect' reproduce (descubrimiento TCP + Nmap para versiones/SO); el resto va entero a Nmap
+CONNECT_ENGINE_PROFILES = ('default_scan', 'service_detection', 'service_os_detection')
+
 class ScanHandler:
+    ANALYSIS_CACHE_NAMESPACE = "service_banner"
+    BATCH_ANALYSIS_CACHE_NAMESPACE = "service_banner_batch"
+
     def __init__(self, data_manager: DataManager, session_manager: SessionManager,
                  command_runner: CommandRunner,
                  get_gemini_chat_session: Callable[[str], ModelContextProtocol],
                  process_ai_analysis_with_tool_results: Callable[..., Optional[str]],
-                 vulnerability_analysis_prompt_template: str):
+                 vulnerability_analysis_prompt_template: str,
+                 config: Optional[Dict[str, Any]] = None,
+                 build_fallback_summary: Optional[Callable[..., Optional[str]]] = None):
         self.data_manager = data_manager
         self.session_manager = session_manager
         self.command_runner = command_runner
         self.get_gemini_chat_session = get_gemini_chat_session
         self._process_ai_analysis_with_tool_results = process_ai_analysis_with_tool_results
         self.vulnerability_analysis_prompt_template = vulnerability_analysis_prompt_template
+        self.config = config or {}
+        # Resumen sin IA (ReportHandler.build_fallback_summary) si el modelo no responde al terminar el escaneo
+        self.build_fallback_summary = build_fallback_summary
+        # Modelo de las claves de caché de análisis: con MODEL_BACKEND 'stub' no es el de Gemini
+        self.model_id = configured_model_id(self.config)
         logger.info("[ScanHandler] Inicializado.")
 
-        self.nmap_runner = NmapRunner(command_runner=self.command_runner)
-        self.nmap_parser = NmapParser()
-        # Inicializar el cliente NVD
-        self.nvd_client = SimpleNVDAPIClient()
-        logger.info("[ScanHandler] Inicializado con NmapRunner, NmapParser y SimpleNVDAPIClient.")
-
-    def _analyze_service_banner(self, scan_id: int, host_id: int, service_id: int, service_data: Dict[str, Any], chat_session_id: str):
+        # Un único gobernador por ScanHandler: todos los escaneos concurrentes comparten el presupuesto de paquetes
+        self.rate_governor = ScanRateGovernor(
+            global_max_rate=self.config.get('NMAP_GLOBAL_MAX_RATE', 2000),
+            min_rate_per_scan=self.config.get('NMAP_MIN_RATE_PER_SCAN', 100),
+            max_rate_per_scan=self.config.get('NMAP_MAX_RATE_PER_SCAN', 1000),
+            max_scans_per_subnet=self.config.get('NMAP_MAX_SCANS_PER_SUBNET', 1),
+            max_parallelism=self.config.get('NMAP_MAX_PARALLELISM'),
+            acquire_timeout=self.config.get('NMAP_RATE_ACQUIRE_TIMEOUT_SECONDS')
+        )
+        self.nmap_engine = NmapScannerEngine(
+            command_runner=self.command_runner,
+            rate_governor=self.rate_governor,
+            shard_prefix=self.config.get('NMAP_SHARD_PREFIX', 26),
+            timeout=self.config.get('NMAP_TIMEOUT_SECONDS', 600),
+            max_concurrent_shards=self.config.get('NMAP_MAX_CONCURRENT_SHARDS'),
+            scan_deadline=self.config.get('NMAP_SCAN_DEADLINE_SECONDS')
+        )
+        # 'nmap': todo con Nmap. 'connect': descubrimiento con asyncio y Nmap solo para versiones/SO.
+        self.scan_engine_name = self.config.get('SCAN_ENGINE', 'nmap')
+        self.connect_engine = AsyncConnectScanner(
+            concurrency=self.config.get('CONNECT_SCAN_CONCURRENCY', 500),
+            timeout=self.config.get('CONNECT_SCAN_TIMEOUT_SECONDS', 1.0),
+            ports=self.config.get('CONNECT_SCAN_PORTS', DEFAULT_CONNECT_PORTS),
+            per_host_concurrency=self.config.get('CONNECT_SCAN_PER_HOST_CONCURRENCY', 100),
+            rate_governor=self.rate_governor,
+            shard_prefix=self.config.get('NMAP_SHARD_PREFIX', 26)
+        )
+        self.service_detection_profile = self.config.get('CONNECT_SCAN_DETECTION_PROFILE', 'service_detection')
+        # Identificación por banners antes de recurrir a Nmap -sV (solo con el motor 'connect')
+        self.banner_grabber = None
+        if self.config.get('BANNER_GRAB_ENABLED', True):
+            self.banner_grabber = AsyncBannerGrabber(
+                concurrency=self.config.get('BANNER_GRAB_CONCURRENCY', 200),
+                connect_timeout=self.config.get('BANNER_GRAB_CONNECT_TIMEOUT_SECONDS', 2.0),
+                read_timeout=self.config.get('BANNER_GRAB_READ_TIMEOUT_SECONDS', 2.0),
+                cache=BannerCache(ttl_hours=self.config.get('BANNER_CACHE_TTL_HOURS', 168)),
+                rate_governor=self.rate_governor,
+                shard_prefix=self.config.get('NMAP_SHARD_PREFIX', 26)
+            )
+        # Inventario autenticado por SSH (opcional): paquetes instalados y SO real de cada host
+        self.inventory_collector = None
+        if self.config.get('SSH_INVENTORY_ENABLED', False):
+            self.inventory_collector = SSHInventoryCollector(
+                data_manager=self.data_manager,
+                pool=SSHConnectionPool(
+                    connect_timeout=self.config.get('SSH_INVENTORY_CONNECT_TIMEOUT_SECONDS', 10),
+                    trust_on_first_use=self.config.get('SSH_INVENTORY_TRUST_ON_FIRST_USE', False)
+                ),
+                max_workers=self.config.get('SSH_INVENTORY_MAX_WORKERS', 10)
+            )
+        # Inicializar el cliente NVD con caché persistente (positiva y negativa) de respuestas
+        self.cve_cache = CVECache(
+            ttl_hours=self.config.get('NVD_CACHE_TTL_HOURS', 24),
+            negative_ttl_hours=self.config.get('NVD_CACHE_NEGATIVE_TTL_HOURS', 6)
+        )
+        # La cuota del NVD depende de la clave (NVD_API_KEY en el .env): 5 o 50 peticiones por 30 s
+        nvd_api_key = os.getenv('NVD_API_KEY')
+        nvd_rate_limit = self.config.get('NVD_RATE_LIMIT_REQUESTS')
+        self.nvd_client = SimpleNVDAPIClient(
+            cache=self.cve_cache,
+            api_key=nvd_api_key,
+            rate_limiter=TokenBucket(rate=nvd_rate_limit, per_seconds=self.config.get('NVD_RATE_LIMIT_WINDOW_SECONDS', 30), capacity=1) if nvd_rate_limit else None,
+            max_retries=self.config.get('NVD_MAX_RETRIES', 4),
+            timeout=self.config.get('NVD_REQUEST_TIMEOUT_SECONDS', 10),
+            pool_size=self.config.get('CVE_LOOKUP_WORKERS', 8)
+        )
+        # 'online': API del NVD. 'offline': solo la réplica local. 'hybrid': réplica local y API para productos que no contiene.
+        self.cve_lookup_mode = self.config.get('CVE_LOOKUP_MODE', 'online')
+        self.nvd_mirror = NVDMirror(db_name=self.config.get('NVD_MIRROR_DB', 'nvd_mirror.db'))
+        self.local_cve_matcher = None
+        if self.cve_lookup_mode in ('offline', 'hybrid'):
+            self.local_cve_matcher = LocalCVEMatcher(self.nvd_mirror)
+        # Diccionario CPE local: traduce el producto que reporta Nmap al vendor/product real del NVD
+        self.cpe_dictionary = CPEDictionary() if self.config.get('CPE_DICTIONARY_ENABLED', True) else None
+        self.cve_resolver = CVEResolver(self._lookup_cves_for_cpe, max_workers=self.config.get('CVE_LOOKUP_WORKERS', 8),
+                                        cpe_dictionary=self.cpe_dictionary)
+        # Re-cruce incremental de los servicios guardados con los CVEs publicados después del escaneo
+        self.cve_feed_sync = CVEFeedSync(
+            data_manager=self.data_manager,
+            mirror=self.nvd_mirror,
+            nvd_client=self.nvd_client if self.cve_lookup_mode != 'offline' else None,
+            cpe_dictionary=self.cpe_dictionary,
+            initial_lookback_days=self.config.get('CVE_SYNC_INITIAL_LOOKBACK_DAYS', 7)
+        )
+        # Caché de análisis IA de banners (invalidar con: python -m core.analysis_cache invalidate)
+        self.analysis_cache = None
+        if self.config.get('AI_ANALYSIS_CACHE_ENABLED', True):
+            self.analysis_cache = AnalysisCache(ttl_hours=self.config.get('AI_ANALYSIS_CACHE_TTL_HOURS', 720))
+        # Análisis de banners por lotes en llamadas sin estado (fuera del historial del chat del usuario)
+        self.batch_analysis_enabled = self.config.get('AI_BATCH_ANALYSIS_ENABLED', True)
+        # Llamadas concurrentes al modelo con cuota RPM/TPM compartida entre escaneos
+        self.ai_executor = AICallExecutor(
+            max_workers=self.config.get('AI_MAX_CONCURRENT_CALLS', 4),
+            requests_per_minute=self.config.get('AI_REQUESTS_PER_MINUTE', 15),
+            tokens_per_minute=self.config.get('AI_TOKENS_PER_MINUTE'),
+            max_retries=self.config.get('AI_MAX_RETRIES', 4)
+        )
+        # Resumen final: 'single' (una llamada con todo), 'hierarchical' (map-reduce por subredes) o
+        # 'auto' (jerárquico cuando los resultados superan SCAN_SUMMARY_SINGLE_MAX_TOKENS)
+        self.scan_summary_mode = self.config.get('SCAN_SUMMARY_MODE', 'auto')
+        # Análisis aplazados por cuota agotada, pendientes de completar
+        self.ai_analysis_queue = AIAnalysisQueue()
+        self._deferred_analysis_lock = threading.Lock()
+        # Sincronización de CVEs: un ciclo a la vez y el resumen del último, para consultarlo tras lanzarla en segundo plano
+        self._cve_sync_lock = threading.Lock()
+        self.last_cve_sync_summary: Optional[Dict[str, Any]] = None
+        logger.info(f"[ScanHandler] Inicializado con motor de escaneo '{self.scan_engine_name}' y búsqueda de CVEs '{self.cve_lookup_mode}'.")
+
+    def _lookup_cves_for_cpe(self, cpe_name: str) -> List[Dict[str, Any]]:
         """
-        Analiza un banner de servicio usando la IA para detectar posibles vulnerabilidades.
+        Busca los CVEs de un CPE según CVE_LOOKUP_MODE. Retorna la lista resumida
+        (formato de parse_and_summarize_cve_data) ordenada por CVSS descendente, vacía si no hay resultados.
         """
-        model_context = self.get_gemini_chat_session(chat_session_id)
+        max_cves = self.config.get('NVD_MAX_CVES_PER_SERVICE')
+        if self.local_cve_matcher and (self.cve_lookup_mode == 'offline' or self.local_cve_matcher.knows_product(cpe_name)):
+            return self.local_cve_matcher.search_cpe(cpe_name)[:max_cves]
+        if self.cve_lookup_mode == 'offline':
+            return []
+        return self.nvd_client.search_all_cves(
+            cpe_name,
+            max_results=max_cves,
+            page_size=self.config.get('NVD_RESULTS_PER_PAGE', 500),
+            parallel_pages=self.config.get('NVD_PARALLEL_PAGES', 3)
+        )
 
-        objective = f"Analizar el banner/versión del servicio {service_data.get('service_name')} en puerto {service_data.get('port')} para posibles vulnerabilidades."
-        input_data = f"Servicio: {service_data.get('service_name')}\nPuerto: {service_data.get('port')}\nProtocolo: {service_data.get('protocol')}\nVersión: {service_data.get('version')}\nEstado: {service_data.get('state')}"
+    def run_cve_feed_sync(self, delta_files: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta un ciclo de sincronización incremental de CVEs sobre los servicios ya guardados
+        (sin contactar con los objetivos). Solo se ejecuta un ciclo a la vez: dos ciclos simultáneos
+        podrían registrar el mismo hallazgo dos veces. Retorna el resumen del ciclo.
+        """
+        if not self._cve_sync_lock.acquire(blocking=False):
+            return {"status": "already_running", "last_summary": self.last_cve_sync_summary}
+        try:
+            return self._cve_feed_sync_cycle(delta_files)
+        finally:
+            self._cve_sync_lock.release()
 
-        ai_response = model_context.ask_gemini(
-            objective=objective,
-            input_type="Información de servicio/banner",
-            input_data=input_data,
-            response_requirements=self.vulnerability_analysis_prompt_template
+    def start_cve_feed_sync(self) -> Dict[str, Any]:
+        """
+        Lanza la sincronización de CVEs en segundo plano (la descarga de ventanas del NVD puede tardar minutos).
+        Retorna si se ha lanzado o si ya había una en curso, con el resumen del último ciclo.
+        """
+        if not self._cve_sync_lock.acquire(blocking=False):
+            return {"status": "already_running", "last_summary": self.last_cve_sync_summary}
+
+        def run():
+            try:
+                self._cve_feed_sync_cycle()
+            except Exception:
+                pass  # Ya registrado y guardado en last_cve_sync_summary
+            finally:
+                self._cve_sync_lock.release()
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True, name="cve-feed-sync").start()
+        return {"status": "started", "last_summary": self.last_cve_sync_summary}
+
+    def get_cve_sync_status(self) -> Dict[str, Any]:
+        return {"running": self._cve_sync_lock.locked(), "last_summary": self.last_cve_sync_summary}
+
+    def _cve_feed_sync_cycle(self, delta_files: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Un ciclo de CVEFeedSync (con el cerrojo ya tomado). Guarda su resumen en last_cve_sync_summary."""
+        try:
+            summary = self.cve_feed_sync.run_cycle(delta_files=delta_files)
+        except Exception as e:
+            logger.error(f"[ScanHandler] Error en la sincronización de CVEs: {e}")
+            self.last_cve_sync_summary = {"status": "error", "error": str(e)}
+            raise
+        if self.local_cve_matcher and summary['cves_changed']:
+            # La réplica ha cambiado: los criterios memorizados por producto ya no son válidos
+            self.local_cve_matcher.clear_cache()
+        self.last_cve_sync_summary = {"status": "ok", **summary}
+        return self.last_cve_sync_summary
+
+    def _analyze_service_banner(self, scan_id: int, host_id: int, service_id: int, service_data: Dict[str, Any], chat_session_id: str,
+                                cache_stats: Optional[Dict[str, int]] = None):
+        """
+        Analiza un banner de servicio usando la IA para detectar posibles vulnerabilidades.
+        Los análisis ya hechos para el mismo (servicio, versión, protocolo, versión del prompt, modelo)
+        se reutilizan desde la caché; solo los fallos de caché llegan a Gemini.
+        """
+        cache_key = AnalysisCache.make_key(
+            service_data.get('service_name'), service_data.get('version'), service_data.get('protocol'),
+            VULNERABILITY_ANALYSIS_PROMPT_VERSION, self.model_id
         )
-
-        parsed_finding = self._parse_ai_vulnerability_response(ai_response)
+        cached = self.analysis_cache.get(self.ANALYSIS_CACHE_NAMESPACE, cache_key) if self.analysis_cache else None
+        if cached:
+            ai_response, parsed_finding = cached['ai_response'], cached['parsed_finding']
+            if cache_stats is not None:
+                cache_stats['hits'] += 1
+                cache_stats['calls_saved'] += 1
+        else:
+            model_context = self.get_gemini_chat_session(chat_session_id)
+
+            objective = f"Analizar el banner/versión del servicio {service_data.get('service_name')} en puerto {service_data.get('port')} para posibles vulnerabilidades."
+            input_data = f"Servicio: {service_data.get('service_name')}\nPuerto: {service_data.get('port')}\nProtocolo: {service_data.get('protocol')}\nVersión: {service_data.get('version')}\nEstado: {service_data.get('state')}"
+
+            # Llamada sin estado: durante el escaneo el chat tiene pendiente la llamada a start_network_scan
+            # y no debe recibir otros mensajes hasta que se responda con sus resultados
+            prompt = model_context.build_prompt(objective, "Información de servicio/banner", input_data,
+                                                self.vulnerability_analysis_prompt_template)
+            try:
+                with llm_call_context(scan_id=scan_id, purpose="banner_analysis"):
+                    ai_response = model_context.generate_stateless(prompt)
+            except Exception as e:
+                logger.error(f"[ScanHandler] Error al analizar el servicio {service_data.get('service_name')} con IA: {e}")
+                ai_response = f"Error al comunicarse con la IA: {e}"
+            parsed_finding = self._parse_ai_vulnerability_response(ai_response) if isinstance(ai_response, str) else None
+            if cache_stats is not None:
+                cache_stats['misses'] += 1
+                cache_stats['model_calls'] += 1
+            # Solo se guardan respuestas estructuradas: una respuesta fallida se vuelve a pedir la próxima vez
+            if parsed_finding and self.analysis_cache:
+                self.analysis_cache.store(self.ANALYSIS_CACHE_NAMESPACE, cache_key,
+                                          {"ai_response": ai_response, "parsed_finding": parsed_finding})
+
+        self._record_ai_finding(scan_id, host_id, service_id, service_data, parsed_finding, ai_response)
+
+    def _record_ai_finding(self, scan_id: int, host_id: int, service_id: int, service_data: Dict[str, Any],
+                           parsed_finding: Optional[Dict[str, Any]], ai_response: Any):
+        """Registra el hallazgo estructurado de la IA para un servicio (o avisa si no lo hay)."""
         if parsed_finding:
             host_info = self.data_manager.get_host(host_id)
             service_info = self.data_manager.get_service(service_id)
@@ -71,6 +303,148 @@ class ScanHandler:
         else:
             logger.warning(f"ADVERTENCIA: La IA no pudo generar un hallazgo estructurado para el servicio {service_data.get('service_name')}.")
 
+    def _analyze_services_in_batches(self, services: List[Dict[str, Any]], chat_session_id: str,
+                                     cache_stats: Dict[str, int]) -> Dict[str, int]:
+        """
+        Analiza servicios por lotes: agrupa por banner (servicio, versión, protocolo), reutiliza la caché
+        y envía los banners restantes a la IA en llamadas sin estado, concurrentes y limitadas por la cuota.
+        Cada hallazgo se registra en cuanto termina su lote; los servicios aplazados por cuota agotada
+        pasan a la cola persistente (ai_analysis_queue) para completarse más tarde.
+        :param services: [{"scan_id", "host_id", "service_id", "port_info"}] (más "queue_id" si vienen de la cola).
+        :param cache_stats: {"hits", "misses"} en servicios; "calls_saved" cuenta los banners distintos servidos
+                            desde la caché y "model_calls" las llamadas que hizo realmente el analizador.
+        :return: {"recorded", "failed", "deferred"} en número de servicios.
+        """
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for service in services:
+            port_info = service['port_info']
+            cache_key = AnalysisCache.make_key(
+                port_info.get('service_name'), port_info.get('version'), port_info.get('protocol'),
+                BATCH_VULNERABILITY_ANALYSIS_PROMPT_VERSION, self.model_id
+            )
+            groups.setdefault(cache_key, []).append(service)
+
+        summary = {"recorded": 0, "failed": 0, "deferred": 0}
+
+        def record_group(cache_key: str, parsed_finding: Optional[Dict[str, Any]]):
+            group = groups[cache_key]
+            for service in group:
+                self._record_ai_finding(service['scan_id'], service['host_id'], service['service_id'], service['port_info'], parsed_finding,
+                                        json.dumps(parsed_finding, ensure_ascii=False) if parsed_finding else None)
+            queue_ids = [service['queue_id'] for service in group if service.get('queue_id')]
+            if parsed_finding:
+                summary['recorded'] += len(group)
+                self.ai_analysis_queue.mark_done(queue_ids)
+            else:
+                summary['failed'] += len(group)
+                self.ai_analysis_queue.mark_failed(queue_ids, "La IA no devolvió un hallazgo válido.")
+
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        for cache_key, group in groups.items():
+            cached = self.analysis_cache.get(self.BATCH_ANALYSIS_CACHE_NAMESPACE, cache_key) if self.analysis_cache else None
+            if cached:
+                cache_stats['hits'] += len(group)
+                cache_stats['calls_saved'] += 1
+                record_group(cache_key, cached['parsed_finding'])
+            else:
+                pending[cache_key] = group
+        if not pending:
+            return summary
+
+        # Ids cortos en el prompt; la clave de la caché identifica el banner
+        item_ids = {f"s{index}": cache_key for index, cache_key in enumerate(pending)}
+        analyzer = BatchVulnerabilityAnalyzer(
+            generate=self.get_gemini_chat_session(chat_session_id).generate_stateless,
+            max_batch_size=self.config.get('AI_BATCH_MAX_SERVICES', 20),
+            max_input_tokens=self.config.get('AI_BATCH_MAX_INPUT_TOKENS', 6000),
+            max_retries=self.config.get('AI_BATCH_MAX_RETRIES', 2),
+            executor=self.ai_executor
+        )
+
+        def on_results(batch_results: Dict[str, Dict[str, Any]]):
+            for item_id, parsed_finding in batch_results.items():
+                cache_key = item_ids[item_id]
+                if self.analysis_cache:
+                    self.analysis_cache.store(self.BATCH_ANALYSIS_CACHE_NAMESPACE, cache_key,
+                                              {"ai_response": json.dumps(parsed_finding, ensure_ascii=False), "parsed_finding": parsed_finding})
+                record_group(cache_key, parsed_finding)
+
+        # Los servicios aplazados pueden venir de varios escaneos: solo se etiqueta el escaneo si es uno
+        scan_ids = {service['scan_id'] for service in services}
+        with llm_call_context(scan_id=next(iter(scan_ids)) if len(scan_ids) == 1 else None, purpose="banner_analysis"):
+            results = analyzer.analyze({item_id: pending[cache_key][0]['port_info'] for item_id, cache_key in item_ids.items()},
+                                       on_results=on_results)
+        for item_id, parsed_finding in results.items():
+            if parsed_finding is None:
+                record_group(item_ids[item_id], None)
+        deferred_keys = {item_ids[item_id] for item_id in analyzer.deferred}
+        for cache_key, group in pending.items():
+            if cache_key in deferred_keys:
+                # Se contarán cuando la cola complete el análisis aplazado
+                continue
+            # Los servicios con el mismo banner que uno ya enviado cuentan como aciertos
+            cache_stats['misses'] += 1
+            cache_stats['hits'] += len(group) - 1
+        cache_stats['model_calls'] += analyzer.stats['calls']
+
+        deferred_services = [service for cache_key in deferred_keys for service in pending[cache_key]]
+        if deferred_services:
+            summary['deferred'] = len(deferred_services)
+            error = "Cuota del modelo agotada."
+            self.ai_analysis_queue.mark_deferred([s['queue_id'] for s in deferred_services if s.get('queue_id')], error)
+            self.ai_analysis_queue.enqueue([s for s in deferred_services if not s.get('queue_id')], error)
+
+        logger.info(f"[ScanHandler] Análisis IA por lotes: {len(pending)} banners distintos en {analyzer.stats['calls']} llamadas "
+                    f"({analyzer.stats['retried_items']} reintentados, {analyzer.stats['failed_items']} sin hallazgo, "
+                    f"{summary['deferred']} servicios aplazados). Ejecutor: {self.ai_executor.get_metrics()}")
+        return summary
+
+    def _needs_hierarchical_summary(self, tool_output: Dict[str, Any]) -> bool:
+        if self.scan_summary_mode != 'auto':
+            return self.scan_summary_mode == 'hierarchical'
+        size = len(json.dumps(tool_output, ensure_ascii=False, default=str)) // 4
+        return size > self.config.get('SCAN_SUMMARY_SINGLE_MAX_TOKENS', 3000)
+
+    def _summarize_hierarchically(self, tool_output: Dict[str, Any], hosts: Dict[str, Any], cves_by_service: Dict[str, List[Dict[str, Any]]],
+                                  findings: List[Dict[str, Any]], chat_session_id: str) -> Dict[str, Any]:
+        """
+        Sustituye el detalle de hosts, CVEs y hallazgos de `tool_output` por resúmenes por subred (ver core/scan_summarizer.py)
+        y unos totales de la red, de modo que el resumen final en el chat recibe una entrada acotada.
+        """
+        summarizer = ScanSummarizer(
+            generate=self.get_gemini_chat_session(chat_session_id).generate_stateless,
+            executor=self.ai_executor,
+            cache=self.analysis_cache,
+            model_name=self.model_id,
+            max_input_tokens=self.config.get('SCAN_SUMMARY_MAX_INPUT_TOKENS', 6000),
+            subnet_prefix=self.config.get('SCAN_SUMMARY_SUBNET_PREFIX', 24),
+            summary_max_words=self.config.get('SCAN_SUMMARY_MAX_WORDS', 150)
+        )
+        host_records = summarizer.build_host_records(hosts, cves_by_service, findings)
+        summarized = {k: v for k, v in tool_output.items() if k not in ("parsed_data_summary", "vulnerabilities_found")}
+        summarized["network_totals"] = summarizer.network_totals(host_records, cves_by_service)
+        summarized["subnet_summaries"] = summarizer.summarize(host_records)
+        summarized["summary_mode"] = "hierarchical"
+        return summarized
+
+    def process_deferred_ai_analyses(self, chat_session_id: str, limit: int = 200) -> Dict[str, Any]:
+        """
+        Completa los análisis aplazados por cuota agotada (cola persistente), registrando sus hallazgos
+        en los escaneos originales. Retorna el resumen y el estado de la cola.
+        """
+        if not self._deferred_analysis_lock.acquire(blocking=False):
+            return {"status": "already_running", "queue": self.ai_analysis_queue.get_stats()}
+        try:
+            pending = self.ai_analysis_queue.get_pending(limit)
+            summary = {"recorded": 0, "failed": 0, "deferred": 0}
+            if pending:
+                logger.info(f"[ScanHandler] Procesando {len(pending)} análisis IA aplazados...")
+                summary = self._analyze_services_in_batches(pending, chat_session_id,
+                                                           {"hits": 0, "misses": 0, "calls_saved": 0, "model_calls": 0})
+            return {"status": "ok", **summary, "queue": self.ai_analysis_queue.get_stats()}
+        finally:
+            self._deferred_analysis_lock.release()
+
     def _parse_ai_vulnerability_response(self, ai_response: str) -> Optional[Dict[str, Any]]:
         """
         Método auxiliar para parsear la respuesta JSON de la IA (copiado de Orchestrator).
@@ -95,11 +469,174 @@ class ScanHandler:
             logger.error(f"ERROR inesperado al procesar respuesta de IA: {e}. Respuesta: {ai_response[:200]}...")
             return None
 
-    def start_network_scan(self, target: str, session_name: str, chat_session_id: str, nmap_profile: str = 'default_scan') -> Dict[str, Any]:
+    def _run_discovery(self, target: str, nmap_profile: str) -> Dict[str, Any]:
+        """
+        Ejecuta el descubrimiento con el motor configurado. Con el motor 'connect', los puertos
+        abiertos se descubren con AsyncConnectScanner y Nmap solo identifica versiones/SO
+        sobre esos puertos. Ambos caminos devuelven la misma estructura parseada.
+        Los perfiles que el motor 'connect' no puede reproducir (UDP, scripts, solo SO) se ejecutan
+        completos con Nmap.
+        """
+        if self.scan_engine_name != 'connect':
+            return self.nmap_engine.scan(target, profile=nmap_profile)
+        if nmap_profile not in CONNECT_ENGINE_PROFILES:
+            logger.info(f"[ScanHandler] El perfil '{nmap_profile}' no es compatible con el motor 'connect'. Se ejecuta con Nmap.")
+            return self.nmap_engine.scan(target, profile=nmap_profile)
+
+        discovery = self.connect_engine.scan(target)
+        if not discovery["success"] or not discovery["parsed"]["hosts"]:
+            return discovery
+        banner_info = self._identify_with_banners(discovery["parsed"]["hosts"]) if self.banner_grabber else {}
+        # 'default_scan' usa el perfil de detección configurado; los perfiles de detección se respetan
+        detection_profile = self.service_detection_profile if nmap_profile == 'default_scan' else nmap_profile
+        return self._enrich_with_service_detection(discovery, banner_info, detection_profile)
+
+    def _identify_with_banners(self, hosts: Dict[str, Any]) -> Dict[tuple, Dict[str, Any]]:
+        """
+        Lee los banners de todos los puertos abiertos en paralelo y rellena service_name/version
+        de los que se identifican por huella o por caché. Retorna la información por (ip, puerto).
+        """
+        targets = [(ip, p['port']) for ip, host_data in hosts.items() for p in host_data.get('ports', [])]
+        banner_info = self.banner_grabber.identify(targets)
+        for ip, host_data in hosts.items():
+            for port_info in host_data.get('ports', []):
+                info = banner_info.get((ip, port_info['port']))
+                if info and info["source"]:
+                    port_info['service_name'] = info["service_name"]
+                    port_info['version'] = info["version"]
+        return banner_info
+
+    def _enrich_with_service_detection(self, discovery: Dict[str, Any], banner_info: Optional[Dict[tuple, Dict[str, Any]]] = None,
+                                       detection_profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Lanza Nmap (perfil de detección de servicios) solo sobre los puertos que encontró el
+        escaneo connect y que no se identificaron por banner. Los hosts de la misma subred
+        (NMAP_SHARD_PREFIX) con el mismo conjunto de puertos se agrupan en una sola invocación,
+        cuyas IPs negocian juntas con el ScanRateGovernor. Si Nmap falla, se conservan los datos
+        del descubrimiento. Las versiones obtenidas se guardan en la caché de banners.
+        """
+        banner_info = banner_info or {}
+        hosts = discovery["parsed"]["hosts"]
+        shard_prefix = self.config.get('NMAP_SHARD_PREFIX', 26) or 32
+        hosts_by_group: Dict[tuple, List[str]] = {}
+        for ip, host_data in hosts.items():
+            port_set = tuple(
+                p['port'] for p in host_data.get('ports', [])
+                if not banner_info.get((ip, p['port']), {}).get("source")
+            )
+            address = ipaddress.ip_address(ip)
+            subnet = ipaddress.ip_network(f"{ip}/{min(shard_prefix, address.max_prefixlen)}", strict=False)
+            hosts_by_group.setdefault((subnet, port_set), []).append(ip)
+
+        stdout_parts = [discovery["stdout"]]
+        for (_, port_set), ips in hosts_by_group.items():
+            if not port_set:
+                continue
+            detection = self.nmap_engine.scan(
+                " ".join(ips),
+                ports=",".join(str(p) for p in port_set),
+                profile=detection_profile or self.service_detection_profile
+            )
+            if not detection["success"]:
+                logger.warning(f"[ScanHandler] La detección de servicios con Nmap falló para {ips}. Se conservan los datos del escaneo connect.")
+                continue
+            stdout_parts.append(detection["stdout"])
+
+            for ip in ips:
+                detected_host = detection["parsed"]["hosts"].get(ip)
+                if not detected_host:
+                    continue
+                detected_ports = {p['port']: p for p in detected_host.get('ports', [])}
+                hosts[ip]['ports'] = [detected_ports.get(p['port'], p) for p in hosts[ip]['ports']]
+                self._remember_detected_versions(ip, detected_ports, banner_info)
+                hosts[ip]['os_info'] = detected_host.get('os_info') or hosts[ip].get('os_info')
+                if detected_host.get('hostname') and detected_host['hostname'] != ip:
+                    hosts[ip]['hostname'] = detected_host['hostname']
+
+        return {
+            "success": True,
+            "stdout": "\n".join(stdout_parts),
+            "stderr": discovery["stderr"],
+            "parsed": {"hosts": hosts}
+        }
+
+    def _remember_detected_versions(self, ip: str, detected_ports: Dict[int, Dict[str, Any]], banner_info: Dict[tuple, Dict[str, Any]]):
+        """Guarda en la caché de banners las versiones que identificó Nmap para no volver a sondearlas."""
+        if not self.banner_grabber or not self.banner_grabber.cache:
+            return
+        for port, port_info in detected_ports.items():
+            banner_hash = banner_info.get((ip, port), {}).get("banner_hash")
+            if banner_hash and port_info.get('version') not in (None, '', 'N/A'):
+                self.banner_grabber.cache.store(ip, port, banner_hash, port_info.get('service_name'), port_info['version'], 'nmap')
+
+    def _collect_authenticated_inventory(self, scan_id: int, parsed_nmap_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Recoge por SSH el inventario de paquetes de los hosts con el puerto SSH abierto.
+        Las credenciales se leen de la configuración (usuario) y del entorno (contraseña/clave).
+        """
+        if not self.inventory_collector:
+            return None
+        username = self.config.get('SSH_INVENTORY_USERNAME') or os.getenv('SSH_INVENTORY_USERNAME')
+        password = os.getenv('SSH_INVENTORY_PASSWORD')
+        key_filename = self.config.get('SSH_INVENTORY_KEY_FILE') or os.getenv('SSH_INVENTORY_KEY_FILE')
+        if not username or not (password or key_filename):
+            logger.warning("[ScanHandler] Inventario SSH habilitado pero sin credenciales configuradas. Se omite.")
+            return None
+
+        ssh_port = self.config.get('SSH_INVENTORY_PORT', 22)
+        ssh_hosts = []
+        for host_ip, host_data in parsed_nmap_data.get('hosts', {}).items():
+            if any(p['port'] == ssh_port and p.get('state') == 'open' for p in host_data.get('ports', [])):
+                host_record = self.data_manager.get_host_by_ip_and_scan_id(host_ip, scan_id)
+                if host_record:
+                    ssh_hosts.append(host_record)
+
+        logger.info(f"[ScanHandler] Recogiendo inventario autenticado por SSH de {len(ssh_hosts)} hosts...")
+        return self.inventory_collector.collect(ssh_hosts, username=username, password=password, key_filename=key_filename, port=ssh_port)
+
+    def _packages_to_resolve(self, scan_id: int) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """
+        Paquetes instalados del escaneo que corresponden a un producto conocido, agrupados por el par
+        (service_name, version) que resuelve CVEResolver (ver CPEDictionary.package_service_key).
+        """
+        if not self.cpe_dictionary:
+            logger.warning("[ScanHandler] Sin diccionario CPE (CPE_DICTIONARY_ENABLED) no se cruzan los paquetes con CVEs.")
+            return {}
+        packages_by_key: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for package in self.data_manager.get_packages_for_scan(scan_id):
+            service_key = self.cpe_dictionary.package_service_key(package['name'], package['version'])
+            if service_key:
+                packages_by_key.setdefault(service_key, []).append(package)
+        return packages_by_key
+
+    def _record_package_cve_findings(self, packages_by_key: Dict[Tuple[str, str], List[Dict[str, Any]]],
+                                     resolved_cves: Dict[Tuple[str, str], List[Dict[str, Any]]]):
+        """Registra un hallazgo (type='cve') por cada CVE de cada paquete instalado, en su host."""
+        recorded = 0
+        for service_key, packages in packages_by_key.items():
+            for package in packages:
+                for cve in resolved_cves.get(service_key, []):
+                    self.data_manager.add_finding(**package_cve_finding(package, cve, "ssh_inventory"))
+                    recorded += 1
+        if recorded:
+            logger.info(f"[ScanHandler] {recorded} hallazgos de CVEs registrados en paquetes del inventario autenticado.")
+
+    def start_network_scan(self, target: str, session_name: str, chat_session_id: str, nmap_profile: str = 'default_scan',
+                           progress_callback: Optional[Callable[[str], None]] = None,
+                           on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         Ejecuta un escaneo de red utilizando Nmap, procesa los resultados,
         busca CVEs para los servicios descubiertos y delega el análisis de vulnerabilidades a la IA.
+        :param progress_callback: Recibe un mensaje de estado al comenzar cada etapa (ej. para el chat en streaming).
+        :param on_token: Recibe los fragmentos del resumen final de la IA a medida que se generan.
         """
+        def report_progress(message: str):
+            if progress_callback:
+                try:
+                    progress_callback(message)
+                except Exception as e:
+                    logger.warning(f"[ScanHandler] Error al notificar el progreso: {e}")
+
         logger.info(f"[ScanHandler] Iniciando nuevo escaneo de red: Objetivo='{target}', Sesión='{session_name}'")
 
         scan_id = self.data_manager.create_scan_session(session_name, "Network Scan", target, status='in_progress')
@@ -109,27 +646,33 @@ class ScanHandler:
 
         self.session_manager.start_new_scan_session(scan_id, session_name, "Network Scan", target)
 
-        logger.info(f"[ScanHandler] Ejecutando Nmap con perfil '{nmap_profile}' en {target}...")
-        nmap_command = self.nmap_runner.build_command(target, profile=nmap_profile)
-        nmap_result = self.command_runner.run_command(nmap_command, timeout=600)
+        logger.info(f"[ScanHandler] Ejecutando escaneo (motor '{self.scan_engine_name}', perfil '{nmap_profile}') en {target}...")
+        report_progress(f"Ejecutando {self.scan_engine_name} en {target}...")
+        nmap_result = self._run_discovery(target, nmap_profile)
 
-        if not nmap_result.success:
-            logger.error(f"ERROR: Nmap falló para {target}. STDERR:\n{nmap_result.stderr}")
-            error_summary = f"El escaneo Nmap falló para {target}: {nmap_result.stderr}"
+        if not nmap_result["success"]:
+            logger.error(f"ERROR: Nmap falló para {target}. STDERR:\n{nmap_result['stderr']}")
+            error_summary = f"El escaneo Nmap falló para {target}: {nmap_result['stderr']}"
             self.data_manager.update_scan_session(scan_id, status='failed', summary=error_summary)
-            self._process_ai_analysis_with_tool_results(
-                {"action": "start_network_scan_failed", "target": target, "error": nmap_result.stderr},
-                f"El escaneo en {target} falló. ¿Cómo puedo ayudarte con esto? Necesito un nuevo objetivo o un tipo de análisis diferente.",
-                chat_session_id
-            )
+            with llm_call_context(scan_id=scan_id, purpose="scan_summary"):
+                self._process_ai_analysis_with_tool_results(
+                    {"action": "start_network_scan_failed", "target": target, "error": nmap_result['stderr']},
+                    f"El escaneo en {target} falló. ¿Cómo puedo ayudarte con esto? Necesito un nuevo objetivo o un tipo de análisis diferente.",
+                    chat_session_id
+                )
             return {"status": "error", "message": error_summary, "scan_id": scan_id}
 
         logger.info(f"[ScanHandler] Nmap completado. Procesando resultados...")
+        report_progress("Escaneo completado. Registrando hosts y servicios...")
 
-        parsed_nmap_data = self.nmap_parser.parse_nmap_output(nmap_result.stdout)
+        parsed_nmap_data = nmap_result["parsed"]
 
         hosts_found_count = 0
         all_cves_found: Dict[str, List[Dict[str, Any]]] = {} # Para almacenar CVEs por servicio (ej. "OpenSSH 5.3p1")
+        services_to_resolve = set() # Pares (service_name, version) distintos de todo el escaneo
+        service_ids_by_key: Dict[Tuple[str, str], List[int]] = {} # Servicios guardados de cada par, para recordar sus CVEs
+        services_to_analyze: List[Dict[str, Any]] = [] # Servicios para el análisis IA por lotes
+        cve_cache_stats_before = self.cve_cache.get_stats()
 
         if parsed_nmap_data and parsed_nmap_data.get('hosts'):
             for host_ip, host_data in parsed_nmap_data['hosts'].items():
@@ -158,46 +701,67 @@ class ScanHandler:
                                 service_db_id
                             )
 
-                            # --- NUEVA LÓGICA: BÚSQUEDA DE CVES ---
-                            service_name = port_info.get('service_name')
-                            service_version = port_info.get('version')
-
-                            if service_name and service_version:
-                                logger.info(f"[ScanHandler] Buscando CVEs para {service_name} {service_version}...")
-                                cpe_attempts = []
-                                # Intentar con la versión exacta primero
-                                cpe_exact = construct_cpe_name_simplified(service_name, service_version, generic=False)
-                                if cpe_exact:
-                                    cpe_attempts.append(cpe_exact)
-                                
-                                # Si no se encontró nada con la exacta, intentar con una versión genérica
-                                cpe_generic = construct_cpe_name_simplified(service_name, service_version, generic=True)
-                                if cpe_generic and cpe_generic != cpe_exact: # Evitar duplicados si la versión genérica es igual a la exacta
-                                    cpe_attempts.append(cpe_generic)
-
-                                cves_for_current_service = []
-                                for cpe_to_search in cpe_attempts:
-                                    raw_cve_data = self.nvd_client.search_cve(cpe_to_search)
-                                    if raw_cve_data:
-                                        summarized_cves = self.nvd_client.parse_and_summarize_cve_data(raw_cve_data)
-                                        if summarized_cves:
-                                            cves_for_current_service.extend(summarized_cves)
-                                            logger.info(f"CVEs encontrados para {service_name} {service_version} (CPE: {cpe_to_search}): {[c['cve_id'] for c in summarized_cves]}")
-                                            break # Si encontramos CVEs con un CPE, no necesitamos probar los demás
-                                    else:
-                                        logger.debug(f"No se obtuvieron resultados del NVD para CPE: {cpe_to_search}")
-                                
-                                if cves_for_current_service:
-                                    service_key = f"{service_name} {service_version}"
-                                    all_cves_found[service_key] = cves_for_current_service
-                                else:
-                                    logger.info(f"No se encontraron CVEs para {service_name} {service_version}.")
-                            # --- FIN NUEVA LÓGICA: BÚSQUEDA DE CVES ---
+                            # Los CVEs se resuelven después, una vez por versión de software distinta
+                            service_key = (port_info.get('service_name'), port_info.get('version'))
+                            services_to_resolve.add(service_key)
+                            service_ids_by_key.setdefault(service_key, []).append(service_db_id)
+                            if self.batch_analysis_enabled:
+                                services_to_analyze.append({"scan_id": scan_id, "host_id": host_db_id, "service_id": service_db_id, "port_info": port_info})
 
         logger.info(f"[ScanHandler] Se encontraron y registraron {hosts_found_count} hosts activos.")
 
-        if parsed_nmap_data and parsed_nmap_data.get('hosts'):
+        # --- ANÁLISIS IA POR LOTES: en segundo plano, solapado con la búsqueda de CVEs y el inventario ---
+        analysis_cache_stats = {"hits": 0, "misses": 0, "calls_saved": 0, "model_calls": 0}
+        ai_analysis_future = None
+        if services_to_analyze:
+            logger.info(f"[ScanHandler] Iniciando análisis de vulnerabilidades con IA para {len(services_to_analyze)} servicios (en segundo plano)...")
+            ai_analysis_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-analysis")
+            # Con el contexto copiado, las llamadas del hilo conservan las etiquetas de métricas (ej. chat_session_id)
+            ai_analysis_future = ai_analysis_runner.submit(contextvars.copy_context().run, self._analyze_services_in_batches,
+                                                           services_to_analyze, chat_session_id, analysis_cache_stats)
+            ai_analysis_runner.shutdown(wait=False)
+            report_progress(f"Analizando {len(services_to_analyze)} servicios con IA...")
+
+        # --- INVENTARIO AUTENTICADO: antes de los CVEs, para cruzar también los paquetes instalados ---
+        inventory_summary = self._collect_authenticated_inventory(scan_id, parsed_nmap_data)
+        packages_to_resolve: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        if inventory_summary and inventory_summary['packages_count']:
+            packages_to_resolve = self._packages_to_resolve(scan_id)
+            logger.info(f"[ScanHandler] {len(packages_to_resolve)} versiones de paquetes conocidos del inventario se cruzarán con CVEs.")
+            services_to_resolve.update(packages_to_resolve)
+
+        # --- BÚSQUEDA DE CVES: una vez por (servicio, versión), en paralelo ---
+        if services_to_resolve:
+            report_progress(f"Buscando CVEs para {len(services_to_resolve)} versiones de software...")
+        resolved_cves = self.cve_resolver.resolve(services_to_resolve)
+        for (service_name, service_version), cves in resolved_cves.items():
+            all_cves_found[f"{service_name} {service_version}"] = cves
+        self._record_package_cve_findings(packages_to_resolve, resolved_cves)
+        # Los CVEs de los servicios solo se muestran en el resumen: se recuerdan para que la sincronización no los repita
+        self.data_manager.add_service_scan_cves([
+            (service_id, cve['cve_id'])
+            for service_key, service_ids in service_ids_by_key.items()
+            for cve in resolved_cves.get(service_key, [])
+            for service_id in service_ids
+        ])
+        cve_cache_stats = {k: v - cve_cache_stats_before[k] for k, v in self.cve_cache.get_stats().items()}
+        logger.info(f"[ScanHandler] Caché de CVEs en este escaneo: {cve_cache_stats['hits']} aciertos, "
+                    f"{cve_cache_stats['negative_hits']} aciertos negativos, {cve_cache_stats['misses']} consultas al NVD.")
+        logger.info(f"[ScanHandler] Métricas acumuladas del cliente NVD: {self.nvd_client.get_metrics()}")
+
+        if ai_analysis_future and not ai_analysis_future.done():
+            report_progress("Esperando a que termine el análisis de vulnerabilidades con IA...")
+
+        ai_analysis_summary = None
+        if ai_analysis_future:
+            try:
+                ai_analysis_summary = ai_analysis_future.result()
+            except Exception as e:
+                # Un fallo del análisis IA no debe invalidar el escaneo ni los CVEs ya obtenidos
+                logger.error(f"[ScanHandler] Error en el análisis IA por lotes: {e}")
+        if not self.batch_analysis_enabled and parsed_nmap_data and parsed_nmap_data.get('hosts'):
             logger.info("[ScanHandler] Iniciando análisis de vulnerabilidades para servicios descubiertos (AI)...")
+            report_progress("Analizando servicios con IA...")
             for host_ip, host_data in parsed_nmap_data['hosts'].items():
                 host_record = self.data_manager.get_host_by_ip_and_scan_id(host_ip, scan_id)
                 if host_record:
@@ -211,17 +775,21 @@ class ScanHandler:
                     if service_record:
                         service_db_id = service_record['id']
                         logger.info(f"[ScanHandler] Analizando servicio {port_info.get('service_name')}:{port_info['port']} en {host_ip} con IA...")
-                        self._analyze_service_banner(scan_id, host_db_id, service_db_id, port_info, chat_session_id)
+                        self._analyze_service_banner(scan_id, host_db_id, service_db_id, port_info, chat_session_id, analysis_cache_stats)
                     else:
                         logger.warning(f"ADVERTENCIA: No se pudo encontrar DB ID para servicio {port_info.get('service_name')}:{port_info['port']} en {host_ip}. Saltando análisis.")
 
+        analyzed = analysis_cache_stats['hits'] + analysis_cache_stats['misses']
+        if analyzed:
+            logger.info(f"[ScanHandler] Caché de análisis IA: {analysis_cache_stats['hits']}/{analyzed} aciertos "
+                        f"({analysis_cache_stats['hits'] / analyzed:.0%}), {analysis_cache_stats['calls_saved']} llamadas a Gemini ahorradas, "
+                        f"{analysis_cache_stats['model_calls']} realizadas.")
 
         tool_output = {
             "action_completed": "start_network_scan",
             "target": target,
             "scan_id": scan_id,
             "hosts_found_count": hosts_found_count,
-            "nmap_raw_output": nmap_result.stdout, # Considerar si esto es demasiado verbose
             "parsed_data_summary": {
                 "hosts": [
                     {"ip": ip, "ports": [p['port'] for p in host_data.get('ports', [])]}
@@ -239,24 +807,60 @@ class ScanHandler:
                 host_ip = finding.get('details', {}).get('host_info', {}).get('ip_address', 'N/A')
                 service_name = finding.get('details', {}).get('service_info', {}).get('service_name', 'N/A')
                 port = finding.get('details', {}).get('service_info', {}).get('port', 'N/A')
+                package_info = finding.get('details', {}).get('package_info')
 
                 formatted_findings.append({
                     "vulnerability": finding.get('description'),
                     "impact": finding.get('severity'),
                     "recommendation": finding.get('recommendation'),
                     "target_host": host_ip,
-                    "target_service": f"{service_name}:{port}"
+                    "target_service": f"paquete {package_info['name']} {package_info['version']}" if package_info else f"{service_name}:{port}"
                 })
 
         tool_output["vulnerabilities_found"] = formatted_findings
-
+        if analyzed:
+            tool_output["ai_analysis_cache"] = {
+                "hits": analysis_cache_stats['hits'],
+                "misses": analysis_cache_stats['misses'],
+                "hit_rate": round(analysis_cache_stats['hits'] / analyzed, 3),
+                # En modo por lotes un acierto por servicio no equivale a una llamada: se informa por banner y por llamada real
+                "gemini_calls_saved": analysis_cache_stats['calls_saved'],
+                "gemini_calls_made": analysis_cache_stats['model_calls']
+            }
+        if ai_analysis_summary and ai_analysis_summary['deferred']:
+            tool_output["ai_analysis_deferred"] = {
+                "services": ai_analysis_summary['deferred'],
+                "reason": "Cuota del modelo agotada; los análisis se completarán más tarde desde la cola persistente."
+            }
+        elif self.config.get('AI_QUEUE_DRAIN_AFTER_SCAN', True) and self.ai_analysis_queue.get_stats()['pending']:
+            # Hay cuota disponible: se completan en segundo plano los análisis aplazados de escaneos anteriores
+            threading.Thread(target=contextvars.copy_context().run, args=(self.process_deferred_ai_analyses, chat_session_id),
+                             daemon=True, name="ai-analysis-queue").start()
+        if inventory_summary:
+            tool_output["authenticated_inventory"] = {k: v for k, v in inventory_summary.items() if k != 'errors'}
+
+        if self._needs_hierarchical_summary(tool_output):
+            # Escaneo grande: un único prompt con todo desbordaría el contexto (o se recortaría)
+            report_progress(f"Resumiendo los resultados de {hosts_found_count} hosts por subredes...")
+            with llm_call_context(scan_id=scan_id):
+                tool_output = self._summarize_hierarchically(tool_output, parsed_nmap_data.get('hosts', {}), all_cves_found,
+                                                             formatted_findings, chat_session_id)
+
+        report_progress("Generando resumen del escaneo...")
         # Usa la función inyectada para comunicar los resultados a la IA
         # IMPORTANTE: Modificamos el prompt para que la IA sepa que hay CVEs
-        ai_summary_for_chat = self._process_ai_analysis_with_tool_results(
-            tool_output,
-            f"El escaneo de red en {target} ha finalizado. Se han procesado los hallazgos de vulnerabilidades y se han buscado CVEs para los servicios descubiertos. Por favor, genera un resumen conversacional y útil para el usuario, destacando los hosts, servicios, cualquier vulnerabilidad detectada (incluyendo los CVEs si se encontraron) y sus mitigaciones. Si se encontraron CVEs, menciona que el usuario puede preguntar sobre ellos por su ID (ej. '¿Qué es CVE-2007-2768?').",
-            chat_session_id
-        )
+        follow_up = f"El escaneo de red en {target} ha finalizado. Se han procesado los hallazgos de vulnerabilidades y se han buscado CVEs para los servicios descubiertos. Por favor, genera un resumen conversacional y útil para el usuario, destacando los hosts, servicios, cualquier vulnerabilidad detectada (incluyendo los CVEs si se encontraron) y sus mitigaciones. Si se encontraron CVEs, menciona que el usuario puede preguntar sobre ellos por su ID (ej. '¿Qué es CVE-2007-2768?')."
+        if tool_output.get("summary_mode") == "hierarchical":
+            follow_up += " Los resultados vienen resumidos por subred (subnet_summaries), con los totales de toda la red en network_totals."
+        with llm_call_context(scan_id=scan_id, purpose="scan_summary"):
+            ai_summary_for_chat = self._process_ai_analysis_with_tool_results(
+                tool_output,
+                follow_up,
+                chat_session_id,
+                on_token=on_token
+            )
+        if not ai_summary_for_chat and self.build_fallback_summary:
+            ai_summary_for_chat = self.build_fallback_summary(scan_id, all_cves_found)
         if not ai_summary_for_chat:
             ai_summary_for_chat = f"El escaneo de {target} ha finalizado y se encontraron {hosts_found_count} hosts, pero no pude generar un resumen detallado con la IA."
 
@@ -0,0 +1,303 @@
+# src/core/scan_summarizer.py
+import ipaddress
+import json
+import logging
+import threading
+import time
+from concurrent.futures import as_completed
+from typing import Dict, Any, Callable, List, Optional
+
+from core.ai_call_executor import AICallExecutor
+from core.analysis_cache import AnalysisCache
+from core.llm_metrics import llm_call_context
+from core.vulnerability_analyzer import estimate_tokens
+from utils.prompts import (SCAN_SUMMARY_PROMPT_VERSION, SCAN_SUMMARY_SYSTEM_PROMPT,
+                           SCAN_CHUNK_SUMMARY_PROMPT_TEMPLATE, SCAN_SUMMARY_REDUCE_PROMPT_TEMPLATE)
+
+logger = logging.getLogger(__name__)
+
+MAP_CACHE_NAMESPACE = "scan_summary_map"
+REDUCE_CACHE_NAMESPACE = "scan_summary_reduce"
+MAX_REDUCE_LEVELS = 6
+
+
+def _cvss(cve: Dict[str, Any]) -> float:
+    try:
+        return float(cve.get('cvss_score'))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ScanSummarizer:
+    """
+    Resumen jerárquico (map-reduce) de escaneos grandes. Los hosts se agrupan por subred y cada grupo
+    se resume en una llamada sin estado (map), en paralelo y con caché por contenido: un grupo sin
+    cambios entre escaneos no vuelve a llamar al modelo. Los resúmenes parciales se combinan por lotes
+    (reduce) hasta que caben en el presupuesto, de modo que ninguna llamada supera `max_input_tokens`
+    con independencia del tamaño del escaneo. Si una llamada falla, el grupo se resume sin la IA.
+    """
+    def __init__(self, generate: Callable[..., str], executor: Optional[AICallExecutor] = None,
+                 cache: Optional[AnalysisCache] = None, model_name: Optional[str] = None,
+                 max_input_tokens: int = 6000, subnet_prefix: int = 24, summary_max_words: int = 150,
+                 max_cves_per_host: int = 10, max_ports_per_host: int = 50):
+        """
+        :param generate: Función (prompt, system_instruction=...) -> texto, ej. ModelContextProtocol.generate_stateless.
+        :param max_input_tokens: Presupuesto aproximado de tokens de entrada por llamada (map y reduce),
+                                 y tamaño máximo del conjunto de resúmenes devuelto.
+        :param subnet_prefix: Los hosts se agrupan por subred de este prefijo (IPv4) antes de repartirlos por tamaño.
+        :param summary_max_words: Longitud pedida para cada resumen parcial.
+        """
+        self.generate = generate
+        self.executor = executor
+        self.cache = cache
+        self.model_name = model_name
+        self.max_input_tokens = max_input_tokens
+        self.subnet_prefix = subnet_prefix
+        self.summary_max_words = summary_max_words
+        self.max_cves_per_host = max_cves_per_host
+        self.max_ports_per_host = max_ports_per_host
+        self._lock = threading.Lock()
+        self.stats = {"map_calls": 0, "reduce_calls": 0, "cache_hits": 0, "fallbacks": 0, "levels": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    # --- Datos de entrada ---
+
+    def build_host_records(self, hosts: Dict[str, Any], cves_by_service: Dict[str, List[Dict[str, Any]]],
+                           findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Registro compacto por host a partir de los datos del escaneo (hosts parseados, CVEs por "servicio versión"
+        y hallazgos con target_host/target_service). Los CVEs se ordenan por CVSS y se limitan por host.
+        """
+        findings_by_host: Dict[str, List[Dict[str, Any]]] = {}
+        for finding in findings:
+            findings_by_host.setdefault(finding.get('target_host'), []).append(
+                {k: finding.get(k) for k in ("target_service", "impact", "vulnerability")}
+            )
+
+        records = []
+        for ip, host_data in hosts.items():
+            ports = [p for p in host_data.get('ports', []) if p.get('state', 'open') == 'open']
+            cves = {}
+            for port in ports:
+                for cve in cves_by_service.get(f"{port.get('service_name')} {port.get('version')}", []):
+                    cves.setdefault(cve['cve_id'], {"id": cve['cve_id'], "cvss": cve.get('cvss_score'),
+                                                    "servicio": f"{port.get('service_name')}:{port['port']}"})
+            ranked_cves = sorted(cves.values(), key=lambda cve: _cvss({"cvss_score": cve['cvss']}), reverse=True)
+            record = {
+                "ip": ip,
+                "puertos": [
+                    " ".join(str(v) for v in (f"{p['port']}/{p.get('protocol') or 'tcp'}", p.get('service_name'), p.get('version'))
+                             if v not in (None, '', 'N/A'))
+                    for p in ports[:self.max_ports_per_host]
+                ],
+                "cves": ranked_cves[:self.max_cves_per_host],
+            }
+            if len(ports) > self.max_ports_per_host:
+                record["puertos_omitidos"] = len(ports) - self.max_ports_per_host
+            if len(ranked_cves) > self.max_cves_per_host:
+                record["cves_omitidos"] = len(ranked_cves) - self.max_cves_per_host
+            if host_data.get('hostname') and host_data['hostname'] != ip:
+                record["hostname"] = host_data['hostname']
+            if host_data.get('os_info'):
+                record["so"] = host_data['os_info']
+            if findings_by_host.get(ip):
+                record["hallazgos"] = findings_by_host[ip]
+            records.append(record)
+        return records
+
+    @staticmethod
+    def network_totals(host_records: List[Dict[str, Any]], cves_by_service: Dict[str, List[Dict[str, Any]]],
+                       top_cves: int = 10) -> Dict[str, Any]:
+        """Totales deterministas de la red (no dependen de la IA): se envían junto a los resúmenes."""
+        all_cves = {cve['cve_id']: cve for cves in cves_by_service.values() for cve in cves}
+        by_severity: Dict[str, int] = {}
+        for cve in all_cves.values():
+            severity = str(cve.get('cvss_severity') or 'N/A')
+            by_severity[severity] = by_severity.get(severity, 0) + 1
+        findings_by_impact: Dict[str, int] = {}
+        for record in host_records:
+            for finding in record.get('hallazgos', []):
+                impact = str(finding.get('impact') or 'N/A')
+                findings_by_impact[impact] = findings_by_impact.get(impact, 0) + 1
+        return {
+            "hosts": len(host_records),
+            "puertos_abiertos": sum(len(r['puertos']) + r.get('puertos_omitidos', 0) for r in host_records),
+            "cves_distintos": len(all_cves),
+            "cves_por_severidad": by_severity,
+            "hallazgos_por_impacto": findings_by_impact,
+            "cves_mas_graves": [{"id": cve['cve_id'], "cvss": cve.get('cvss_score')}
+                                for cve in sorted(all_cves.values(), key=_cvss, reverse=True)[:top_cves]],
+        }
+
+    def _group_label(self, ip: str) -> str:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return "otros"
+        prefix = self.subnet_prefix if address.version == 4 else 64
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    def build_chunks(self, host_records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Grupos por subred, partidos para que cada prompt de map respete el presupuesto de tokens."""
+        template_tokens = estimate_tokens(SCAN_SUMMARY_SYSTEM_PROMPT + SCAN_CHUNK_SUMMARY_PROMPT_TEMPLATE)
+        by_subnet: Dict[str, List[Dict[str, Any]]] = {}
+        for record in host_records:
+            by_subnet.setdefault(self._group_label(record['ip']), []).append(record)
+
+        chunks = []
+        for subnet, records in sorted(by_subnet.items()):
+            parts, current, current_tokens = [], [], template_tokens
+            for record in records:
+                record_tokens = estimate_tokens(json.dumps(record, ensure_ascii=False))
+                if current and current_tokens + record_tokens > self.max_input_tokens:
+                    parts.append(current)
+                    current, current_tokens = [], template_tokens
+                current.append(record)
+                current_tokens += record_tokens
+            if current:
+                parts.append(current)
+            for index, part in enumerate(parts):
+                label = subnet if len(parts) == 1 else f"{subnet} (parte {index + 1}/{len(parts)})"
+                chunks.append({"grupo": label, "hosts": part})
+        return chunks
+
+    # --- Llamadas ---
+
+    def _cached_generate(self, namespace: str, prompt: str, purpose: str) -> str:
+        cache_key = AnalysisCache.make_key(namespace, SCAN_SUMMARY_PROMPT_VERSION, self.model_name, prompt)
+        cached = self.cache.get(namespace, cache_key) if self.cache else None
+        if cached:
+            self._count("cache_hits")
+            return cached['summary']
+        self._count("map_calls" if namespace == MAP_CACHE_NAMESPACE else "reduce_calls")
+        with llm_call_context(purpose=purpose):
+            if self.executor:
+                summary = self.executor.call(self.generate, prompt, system_instruction=SCAN_SUMMARY_SYSTEM_PROMPT,
+                                             estimated_tokens=estimate_tokens(prompt) + 2 * self.summary_max_words)
+            else:
+                summary = self.generate(prompt, system_instruction=SCAN_SUMMARY_SYSTEM_PROMPT)
+        summary = (summary or "").strip()
+        if summary and self.cache:
+            self.cache.store(namespace, cache_key, {"summary": summary})
+        return summary
+
+    def _fallback_chunk_summary(self, chunk: Dict[str, Any]) -> str:
+        """Resumen sin la IA de un grupo cuya llamada falló: los datos más graves, sin redactar."""
+        hosts = chunk['hosts']
+        cves = sorted((cve for record in hosts for cve in record['cves']), key=lambda cve: _cvss({"cvss_score": cve['cvss']}), reverse=True)
+        findings = [f"{record['ip']} {finding.get('target_service')}: {finding.get('vulnerability')} ({finding.get('impact')})"
+                    for record in hosts for finding in record.get('hallazgos', [])]
+        lines = [f"{len(hosts)} hosts ({', '.join(record['ip'] for record in hosts[:10])}{'...' if len(hosts) > 10 else ''})."]
+        if cves:
+            lines.append("CVEs más graves: " + ", ".join(f"{cve['id']} (CVSS {cve['cvss']}, {cve['servicio']})" for cve in cves[:5]) + ".")
+        if findings:
+            lines.append("Hallazgos: " + "; ".join(findings[:5]) + ".")
+        return " ".join(lines)
+
+    def _summarize_chunk(self, chunk: Dict[str, Any]) -> Dict[str, str]:
+        prompt = SCAN_CHUNK_SUMMARY_PROMPT_TEMPLATE.format(
+            group=chunk['grupo'], max_words=self.summary_max_words,
+            hosts_json=json.dumps(chunk['hosts'], ensure_ascii=False, separators=(",", ":"))
+        )
+        try:
+            summary = self._cached_generate(MAP_CACHE_NAMESPACE, prompt, "scan_summary_map")
+        except Exception as e:
+            logger.warning(f"[ScanSummarizer] Resumen del grupo {chunk['grupo']} fallido, se usa el resumen sin IA: {e}")
+            summary = ""
+        if not summary:
+            self._count("fallbacks")
+            summary = self._fallback_chunk_summary(chunk)
+        return {"grupo": chunk['grupo'], "resumen": summary}
+
+    def _reduce_batch(self, batch: List[Dict[str, str]]) -> Dict[str, str]:
+        label = batch[0]['grupo'] if len(batch) == 1 else f"{batch[0]['grupo']} … {batch[-1]['grupo']} ({len(batch)} grupos)"
+        if len(batch) == 1:
+            return {"grupo": label, "resumen": batch[0]['resumen']}
+        prompt = SCAN_SUMMARY_REDUCE_PROMPT_TEMPLATE.format(
+            max_words=self.summary_max_words * 2, summaries_json=json.dumps(batch, ensure_ascii=False, separators=(",", ":"))
+        )
+        try:
+            summary = self._cached_generate(REDUCE_CACHE_NAMESPACE, prompt, "scan_summary_reduce")
+        except Exception as e:
+            logger.warning(f"[ScanSummarizer] Combinación de {len(batch)} resúmenes fallida, se concatenan recortados: {e}")
+            summary = ""
+        if not summary:
+            self._count("fallbacks")
+            share = max(200, (self.max_input_tokens * 4) // (2 * len(batch)))
+            summary = " ".join(f"[{item['grupo']}] {item['resumen'][:share]}" for item in batch)
+        return {"grupo": label, "resumen": summary}
+
+    def _run(self, fn: Callable[[Any], Dict[str, str]], items: List[Any]) -> List[Dict[str, str]]:
+        """Aplica `fn` a cada elemento (en paralelo con el ejecutor) conservando el orden."""
+        if not self.executor:
+            return [fn(item) for item in items]
+        futures = {self.executor.submit(fn, item): index for index, item in enumerate(items)}
+        results: List[Optional[Dict[str, str]]] = [None] * len(items)
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+        return results
+
+    def _summaries_tokens(self, summaries: List[Dict[str, str]]) -> int:
+        return estimate_tokens(json.dumps(summaries, ensure_ascii=False, separators=(",", ":")))
+
+    def _reduce_batches(self, summaries: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        template_tokens = estimate_tokens(SCAN_SUMMARY_SYSTEM_PROMPT + SCAN_SUMMARY_REDUCE_PROMPT_TEMPLATE)
+        batches, current, current_tokens = [], [], template_tokens
+        for item in summaries:
+            item_tokens = self._summaries_tokens([item])
+            if current and current_tokens + item_tokens > self.max_input_tokens:
+                batches.append(current)
+                current, current_tokens = [], template_tokens
+            current.append(item)
+            current_tokens += item_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def summarize(self, host_records: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Resúmenes [{"grupo", "resumen"}] que en conjunto caben en `max_input_tokens`:
+        uno por grupo si ya caben, o los combinados por la reducción sucesiva.
+        """
+        start_time = time.time()
+        chunks = self.build_chunks(host_records)
+        summaries = self._run(self._summarize_chunk, chunks)
+        level = 0
+        while len(summaries) > 1 and self._summaries_tokens(summaries) > self.max_input_tokens and level < MAX_REDUCE_LEVELS:
+            level += 1
+            batches = self._reduce_batches(summaries)
+            if len(batches) == len(summaries):
+                # Cada resumen ocupa el presupuesto por sí solo: reducir no avanza
+                break
+            summaries = self._run(self._reduce_batch, batches)
+        self.stats["levels"] = level
+        if self._summaries_tokens(summaries) > self.max_input_tokens:
+            # Último recurso: recorte proporcional, para que el límite se cumpla siempre
+            share = max(100, (self.max_input_tokens * 4) // len(summaries) - 100)
+            summaries = [{"grupo": item['grupo'], "resumen": item['resumen'][:share]} for item in summaries]
+        logger.info(f"[ScanSummarizer] {len(host_records)} hosts en {len(chunks)} grupos -> {len(summaries)} resúmenes "
+                    f"({level} niveles de reducción) en {time.time() - start_time:.2f}s: {self.stats}")
+        return summaries
+
+
+if __name__ == '__main__':
+    # Demostración con un modelo simulado: 600 hosts en 3 subredes con un presupuesto pequeño
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    prompt_sizes = []
+
+    def fake_generate(prompt: str, system_instruction: str = None) -> str:
+        prompt_sizes.append(estimate_tokens(prompt))
+        items = prompt.count('"ip"') or prompt.count('"grupo"')
+        return f"Resumen simulado de {items} elementos. " + "Detalle " * 40
+
+    hosts = {f"10.0.{subnet}.{host}": {"ports": [{"port": 22, "protocol": "tcp", "service_name": "ssh", "version": "OpenSSH 7.4", "state": "open"}]}
+             for subnet in range(3) for host in range(1, 201)}
+    cves = {"ssh OpenSSH 7.4": [{"cve_id": "CVE-2018-15473", "cvss_score": 5.3, "cvss_severity": "MEDIUM"}]}
+    summarizer = ScanSummarizer(fake_generate, max_input_tokens=2000)
+    records = summarizer.build_host_records(hosts, cves, [])
+    result = summarizer.summarize(records)
+    print(json.dumps(summarizer.network_totals(records, cves), ensure_ascii=False))
+    print(f"{len(result)} resúmenes finales; prompt más grande: {max(prompt_sizes)} tokens estimados; {summarizer.stats}")
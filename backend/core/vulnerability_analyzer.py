@@ -0,0 +1,208 @@
+# src/core/vulnerability_analyzer.py
+import json
+import logging
+import threading
+import time
+from concurrent.futures import as_completed
+from typing import Dict, Any, Callable, List, Optional
+
+from core.ai_call_executor import AICallExecutor, AIQuotaExhaustedError
+from utils.prompts import BATCH_VULNERABILITY_ANALYSIS_SYSTEM_PROMPT, BATCH_VULNERABILITY_ANALYSIS_PROMPT_TEMPLATE
+
+logger = logging.getLogger(__name__)
+
+# Campos que se envían a la IA por cada servicio (el resto de port_info no aporta al análisis)
+SERVICE_FIELDS = ("service_name", "version", "protocol", "port")
+REQUIRED_FINDING_KEYS = ("vulnerability", "impact", "mitigations")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación aproximada (~4 caracteres por token), suficiente para repartir lotes."""
+    return len(text) // 4 + 1
+
+
+class BatchVulnerabilityAnalyzer:
+    """
+    Analiza varios servicios en una sola llamada a la IA: cada lote es un array JSON de servicios
+    con un id y la respuesta esperada es un array de hallazgos con el mismo id.
+    Las llamadas son sin estado (no pasan por el historial del chat del usuario). Los elementos
+    que faltan o no superan la validación se reintentan solos, en un lote nuevo.
+    Con un AICallExecutor los lotes se envían en paralelo respetando la cuota del modelo, y los
+    elementos cuyo lote agota la cuota quedan en `deferred` en lugar de darse por fallidos.
+    """
+    def __init__(self, generate: Callable[..., str], max_batch_size: int = 20, max_input_tokens: int = 6000,
+                 max_retries: int = 2, executor: Optional[AICallExecutor] = None):
+        """
+        :param generate: Función (prompt, system_instruction=..., response_mime_type=...) -> texto,
+                         ej. ModelContextProtocol.generate_stateless.
+        :param max_batch_size: Máximo de servicios por llamada.
+        :param max_input_tokens: Presupuesto aproximado de tokens de entrada por llamada.
+        :param max_retries: Reintentos para los elementos fallidos de un lote.
+        :param executor: Ejecutor compartido con límite de concurrencia y cuota (None = lotes en serie, sin límite).
+        """
+        self.generate = generate
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_input_tokens = max_input_tokens
+        self.max_retries = max_retries
+        self.executor = executor
+        self.deferred: List[str] = []
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failed_calls": 0, "items": 0, "retried_items": 0, "failed_items": 0, "deferred_items": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    @staticmethod
+    def _compact_service(item_id: str, service: Dict[str, Any]) -> Dict[str, Any]:
+        compact = {"id": item_id}
+        compact.update({field: service.get(field) for field in SERVICE_FIELDS if service.get(field) not in (None, "")})
+        return compact
+
+    def build_batches(self, items: Dict[str, Dict[str, Any]]) -> List[List[str]]:
+        """Reparte los ids en lotes que respetan el tamaño máximo y el presupuesto de tokens."""
+        template_tokens = estimate_tokens(BATCH_VULNERABILITY_ANALYSIS_SYSTEM_PROMPT + BATCH_VULNERABILITY_ANALYSIS_PROMPT_TEMPLATE)
+        batches, current, current_tokens = [], [], template_tokens
+        for item_id, service in items.items():
+            item_tokens = estimate_tokens(json.dumps(self._compact_service(item_id, service), ensure_ascii=False))
+            if current and (len(current) >= self.max_batch_size or current_tokens + item_tokens > self.max_input_tokens):
+                batches.append(current)
+                current, current_tokens = [], template_tokens
+            current.append(item_id)
+            current_tokens += item_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _extract_json_array(text: str) -> List[Any]:
+        text = text.strip()
+        if text.startswith('```'):
+            text = text.split('\n', 1)[1] if '\n' in text else ''
+            text = text.rsplit('```', 1)[0]
+        parsed = json.loads(text)
+        # Algunos modelos envuelven el array en un objeto ({"findings": [...]})
+        if isinstance(parsed, dict):
+            parsed = next((value for value in parsed.values() if isinstance(value, list)), None)
+        if not isinstance(parsed, list):
+            raise ValueError("La respuesta no es un array JSON.")
+        return parsed
+
+    @staticmethod
+    def validate_finding(finding: Any) -> Optional[Dict[str, Any]]:
+        """Retorna el hallazgo normalizado o None si no tiene el formato esperado."""
+        if not isinstance(finding, dict) or not all(finding.get(key) for key in REQUIRED_FINDING_KEYS):
+            return None
+        mitigations = finding['mitigations']
+        if isinstance(mitigations, str):
+            mitigations = [mitigations]
+        if not isinstance(mitigations, list):
+            return None
+        return {
+            "vulnerability": str(finding['vulnerability']),
+            "impact": str(finding['impact']),
+            "mitigations": [str(m) for m in mitigations]
+        }
+
+    def _analyze_batch(self, batch_ids: List[str], items: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Una llamada a la IA para un lote. Retorna solo los hallazgos válidos, por id."""
+        services_json = json.dumps([self._compact_service(item_id, items[item_id]) for item_id in batch_ids], ensure_ascii=False)
+        prompt = BATCH_VULNERABILITY_ANALYSIS_PROMPT_TEMPLATE.format(services_json=services_json)
+        self._count("calls")
+        try:
+            if self.executor:
+                # La respuesta ocupa aproximadamente lo mismo que la entrada: se reserva el doble de tokens
+                response_text = self.executor.call(self.generate, prompt, system_instruction=BATCH_VULNERABILITY_ANALYSIS_SYSTEM_PROMPT,
+                                                   response_mime_type="application/json", estimated_tokens=2 * estimate_tokens(prompt))
+            else:
+                response_text = self.generate(prompt, system_instruction=BATCH_VULNERABILITY_ANALYSIS_SYSTEM_PROMPT,
+                                              response_mime_type="application/json")
+            findings = self._extract_json_array(response_text)
+        except AIQuotaExhaustedError as e:
+            self._count("failed_calls")
+            with self._lock:
+                self.deferred.extend(batch_ids)
+            logger.warning(f"[BatchVulnerabilityAnalyzer] Cuota agotada: {len(batch_ids)} servicios aplazados ({e}).")
+            return {}
+        except Exception as e:
+            self._count("failed_calls")
+            logger.error(f"[BatchVulnerabilityAnalyzer] Lote de {len(batch_ids)} servicios fallido: {e}")
+            return {}
+
+        expected = set(batch_ids)
+        results: Dict[str, Dict[str, Any]] = {}
+        for finding in findings:
+            item_id = str(finding.get('id')) if isinstance(finding, dict) else None
+            if item_id not in expected or item_id in results:
+                continue
+            validated = self.validate_finding(finding)
+            if validated:
+                results[item_id] = validated
+        return results
+
+    def _run_batches(self, batches: List[List[str]], items: Dict[str, Dict[str, Any]],
+                     on_results: Optional[Callable[[Dict[str, Dict[str, Any]]], None]]) -> Dict[str, Dict[str, Any]]:
+        results: Dict[str, Dict[str, Any]] = {}
+        if self.executor:
+            futures = [self.executor.submit(self._analyze_batch, batch_ids, items) for batch_ids in batches]
+            batch_results = (future.result() for future in as_completed(futures))
+        else:
+            batch_results = (self._analyze_batch(batch_ids, items) for batch_ids in batches)
+        for batch_result in batch_results:
+            results.update(batch_result)
+            if on_results and batch_result:
+                on_results(batch_result)
+        return results
+
+    def analyze(self, items: Dict[str, Dict[str, Any]],
+                on_results: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        :param items: {id: datos del servicio (service_name, version, protocol, port)}.
+        :param on_results: Llamada con {id: hallazgo} en cuanto termina cada lote, para registrar los hallazgos sin esperar al resto.
+        :return: {id: hallazgo {"vulnerability", "impact", "mitigations"} o None si no se obtuvo tras los reintentos}.
+                 Los ids aplazados por cuota no aparecen en el resultado: quedan en `self.deferred`.
+        """
+        if not items:
+            return {}
+        start_time = time.time()
+        self._count("items", len(items))
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        pending = dict(items)
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                self._count("retried_items", len(pending))
+                logger.info(f"[BatchVulnerabilityAnalyzer] Reintento {attempt}: {len(pending)} servicios sin hallazgo válido.")
+            results.update(self._run_batches(self.build_batches(pending), pending, on_results))
+            # Con la cuota agotada no tiene sentido reintentar ahora: esos elementos se aplazan
+            pending = {item_id: service for item_id, service in pending.items()
+                       if item_id not in results and item_id not in self.deferred}
+
+        for item_id in pending:
+            results[item_id] = None
+        self._count("failed_items", len(pending))
+        self._count("deferred_items", len(set(self.deferred) & set(items)))
+        logger.info(f"[BatchVulnerabilityAnalyzer] {len(results) - len(pending)}/{len(items)} servicios analizados "
+                    f"en {time.time() - start_time:.2f}s ({self.stats['calls']} llamadas, {len(self.deferred)} aplazados).")
+        return results
+
+
+if __name__ == '__main__':
+    # Demostración con un modelo simulado que omite un servicio en la primera llamada
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    calls = []
+
+    def fake_generate(prompt: str, system_instruction: str = None, response_mime_type: str = None) -> str:
+        services = json.loads(prompt.split('[DATOS_ENTRADA]:', 1)[1].split('[REQUISITOS_RESPUESTA]', 1)[0])
+        calls.append(len(services))
+        answered = services[1:] if len(calls) == 1 else services
+        return json.dumps([{"id": s["id"], "vulnerability": f"Versión antigua de {s['service_name']}", "impact": "Medium",
+                            "mitigations": ["Actualizar"]} for s in answered])
+
+    demo_items = {f"s{i}": {"service_name": "ssh", "version": f"OpenSSH 7.{i}", "protocol": "tcp", "port": 22} for i in range(7)}
+    analyzer = BatchVulnerabilityAnalyzer(fake_generate, max_batch_size=5)
+    demo_results = analyzer.analyze(demo_items)
+    print(f"Llamadas (servicios por lote): {calls}")
+    print(f"Hallazgos válidos: {sum(1 for r in demo_results.values() if r)}/{len(demo_items)}")
+    print(f"Estadísticas: {analyzer.stats}")
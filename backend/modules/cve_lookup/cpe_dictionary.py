@@ -0,0 +1,353 @@
+# src/modules/cve_lookup/cpe_dictionary.py
+"""
+Diccionario local de productos CPE para traducir lo que reporta Nmap (service_name + VERSION)
+a un vendor/product real del NVD.
+
+Importar el diccionario oficial (feeds JSON 2.0 de productos CPE del NVD, .json o .json.gz):
+    python -m modules.cve_lookup.cpe_dictionary import nvdcpe-2.0-chunk-00001.json.gz ...
+Probar una resolución:
+    python -m modules.cve_lookup.cpe_dictionary resolve http "nginx 1.18.0 (Ubuntu)"
+"""
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from modules.cve_lookup.nvd_mirror import parse_cpe
+
+logger = logging.getLogger(__name__)
+
+# (part, vendor, product)
+CPEProduct = Tuple[str, str, str]
+
+# Alias conocidos: nombre de producto tal como lo escribe Nmap (o la tabla de huellas) -> producto CPE.
+# Tienen prioridad sobre el diccionario importado y funcionan aunque no se haya importado nada.
+SEED_ALIASES: Dict[str, CPEProduct] = {
+    "openssh": ("a", "openbsd", "openssh"),
+    "dropbear sshd": ("a", "dropbear_ssh_project", "dropbear_ssh"),
+    "apache httpd": ("a", "apache", "http_server"),
+    "apache tomcat": ("a", "apache", "tomcat"),
+    "nginx": ("a", "f5", "nginx"),
+    "lighttpd": ("a", "lighttpd", "lighttpd"),
+    "microsoft iis httpd": ("a", "microsoft", "internet_information_services"),
+    "jetty": ("a", "eclipse", "jetty"),
+    "mysql": ("a", "oracle", "mysql"),
+    "mariadb": ("a", "mariadb", "mariadb"),
+    "postgresql db": ("a", "postgresql", "postgresql"),
+    "postgresql": ("a", "postgresql", "postgresql"),
+    "redis key-value store": ("a", "redis", "redis"),
+    "isc bind": ("a", "isc", "bind"),
+    "vsftpd": ("a", "beasts", "vsftpd"),
+    "proftpd": ("a", "proftpd", "proftpd"),
+    "pure-ftpd": ("a", "pureftpd", "pure-ftpd"),
+    "filezilla ftpd": ("a", "filezilla-project", "filezilla_server"),
+    "postfix smtpd": ("a", "postfix", "postfix"),
+    "exim smtpd": ("a", "exim", "exim"),
+    "sendmail": ("a", "sendmail", "sendmail"),
+    "dovecot pop3d": ("a", "dovecot", "dovecot"),
+    "dovecot imapd": ("a", "dovecot", "dovecot"),
+    "samba smbd": ("a", "samba", "samba"),
+    "openssl": ("a", "openssl", "openssl"),
+    "sudo": ("a", "sudo_project", "sudo"),
+    "gnu bash": ("a", "gnu", "bash"),
+    "curl": ("a", "haxx", "curl"),
+}
+
+# Cuando VERSION no incluye el producto, se recurre al nombre de servicio de Nmap
+SERVICE_NAME_ALIASES: Dict[str, str] = {
+    "ssh": "openssh",
+    "mysql": "mysql",
+    "postgresql": "postgresql",
+    "redis": "redis key-value store",
+    "domain": "isc bind",
+}
+
+# Productos cuyo número en VERSION es el de un componente y no el del producto: "Apache Tomcat/Coyote
+# JSP engine 1.1" es la versión del conector Coyote, y con ella se atribuirían todos los CVEs de Tomcat
+COMPONENT_VERSION_PRODUCTS: Set[str] = {"apache tomcat coyote jsp engine"}
+
+# "Microsoft Windows Server 2008 R2 microsoft-ds", "Microsoft Windows XP microsoft-ds", "Microsoft Windows 7 - 10 ..."
+_WINDOWS_RE = re.compile(r"microsoft windows (server )?(\d{4}|xp|vista|8\.1|7|8|10|11)\b( r2)?(\s*-\s*\d)?", re.IGNORECASE)
+
+# Paquetes de distribución (inventario SSH) -> alias de SEED_ALIASES. Solo se buscan CVEs de los paquetes
+# conocidos (aquí o por nombre exacto en el diccionario importado): el resto de miles de paquetes se ignora
+PACKAGE_NAME_ALIASES: Dict[str, str] = {
+    "openssh-server": "openssh",
+    "openssh-client": "openssh",
+    "openssh": "openssh",
+    "apache2": "apache httpd",
+    "httpd": "apache httpd",
+    "nginx": "nginx",
+    "nginx-core": "nginx",
+    "lighttpd": "lighttpd",
+    "tomcat9": "apache tomcat",
+    "tomcat": "apache tomcat",
+    "mysql-server": "mysql",
+    "mariadb-server": "mariadb",
+    "postgresql": "postgresql",
+    "redis-server": "redis key-value store",
+    "redis": "redis key-value store",
+    "bind9": "isc bind",
+    "bind": "isc bind",
+    "vsftpd": "vsftpd",
+    "proftpd-basic": "proftpd",
+    "postfix": "postfix smtpd",
+    "exim4-daemon-light": "exim smtpd",
+    "exim": "exim smtpd",
+    "dovecot-core": "dovecot imapd",
+    "dovecot": "dovecot imapd",
+    "samba": "samba smbd",
+    "openssl": "openssl",
+    "libssl1.1": "openssl",
+    "libssl3": "openssl",
+    "sudo": "sudo",
+    "bash": "gnu bash",
+    "curl": "curl",
+}
+
+# Palabras demasiado comunes en los nombres de producto para servir de pista en la búsqueda aproximada
+_STOP_TOKENS = {"server", "the", "for", "and", "project", "software", "service", "services", "inc"}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[\s_]+", " ", re.sub(r"[^\w\s.+-]", " ", text.lower())).strip()
+
+
+def _tokens(text: str) -> Set[str]:
+    return {token for token in re.split(r"[^a-z0-9]+", text.lower()) if len(token) > 1 and token not in _STOP_TOKENS}
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def split_product_and_version(version_field: str) -> Tuple[str, str]:
+    """
+    Separa el campo VERSION de Nmap en (producto, resto): "Apache httpd 2.4.52 ((Ubuntu))" ->
+    ("Apache httpd", "2.4.52 ((Ubuntu))"). El producto es el texto anterior al primer token numérico.
+    """
+    text = re.sub(r"\s*\(.*?\)\s*", " ", version_field).strip()
+    match = re.search(r"(?:^|\s)v?\d", text)
+    if not match:
+        return text, ""
+    return text[:match.start()].strip(), text[match.start():].strip()
+
+
+def special_case_cpe_name(version_field: str) -> Tuple[bool, Optional[str]]:
+    """
+    CPE de los campos VERSION que ni el diccionario ni la extracción de versión resuelven bien.
+    Retorna (tratado, cpe); con tratado=False se sigue la resolución normal.
+    - Windows: el producto es el sistema operativo (part 'o') y la edición forma parte del producto
+      ("Microsoft Windows Server 2008 R2" -> o:microsoft:windows_server_2008:r2). Un rango de
+      ediciones ("Microsoft Windows 7 - 10") o ninguna retorna (True, None).
+    - Productos de COMPONENT_VERSION_PRODUCTS: la versión no es la del producto, (True, None).
+    """
+    product_text, _ = split_product_and_version(version_field or "")
+    if _normalize(product_text) in COMPONENT_VERSION_PRODUCTS:
+        return True, None
+    if "microsoft windows" not in (version_field or "").lower():
+        return False, None
+    match = _WINDOWS_RE.search(version_field)
+    if not match or match.group(4):
+        return True, None
+    edition = f"server_{match.group(2)}" if match.group(1) else match.group(2).lower()
+    return True, f"cpe:2.3:o:microsoft:windows_{edition}:{'r2' if match.group(3) else '-'}:*:*:*:*:*:*:*"
+
+
+def upstream_package_version(version: str) -> str:
+    """
+    Versión upstream de un paquete de distribución: sin época ni revisión del empaquetador.
+    "1:7.6p1-4ubuntu0.7" (dpkg) -> "7.6p1", "8.0p1-19.el8" (rpm) -> "8.0p1", "1.2.3-r0" (apk) -> "1.2.3".
+    """
+    version = re.sub(r"^\d+:", "", version.strip())
+    if '-' in version:
+        version = version.rsplit('-', 1)[0]
+    return re.split(r"[+~]", version, 1)[0]
+
+
+class CPEDictionary:
+    """
+    Índice en memoria de productos CPE: mapa exacto (nombre normalizado -> producto) e índice
+    por tokens, cuyos candidatos se puntúan por similitud de trigramas cuando no hay coincidencia exacta.
+    El diccionario completo se importa en SQLite (data/cpe_dictionary.db) y se carga una vez al crear el objeto.
+    """
+    def __init__(self, db_name: str = 'cpe_dictionary.db', fuzzy_threshold: float = 0.55, memo_size: int = 4096):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self.fuzzy_threshold = fuzzy_threshold
+        self._products: List[CPEProduct] = []
+        self._exact: Dict[str, int] = {}
+        self._token_index: Dict[str, List[int]] = defaultdict(list)
+        self._create_tables()
+        self._build_index()
+        # Memoización por (service_name, VERSION): los escaneos repiten los mismos pares miles de veces
+        self.lookup_product = lru_cache(maxsize=memo_size)(self._lookup_product)
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cpe_products (
+                    part TEXT NOT NULL,
+                    vendor TEXT NOT NULL,
+                    product TEXT NOT NULL,
+                    title TEXT,
+                    PRIMARY KEY (part, vendor, product)
+                )
+            """)
+            conn.commit()
+
+    def _add_name(self, name: str, product_id: int):
+        name = _normalize(name)
+        if not name or name in self._exact:
+            return
+        self._exact[name] = product_id
+        for token in _tokens(name):
+            self._token_index[token].append(product_id)
+
+    def _build_index(self):
+        product_ids: Dict[CPEProduct, int] = {}
+
+        def product_id_for(cpe_product: CPEProduct) -> int:
+            if cpe_product not in product_ids:
+                product_ids[cpe_product] = len(self._products)
+                self._products.append(cpe_product)
+            return product_ids[cpe_product]
+
+        # Primero los alias: ganan a cualquier nombre importado que coincida
+        for alias, cpe_product in SEED_ALIASES.items():
+            self._add_name(alias, product_id_for(cpe_product))
+
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT part, vendor, product, title FROM cpe_products")
+            for part, vendor, product, title in cursor:
+                product_id = product_id_for((part, vendor, product))
+                self._add_name(product.replace('_', ' '), product_id)
+                self._add_name(f"{vendor} {product}".replace('_', ' '), product_id)
+                if title:
+                    # "OpenBSD OpenSSH 7.6 p1" -> "openbsd openssh"
+                    self._add_name(split_product_and_version(title)[0], product_id)
+        logger.info(f"[CPEDictionary] Índice construido: {len(self._products)} productos, {len(self._exact)} nombres.")
+
+    @staticmethod
+    def _iter_feed_products(path: str):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            feed = json.load(f)
+        for entry in feed.get('products', []):
+            cpe_data = entry.get('cpe', {})
+            if cpe_data.get('deprecated'):
+                continue
+            cpe = parse_cpe(cpe_data.get('cpeName', ''))
+            if not cpe:
+                continue
+            title = next((t.get('title') for t in cpe_data.get('titles', []) if t.get('lang') == 'en'), None)
+            yield cpe['part'], cpe['vendor'], cpe['product'], title
+
+    def import_feed(self, path: str) -> int:
+        """
+        Importa un feed de productos CPE del NVD. Solo se guarda un registro por (part, vendor, product):
+        las versiones no hacen falta para resolver el producto. Retorna los productos nuevos añadidos.
+        Los cambios se reflejan en el índice al crear un nuevo CPEDictionary.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            before = conn.total_changes
+            cursor.executemany(
+                "INSERT OR IGNORE INTO cpe_products (part, vendor, product, title) VALUES (?, ?, ?, ?)",
+                self._iter_feed_products(path)
+            )
+            conn.commit()
+            added = conn.total_changes - before
+        logger.info(f"[CPEDictionary] {added} productos nuevos importados desde {path}.")
+        return added
+
+    def _fuzzy_match(self, name: str) -> Optional[int]:
+        query_tokens = _tokens(name)
+        candidates: Set[int] = set()
+        for token in query_tokens:
+            candidates.update(self._token_index.get(token, ()))
+        if not candidates:
+            return None
+
+        query_trigrams = _trigrams(name)
+        # Nmap escribe primero el producto ("Squid http proxy"): se favorecen los candidatos que lo contienen
+        leading_token = next(iter(_tokens(name.split(' ', 1)[0])), None)
+        best_id, best_score = None, 0.0
+        for product_id in candidates:
+            part, vendor, product = self._products[product_id]
+            for candidate_name in (product.replace('_', ' '), f"{vendor} {product}".replace('_', ' ')):
+                candidate_trigrams = _trigrams(candidate_name)
+                score = len(query_trigrams & candidate_trigrams) / len(query_trigrams | candidate_trigrams)
+                candidate_tokens = _tokens(candidate_name)
+                if leading_token in candidate_tokens and candidate_tokens <= query_tokens:
+                    score = max(score, 0.75)
+                if score > best_score:
+                    best_id, best_score = product_id, score
+        return best_id if best_score >= self.fuzzy_threshold else None
+
+    def _lookup_product(self, service_name: str, version_field: str) -> Optional[CPEProduct]:
+        product_text, _ = split_product_and_version(version_field or "")
+        names = [_normalize(product_text)] if product_text else []
+        service_alias = SERVICE_NAME_ALIASES.get((service_name or "").lower())
+        if service_alias:
+            names.append(service_alias)
+
+        for name in names:
+            if name in self._exact:
+                return self._products[self._exact[name]]
+        for name in names:
+            product_id = self._fuzzy_match(name)
+            if product_id is not None:
+                return self._products[product_id]
+        return None
+
+    def package_service_key(self, package_name: str, version: str) -> Optional[Tuple[str, str]]:
+        """
+        Par (service_name, VERSION) equivalente a un paquete instalado, con el campo VERSION escrito
+        como lo haría Nmap (producto y versión upstream) para que construct_cpe_name_simplified lo
+        resuelva: ("openssh-server", "1:7.6p1-4ubuntu0.7") -> ("openssh-server", "openssh 7.6p1").
+        Retorna None si el paquete no corresponde a un producto conocido.
+        """
+        if not package_name or not version:
+            return None
+        name = PACKAGE_NAME_ALIASES.get(package_name.lower())
+        if name is None and _normalize(package_name) in self._exact:
+            name = _normalize(package_name)
+        upstream = upstream_package_version(version)
+        if name is None or not re.match(r"\d", upstream):
+            return None
+        return package_name, f"{name} {upstream}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        memo = self.lookup_product.cache_info()
+        return {"products": len(self._products), "names": len(self._exact), "memo_hits": memo.hits, "memo_misses": memo.misses}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('import', 'resolve'):
+        print(__doc__)
+        return 1
+
+    if argv[0] == 'import':
+        dictionary = CPEDictionary()
+        total = sum(dictionary.import_feed(path) for path in argv[1:])
+        print(f"{total} productos CPE nuevos importados.")
+    else:
+        service_name, version_field = argv[1], " ".join(argv[2:])
+        print(f"{service_name!r} + {version_field!r} -> {CPEDictionary().lookup_product(service_name, version_field)}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# src/modules/cve_lookup/cve_cache.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CVECache:
+    """
+    Caché persistente de respuestas del NVD, indexada por nombre CPE y parámetros de la consulta.
+    Las respuestas con CVEs se conservan `ttl_hours`; las vacías (el CPE no tiene CVEs conocidos)
+    solo `negative_ttl_hours`, para que aparezcan pronto los CVEs publicados después.
+    Los errores de red/HTTP nunca se guardan: search_cve retorna None y no se llama a store().
+    """
+    def __init__(self, db_name: str = 'cve_cache.db', ttl_hours: float = 24, negative_ttl_hours: float = 6):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self.ttl_seconds = ttl_hours * 3600
+        self.negative_ttl_seconds = negative_ttl_hours * 3600
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0}
+        self._stats_lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cve_cache (
+                    cpe_name TEXT NOT NULL,
+                    query_params TEXT NOT NULL,
+                    response_json TEXT NOT NULL,
+                    is_negative INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (cpe_name, query_params)
+                )
+            """)
+            conn.commit()
+
+    @staticmethod
+    def _params_key(params: Dict[str, Any]) -> str:
+        # Claves ordenadas: la misma consulta produce siempre la misma clave
+        return json.dumps(params, sort_keys=True)
+
+    @staticmethod
+    def is_negative_response(nvd_response: Dict[str, Any]) -> bool:
+        return not nvd_response.get('vulnerabilities')
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def get(self, cpe_name: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Retorna la respuesta del NVD guardada para (cpe_name, params) si sigue vigente, o None."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT response_json, is_negative, fetched_at FROM cve_cache WHERE cpe_name = ? AND query_params = ?",
+                (cpe_name, self._params_key(params))
+            )
+            row = cursor.fetchone()
+
+        if row:
+            response_json, is_negative, fetched_at = row
+            ttl = self.negative_ttl_seconds if is_negative else self.ttl_seconds
+            if time.time() - fetched_at < ttl:
+                self._count("negative_hits" if is_negative else "hits")
+                return json.loads(response_json)
+        self._count("misses")
+        return None
+
+    def store(self, cpe_name: str, params: Dict[str, Any], nvd_response: Dict[str, Any]):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """INSERT OR REPLACE INTO cve_cache (cpe_name, query_params, response_json, is_negative, fetched_at)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (cpe_name, self._params_key(params), json.dumps(nvd_response),
+                     int(self.is_negative_response(nvd_response)), time.time())
+                )
+                conn.commit()
+            self._count("stores")
+        except sqlite3.Error as e:
+            # Un fallo de la caché no debe interrumpir la búsqueda de CVEs
+            logger.error(f"[CVECache] Error al guardar la respuesta para {cpe_name}: {e}")
+
+    def purge_expired(self) -> int:
+        """Elimina las entradas caducadas. Retorna el número de filas borradas."""
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM cve_cache WHERE (is_negative = 1 AND fetched_at < ?) OR (is_negative = 0 AND fetched_at < ?)",
+                (now - self.negative_ttl_seconds, now - self.ttl_seconds)
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for counter in self._stats:
+                self._stats[counter] = 0
+
+
+# Ejemplo de uso (para pruebas)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cache = CVECache(db_name='cve_cache_demo.db', ttl_hours=1, negative_ttl_hours=0.5)
+    params = {"cpeName": "cpe:2.3:a:openbsd:openssh:7.6p1:*:*:*:*:*:*:*", "resultsPerPage": 5}
+
+    print("Primera consulta:", cache.get(params["cpeName"], params))
+    cache.store(params["cpeName"], params, {"totalResults": 1, "vulnerabilities": [{"cve": {"id": "CVE-2018-15473"}}]})
+    cache.store("cpe:2.3:a:foo:bar:1.0:*:*:*:*:*:*:*", {"cpeName": "cpe:2.3:a:foo:bar:1.0:*:*:*:*:*:*:*"}, {"totalResults": 0, "vulnerabilities": []})
+    print("Segunda consulta:", cache.get(params["cpeName"], params))
+    print("Consulta negativa:", cache.get("cpe:2.3:a:foo:bar:1.0:*:*:*:*:*:*:*", {"cpeName": "cpe:2.3:a:foo:bar:1.0:*:*:*:*:*:*:*"}))
+    print("Estadísticas:", cache.get_stats())
+    os.remove(cache.db_path)
@@ -0,0 +1,257 @@
+# src/modules/cve_lookup/cve_feed_sync.py
+"""
+Sincronización incremental de CVEs contra los servicios y paquetes ya guardados.
+
+Cada ciclo:
+  1. Resuelve el CPE de los servicios y paquetes nuevos de DataManager (tablas service_cpes y package_cpes,
+     indexadas por vendor/product).
+  2. Descarga del NVD los CVEs modificados desde la última sincronización (ventanas lastModStartDate/EndDate)
+     o importa ficheros delta locales (ej. nvdcve-2.0-modified.json.gz), y los guarda en la réplica local
+     (sin marcar sus productos como cubiertos: las búsquedas híbridas siguen consultando la API para ellos).
+  3. Cruza solo esos CVEs con los servicios y paquetes del mismo vendor/product y registra los hallazgos nuevos (type='cve').
+No se vuelve a contactar con los objetivos de red.
+
+Uso (desde backend/):
+    python -m modules.cve_lookup.cve_feed_sync                     # ventana online desde la última sincronización
+    python -m modules.cve_lookup.cve_feed_sync nvdcve-2.0-modified.json.gz
+"""
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional
+
+from core.data_manager import DataManager
+from modules.cve_lookup.nvd_mirror import NVDMirror, LocalCVEMatcher, parse_cpe
+from modules.cve_lookup.nvd_client import SimpleNVDAPIClient, construct_cpe_name_simplified
+from modules.cve_lookup.cpe_dictionary import CPEDictionary
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_KEY = "last_mod_end"
+# El NVD no acepta ventanas lastModified de más de 120 días
+NVD_MAX_WINDOW_DAYS = 120
+
+
+def _nvd_timestamp(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000+00:00")
+
+
+def package_cve_finding(package: Dict[str, Any], cve: Dict[str, Any], source: str, criteria: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Argumentos de DataManager.add_finding para un CVE de un paquete instalado (inventario SSH).
+    `package` incluye name, version, package_manager, host_id, scan_id, ip_address y hostname;
+    `cve` tiene el formato resumido de parse_and_summarize_cve_data.
+    """
+    details = {
+        "cve_id": cve['cve_id'],
+        "cvss_score": cve['cvss_score'],
+        "references": cve['references'],
+        "source": source,
+        "host_info": {"id": package['host_id'], "ip_address": package['ip_address'], "hostname": package['hostname']},
+        "package_info": {"name": package['name'], "version": package['version'], "package_manager": package.get('package_manager')}
+    }
+    if criteria:
+        details["criteria"] = criteria
+    return {
+        "scan_id": package['scan_id'],
+        "host_id": package['host_id'],
+        "type": "cve",
+        "title": f"{cve['cve_id']} en el paquete {package['name']} {package['version']}",
+        "description": cve['description'],
+        "severity": str(cve['cvss_severity']),
+        # La versión upstream no refleja los parches que la distribución aplica sin cambiarla
+        "recommendation": f"Actualizar el paquete {package['name']} a una versión no afectada por {cve['cve_id']} "
+                          f"(comprobar antes si la distribución ya publicó el parche).",
+        "details": details
+    }
+
+
+class CVEFeedSync:
+    def __init__(self, data_manager: DataManager, mirror: NVDMirror, nvd_client: Optional[SimpleNVDAPIClient] = None,
+                 cpe_dictionary: Optional[CPEDictionary] = None, initial_lookback_days: int = 7):
+        """
+        :param mirror: Réplica local donde se guardan los CVEs descargados y el estado de la sincronización.
+        :param nvd_client: Cliente de la API del NVD (None = solo ficheros delta locales).
+        :param cpe_dictionary: Diccionario CPE para resolver el producto de los servicios y paquetes.
+        :param initial_lookback_days: Días hacia atrás que se consultan en la primera sincronización.
+        """
+        self.data_manager = data_manager
+        self.mirror = mirror
+        self.nvd_client = nvd_client
+        self.cpe_dictionary = cpe_dictionary
+        self.initial_lookback_days = initial_lookback_days
+
+    def index_new_services(self) -> int:
+        """
+        Resuelve y guarda el CPE de los servicios que aún no lo tienen. Los que no se pueden resolver
+        no se guardan y se vuelven a intentar en cada ciclo, por si el diccionario se amplía.
+        Retorna cuántos se indexaron.
+        """
+        rows = []
+        for service in self.data_manager.get_services_without_cpe():
+            cpe_name = construct_cpe_name_simplified(service['service_name'], service['version'], cpe_dictionary=self.cpe_dictionary)
+            cpe = parse_cpe(cpe_name) if cpe_name else None
+            if cpe:
+                rows.append({"service_id": service['id'], "part": cpe['part'], "vendor": cpe['vendor'],
+                             "product": cpe['product'], "version": cpe['version']})
+        return self.data_manager.add_service_cpes(rows) if rows else 0
+
+    def index_new_packages(self) -> int:
+        """
+        Resuelve y guarda el CPE de los paquetes instalados que aún no lo tienen. Solo se guardan los
+        paquetes de productos conocidos (ver CPEDictionary.package_service_key); el resto se vuelve a
+        intentar en cada ciclo, por si el diccionario se amplía. Retorna cuántos se indexaron.
+        """
+        if not self.cpe_dictionary:
+            return 0
+        rows = []
+        for package in self.data_manager.get_packages_without_cpe():
+            service_key = self.cpe_dictionary.package_service_key(package['name'], package['version'])
+            cpe_name = construct_cpe_name_simplified(*service_key, cpe_dictionary=self.cpe_dictionary) if service_key else None
+            cpe = parse_cpe(cpe_name) if cpe_name else None
+            if cpe:
+                rows.append({"package_id": package['id'], "part": cpe['part'], "vendor": cpe['vendor'],
+                             "product": cpe['product'], "version": cpe['version']})
+        return self.data_manager.add_package_cpes(rows) if rows else 0
+
+    def _fetch_online_updates(self) -> List[str]:
+        """Descarga las ventanas pendientes del NVD, las importa en la réplica y retorna los IDs de CVE cambiados."""
+        now = datetime.now(timezone.utc)
+        last_end = self.mirror.get_sync_state(SYNC_STATE_KEY)
+        window_start = datetime.fromisoformat(last_end) if last_end else now - timedelta(days=self.initial_lookback_days)
+
+        changed_ids: List[str] = []
+        while window_start < now:
+            window_end = min(now, window_start + timedelta(days=NVD_MAX_WINDOW_DAYS))
+            batch = []
+            for vuln_entry in self.nvd_client.iter_modified_cves(_nvd_timestamp(window_start), _nvd_timestamp(window_end)):
+                batch.append(vuln_entry)
+                if len(batch) >= 2000:
+                    changed_ids.extend(self._import_batch(batch))
+                    batch = []
+            changed_ids.extend(self._import_batch(batch))
+            # Solo se avanza el estado cuando la ventana completa se ha importado
+            self.mirror.set_sync_state(SYNC_STATE_KEY, window_end.isoformat())
+            window_start = window_end
+        return changed_ids
+
+    def _import_batch(self, vulnerabilities: List[Dict[str, Any]]) -> List[str]:
+        if not vulnerabilities:
+            return []
+        self.mirror.import_vulnerabilities(vulnerabilities)
+        return [v['cve']['id'] for v in vulnerabilities if v.get('cve', {}).get('id')]
+
+    def _import_delta_files(self, paths: Iterable[str]) -> List[str]:
+        changed_ids: List[str] = []
+        for path in paths:
+            changed_ids.extend(self._import_batch(self.mirror.load_feed(path).get('vulnerabilities', [])))
+        return changed_ids
+
+    def match_changed_cves(self, cve_ids: List[str]) -> int:
+        """
+        Cruza los CVEs indicados con los servicios y paquetes guardados del mismo vendor/product y
+        registra los hallazgos que falten. Retorna el número de hallazgos nuevos.
+        """
+        matches_by_product: Dict[tuple, List[Dict[str, Any]]] = {}
+        for match in self.mirror.get_matches_for_cves(sorted(set(cve_ids))):
+            matches_by_product.setdefault((match['vendor'], match['product']), []).append(match)
+
+        new_findings = 0
+        for (vendor, product), matches in matches_by_product.items():
+            services = self.data_manager.get_services_by_product(vendor, product)
+            for service in services:
+                if not service['cpe_version'] or service['cpe_version'] in ('*', '-'):
+                    continue
+                known_cves = self.data_manager.get_cve_ids_for_service(service['service_id'])
+                for match in matches:
+                    if match['cve_id'] in known_cves or not LocalCVEMatcher.version_matches(match, service['cpe_version']):
+                        continue
+                    self._add_cve_finding(service, match)
+                    known_cves.add(match['cve_id'])
+                    new_findings += 1
+            for package in self.data_manager.get_packages_by_product(vendor, product):
+                if not package['cpe_version'] or package['cpe_version'] in ('*', '-'):
+                    continue
+                known_cves = self.data_manager.get_cve_ids_for_package(package['host_id'], package['name'])
+                for match in matches:
+                    if match['cve_id'] in known_cves or not LocalCVEMatcher.version_matches(match, package['cpe_version']):
+                        continue
+                    self.data_manager.add_finding(**package_cve_finding(package, json.loads(match['summary_json']), "cve_feed_sync", match['criteria']))
+                    logger.info(f"[CVEFeedSync] Nuevo hallazgo {match['cve_id']} en {package['ip_address']} (paquete {package['name']} {package['version']}).")
+                    known_cves.add(match['cve_id'])
+                    new_findings += 1
+        return new_findings
+
+    def _add_cve_finding(self, service: Dict[str, Any], match: Dict[str, Any]):
+        summary = json.loads(match['summary_json'])
+        self.data_manager.add_finding(
+            scan_id=service['scan_id'],
+            host_id=service['host_id'],
+            service_id=service['service_id'],
+            type="cve",
+            title=f"{summary['cve_id']} en {service['service_name']} {service['version']}",
+            description=summary['description'],
+            severity=str(summary['cvss_severity']),
+            recommendation=f"Actualizar {service['service_name']} a una versión no afectada por {summary['cve_id']}.",
+            details={
+                "cve_id": summary['cve_id'],
+                "cvss_score": summary['cvss_score'],
+                "references": summary['references'],
+                "criteria": match['criteria'],
+                "source": "cve_feed_sync",
+                "host_info": {"id": service['host_id'], "ip_address": service['ip_address'], "hostname": service['hostname']},
+                "service_info": {"id": service['service_id'], "port": service['port'], "protocol": service['protocol'],
+                                 "service_name": service['service_name'], "version": service['version']}
+            }
+        )
+        logger.info(f"[CVEFeedSync] Nuevo hallazgo {summary['cve_id']} en {service['ip_address']}:{service['port']} ({service['service_name']} {service['version']}).")
+
+    def run_cycle(self, delta_files: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta un ciclo completo. Con `delta_files` se importan esos ficheros; si no, se consulta
+        la API del NVD desde la última sincronización. Retorna un resumen del ciclo.
+        """
+        start_time = time.time()
+        indexed = self.index_new_services()
+        packages_indexed = self.index_new_packages()
+        if delta_files:
+            changed_ids = self._import_delta_files(delta_files)
+        elif self.nvd_client:
+            changed_ids = self._fetch_online_updates()
+        else:
+            changed_ids = []
+        new_findings = self.match_changed_cves(changed_ids) if changed_ids else 0
+
+        summary = {
+            "services_indexed": indexed,
+            "packages_indexed": packages_indexed,
+            "cves_changed": len(set(changed_ids)),
+            "new_findings": new_findings,
+            "last_sync": self.mirror.get_sync_state(SYNC_STATE_KEY),
+            "duration_seconds": round(time.time() - start_time, 2)
+        }
+        logger.info(f"[CVEFeedSync] Ciclo completado: {summary}")
+        return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ('-h', '--help'):
+        print(__doc__)
+        return 0
+    sync = CVEFeedSync(
+        data_manager=DataManager(),
+        mirror=NVDMirror(),
+        nvd_client=None if argv else SimpleNVDAPIClient(api_key=os.getenv('NVD_API_KEY')),
+        cpe_dictionary=CPEDictionary()
+    )
+    print(sync.run_cycle(delta_files=argv or None))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# src/modules/cve_lookup/cve_resolver.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from modules.cve_lookup.nvd_client import construct_cpe_name_simplified
+from modules.cve_lookup.cpe_dictionary import CPEDictionary
+
+logger = logging.getLogger(__name__)
+
+ServiceKey = Tuple[str, str]
+
+
+class CVEResolver:
+    """
+    Resuelve los CVEs de un escaneo completo por pares (service_name, version) distintos.
+    Cada par se busca una sola vez, en paralelo con un número acotado de hilos, y el resultado
+    se reparte después a todos los servicios que lo comparten.
+    """
+    def __init__(self, lookup_cves_for_cpe: Callable[[str], List[Dict[str, Any]]], max_workers: int = 8,
+                 cpe_dictionary: Optional[CPEDictionary] = None):
+        """
+        :param lookup_cves_for_cpe: Función que retorna la lista resumida de CVEs de un CPE
+                                    (API del NVD, réplica local o ambas).
+        :param max_workers: Número máximo de búsquedas simultáneas.
+        :param cpe_dictionary: Diccionario CPE opcional para resolver vendor/product.
+        """
+        self.lookup_cves_for_cpe = lookup_cves_for_cpe
+        self.max_workers = max(1, max_workers)
+        self.cpe_dictionary = cpe_dictionary
+
+    def cpe_attempts(self, service_name: str, version: str) -> List[str]:
+        """CPEs a probar en orden: versión exacta y, si difiere, la versión genérica (mayor.menor)."""
+        attempts = []
+        cpe_exact = construct_cpe_name_simplified(service_name, version, generic=False, cpe_dictionary=self.cpe_dictionary)
+        if cpe_exact:
+            attempts.append(cpe_exact)
+        cpe_generic = construct_cpe_name_simplified(service_name, version, generic=True, cpe_dictionary=self.cpe_dictionary)
+        if cpe_generic and cpe_generic != cpe_exact:
+            attempts.append(cpe_generic)
+        return attempts
+
+    def _resolve_one(self, service_key: ServiceKey) -> List[Dict[str, Any]]:
+        service_name, version = service_key
+        for cpe_name in self.cpe_attempts(service_name, version):
+            try:
+                cves = self.lookup_cves_for_cpe(cpe_name)
+            except Exception as e:
+                # Un fallo en un par no debe cancelar la resolución del resto del escaneo
+                logger.error(f"[CVEResolver] Error buscando CVEs para {cpe_name}: {e}")
+                continue
+            if cves:
+                logger.info(f"[CVEResolver] CVEs encontrados para {service_name} {version} (CPE: {cpe_name}): {[c['cve_id'] for c in cves]}")
+                return cves
+        return []
+
+    def resolve(self, services: Iterable[ServiceKey]) -> Dict[ServiceKey, List[Dict[str, Any]]]:
+        """
+        Retorna {(service_name, version): [cves]} para cada par distinto con CVEs.
+        Los pares sin nombre o sin versión se ignoran.
+        """
+        distinct = sorted({(name, version) for name, version in services if name and version})
+        if not distinct:
+            return {}
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(distinct)), thread_name_prefix="cve-resolver") as executor:
+            results = dict(zip(distinct, executor.map(self._resolve_one, distinct)))
+
+        resolved = {key: cves for key, cves in results.items() if cves}
+        logger.info(f"[CVEResolver] {len(distinct)} versiones de software distintas resueltas en {time.time() - start_time:.2f}s "
+                    f"({len(resolved)} con CVEs).")
+        return resolved
@@ -0,0 +1,46 @@
+# src/modules/cve_lookup/cve_summary.py
+from typing import Dict, Any
+
+
+def summarize_cve(cve_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrae la información clave de un objeto 'cve' del formato JSON 2.0 del NVD
+    (el mismo en la API y en los ficheros de feed).
+    """
+    cve_id = cve_data.get('id', 'N/A')
+
+    # Obtener descripción en inglés si está disponible
+    description = "No description available."
+    for desc_entry in cve_data.get('descriptions', []):
+        if desc_entry.get('lang') == 'en':
+            description = desc_entry.get('value', description)
+            break
+
+    # Obtener métricas CVSS (preferir v3.1, luego v3.0, luego v2)
+    cvss_score = 'N/A'
+    cvss_severity = 'N/A'
+
+    metrics = cve_data.get('metrics', {})
+    if metrics.get('cvssMetricV31'):
+        metric = metrics['cvssMetricV31'][0].get('cvssData', {})
+        cvss_score = metric.get('baseScore', 'N/A')
+        cvss_severity = metric.get('baseSeverity', 'N/A')
+    elif metrics.get('cvssMetricV30'):
+        metric = metrics['cvssMetricV30'][0].get('cvssData', {})
+        cvss_score = metric.get('baseScore', 'N/A')
+        cvss_severity = metric.get('baseSeverity', 'N/A')
+    elif metrics.get('cvssMetricV2'):
+        metric = metrics['cvssMetricV2'][0].get('cvssData', {})
+        cvss_score = metric.get('baseScore', 'N/A')
+        cvss_severity = metric.get('baseSeverity', 'N/A')
+
+    # Obtener referencias (URLs)
+    references = [ref.get('url') for ref in cve_data.get('references', []) if ref.get('url')]
+
+    return {
+        'cve_id': cve_id,
+        'description': description,
+        'cvss_score': cvss_score,
+        'cvss_severity': cvss_severity,
+        'references': references
+    }
@@ -1,8 +1,24 @@
 import requests
-import json
+import heapq
 import logging
+import random
 import re
-from typing import Optional, Dict, Any, List
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, Iterator, List, TYPE_CHECKING
+
+from modules.cve_lookup.cve_cache import CVECache
+from utils.rate_limiter import TokenBucket
+from modules.cve_lookup.cve_summary import summarize_cve
+from modules.cve_lookup.cpe_dictionary import special_case_cpe_name
+
+if TYPE_CHECKING:
+    from modules.cve_lookup.cpe_dictionary import CPEDictionary
 
 # Configuración básica de logging para este script
 logger = logging.getLogger(__name__) # Usar el logger raíz o un logger específico para el módulo
@@ -10,38 +26,184 @@ logger = logging.getLogger(__name__) # Usar el logger raíz o un logger específ
 class SimpleNVDAPIClient:
     """
     Cliente simplificado para interactuar con la API del NVD (National Vulnerability Database).
+    Reutiliza conexiones keep-alive, respeta la cuota de peticiones del NVD con un token bucket
+    y reintenta con backoff exponencial (con jitter) ante 403/429/5xx.
     """
     NVD_API_BASE_URL = "https://services.nvd.nist.gov/rest/json/cves/2.0"
-    
-    def search_cve(self, cpe_name: str, results_per_page: int = 5) -> Optional[Dict[str, Any]]:
+    # Cuotas publicadas por el NVD: peticiones por ventana de 30 segundos
+    NVD_RATE_LIMIT_WINDOW_SECONDS = 30
+    NVD_RATE_LIMIT_WITHOUT_KEY = 5
+    NVD_RATE_LIMIT_WITH_KEY = 50
+    # El NVD responde 403 (además de 429) cuando se supera la cuota
+    RETRYABLE_STATUS_CODES = {403, 429, 500, 502, 503, 504}
+
+    def __init__(self, cache: Optional[CVECache] = None, api_key: Optional[str] = None,
+                 rate_limiter: Optional[TokenBucket] = None, max_retries: int = 4,
+                 backoff_base_seconds: float = 2.0, backoff_max_seconds: float = 60.0,
+                 timeout: float = 10, pool_size: int = 10, base_url: Optional[str] = None):
+        """
+        :param cache: Caché persistente opcional. Si se indica, las consultas repetidas
+                      del mismo CPE no vuelven a llamar a la API del NVD.
+        :param api_key: Clave de la API del NVD (eleva la cuota de 5 a 50 peticiones por 30 s).
+        :param rate_limiter: Limitador compartido. Por defecto se dimensiona según haya o no api_key.
+        :param max_retries: Reintentos ante errores transitorios (403/429/5xx, conexión, timeout).
+        :param pool_size: Conexiones keep-alive que conserva la sesión (>= hilos que la usan).
+        :param base_url: URL alternativa de la API (ej. un servidor local de pruebas).
+        """
+        self.cache = cache
+        self.api_key = api_key
+        self.base_url = base_url or self.NVD_API_BASE_URL
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.timeout = timeout
+        if rate_limiter is None:
+            quota = self.NVD_RATE_LIMIT_WITH_KEY if api_key else self.NVD_RATE_LIMIT_WITHOUT_KEY
+            rate_limiter = TokenBucket(rate=quota, per_seconds=self.NVD_RATE_LIMIT_WINDOW_SECONDS, capacity=1)
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        # Los reintentos los gestiona search_cve (para respetar Retry-After y el token bucket)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if api_key:
+            self.session.headers["apiKey"] = api_key
+
+        self._metrics_lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=1000)
+        self._metrics = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def _record_request(self, latency_ms: float, status_code: Optional[int]):
+        with self._metrics_lock:
+            self._metrics["requests"] += 1
+            self._latencies_ms.append(latency_ms)
+            if status_code in (403, 429):
+                self._metrics["throttled"] += 1
+
+    def _count(self, counter: str):
+        with self._metrics_lock:
+            self._metrics[counter] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Contadores y latencias (ms) de las peticiones HTTP reales al NVD (las respuestas de caché no cuentan)."""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+            latencies = sorted(self._latencies_ms)
+        if latencies:
+            metrics.update(
+                latency_avg_ms=round(sum(latencies) / len(latencies), 1),
+                latency_p50_ms=round(latencies[len(latencies) // 2], 1),
+                latency_p95_ms=round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+                latency_max_ms=round(latencies[-1], 1)
+            )
+        return metrics
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        # Si el servidor indica cuánto esperar (Retry-After en segundos), se respeta
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max_seconds)
+        # Backoff exponencial con "full jitter" para que los hilos no reintenten a la vez
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt)))
+
+    def _get_json(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        Busca CVEs en el NVD por nombre CPE.
+        GET a la API del NVD con limitación de tasa y reintentos.
+        Retorna el JSON de la respuesta o None si falla definitivamente.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            response = None
+            start_time = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                latency_ms = (time.perf_counter() - start_time) * 1000
+                self._record_request(latency_ms, response.status_code)
+                logger.debug(f"NVD API {response.status_code} en {latency_ms:.0f} ms (intento {attempt + 1}): {params}")
+
+                if response.status_code in self.RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                    delay = self._backoff_delay(attempt, response)
+                    logger.warning(f"NVD API respondió {response.status_code}. Reintentando en {delay:.1f}s "
+                                   f"(intento {attempt + 1}/{self.max_retries}).")
+                    if response.status_code in (403, 429):
+                        # Cuota agotada: frenar también al resto de hilos que comparten el limitador
+                        self.rate_limiter.penalize(delay)
+                    self._count("retries")
+                    time.sleep(delay)
+                    continue
+                response.raise_for_status() # Lanza una excepción para códigos de estado HTTP de error (4xx o 5xx)
+                return response.json()
+            except requests.exceptions.HTTPError as http_err:
+                logger.error(f"Error HTTP al buscar CVEs: {http_err} - Respuesta: {response.text[:200]}")
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as transient_err:
+                self._record_request((time.perf_counter() - start_time) * 1000, None)
+                if attempt < self.max_retries:
+                    delay = self._backoff_delay(attempt, None)
+                    logger.warning(f"Error transitorio al buscar CVEs ({transient_err}). Reintentando en {delay:.1f}s.")
+                    self._count("retries")
+                    time.sleep(delay)
+                    continue
+                logger.error(f"Error de conexión al buscar CVEs tras {self.max_retries} reintentos: {transient_err}")
+            except ValueError as json_err:
+                # requests lanza una subclase de ValueError si el cuerpo no es JSON válido
+                response_text = response.text if response is not None else "No response text available."
+                logger.error(f"Error al decodificar JSON de la respuesta del NVD: {json_err} - Texto: {response_text[:200]}...")
+                break
+            except requests.exceptions.RequestException as req_err:
+                logger.error(f"Error inesperado al buscar CVEs: {req_err}")
+                break
+        self._count("failures")
+        return None
+
+    def search_cve(self, cpe_name: str, results_per_page: int = 5, start_index: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Busca CVEs en el NVD por nombre CPE (una página de resultados).
         :param cpe_name: El nombre CPE a buscar (ej. "cpe:2.3:a:openbsd:openssh:5.3p1:*:*:*:*:*:*:*").
         :param results_per_page: Número máximo de resultados a devolver.
+        :param start_index: Posición del primer resultado (paginación del NVD).
         :return: Un diccionario con la respuesta JSON de la API del NVD, o None si hay un error.
         """
         params = {
             "cpeName": cpe_name,
-            "resultsPerPage": results_per_page
+            "resultsPerPage": results_per_page,
+            "startIndex": start_index
         }
+        if self.cache:
+            cached_response = self.cache.get(cpe_name, params)
+            if cached_response is not None:
+                logger.debug(f"Respuesta del NVD obtenida de caché para CPE: {cpe_name}")
+                return cached_response
+
         logger.info(f"Realizando solicitud a NVD API con CPE: {cpe_name}")
-        try:
-            response = requests.get(self.NVD_API_BASE_URL, params=params, timeout=10)
-            response.raise_for_status() # Lanza una excepción para códigos de estado HTTP de error (4xx o 5xx)
-            return response.json()
-        except requests.exceptions.HTTPError as http_err:
-            logger.error(f"Error HTTP al buscar CVEs: {http_err} - Respuesta: {response.text}")
-        except requests.exceptions.ConnectionError as conn_err:
-            logger.error(f"Error de conexión al buscar CVEs: {conn_err}")
-        except requests.exceptions.Timeout as timeout_err:
-            logger.error(f"Tiempo de espera agotado al buscar CVEs: {timeout_err}")
-        except requests.exceptions.RequestException as req_err:
-            logger.error(f"Error inesperado al buscar CVEs: {req_err}")
-        except json.JSONDecodeError as json_err:
-            # Asegurarse de que 'response' esté definido antes de intentar acceder a 'response.text'
-            response_text = response.text if 'response' in locals() else "No response text available."
-            logger.error(f"Error al decodificar JSON de la respuesta del NVD: {json_err} - Texto: {response_text[:200]}...")
-        return None
+        nvd_response = self._get_json(params)
+        if nvd_response is not None and self.cache:
+            self.cache.store(cpe_name, params, nvd_response)
+        return nvd_response
+
+    def iter_modified_cves(self, last_mod_start: str, last_mod_end: str, page_size: int = 2000) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre los CVEs publicados o modificados en la ventana [last_mod_start, last_mod_end]
+        (ISO-8601, máximo 120 días según el NVD) y produce las entradas {"cve": {...}} en crudo.
+        Estas consultas no se cachean: cada ventana se pide una sola vez. Lanza RuntimeError si
+        una página falla, para que la sincronización no dé la ventana por completada.
+        """
+        start_index = 0
+        while True:
+            page = self._get_json({
+                "lastModStartDate": last_mod_start,
+                "lastModEndDate": last_mod_end,
+                "resultsPerPage": page_size,
+                "startIndex": start_index
+            })
+            if page is None:
+                raise RuntimeError(f"No se pudo obtener la página startIndex={start_index} de CVEs modificados.")
+            yield from page.get('vulnerabilities', [])
+            start_index += page.get('resultsPerPage') or page_size
+            if start_index >= page.get('totalResults', 0):
+                return
 
     def parse_and_summarize_cve_data(self, nvd_response: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -55,53 +217,83 @@ class SimpleNVDAPIClient:
             cve_data = vuln_entry.get('cve')
             if not cve_data:
                 continue
-
-            cve_id = cve_data.get('id', 'N/A')
-            
-            # Obtener descripción en inglés si está disponible
-            description = "No description available."
-            for desc_entry in cve_data.get('descriptions', []):
-                if desc_entry.get('lang') == 'en':
-                    description = desc_entry.get('value', description)
-                    break
-            
-            # Obtener métricas CVSS (preferir v3.1, luego v3.0, luego v2)
-            cvss_score = 'N/A'
-            cvss_severity = 'N/A'
-            
-            metrics = cve_data.get('metrics', {})
-            if metrics.get('cvssMetricV31'):
-                metric = metrics['cvssMetricV31'][0].get('cvssData', {})
-                cvss_score = metric.get('baseScore', 'N/A')
-                cvss_severity = metric.get('baseSeverity', 'N/A')
-            elif metrics.get('cvssMetricV30'):
-                metric = metrics['cvssMetricV30'][0].get('cvssData', {})
-                cvss_score = metric.get('baseScore', 'N/A')
-                cvss_severity = metric.get('baseSeverity', 'N/A')
-            elif metrics.get('cvssMetricV2'):
-                metric = metrics['cvssMetricV2'][0].get('cvssData', {})
-                cvss_score = metric.get('baseScore', 'N/A')
-                cvss_severity = metric.get('baseSeverity', 'N/A')
-
-            # Obtener referencias (URLs)
-            references = [ref.get('url') for ref in cve_data.get('references', []) if ref.get('url')]
-
-            summarized_cves.append({
-                'cve_id': cve_id,
-                'description': description,
-                'cvss_score': cvss_score,
-                'cvss_severity': cvss_severity,
-                'references': references
-            })
+            summarized_cves.append(summarize_cve(cve_data))
         return summarized_cves
 
-def construct_cpe_name_simplified(service_name: str, version: str, generic: bool = False) -> Optional[str]:
+    def iter_cves(self, cpe_name: str, page_size: int = 500, parallel_pages: int = 3) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre todas las páginas de resultados del NVD para un CPE y va produciendo los CVEs resumidos.
+        La primera página indica totalResults; el resto se piden en paralelo (como máximo `parallel_pages`
+        a la vez, siempre dentro del limitador de tasa) y se entregan en orden. Solo se mantienen en memoria
+        las páginas en curso, no el conjunto completo.
+        """
+        first_page = self.search_cve(cpe_name, results_per_page=page_size, start_index=0)
+        if not first_page:
+            return
+        yield from self.parse_and_summarize_cve_data(first_page)
+
+        total_results = first_page.get('totalResults', 0)
+        page_size = first_page.get('resultsPerPage') or page_size
+        start_indexes = iter(range(page_size, total_results, page_size))
+        del first_page
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel_pages), thread_name_prefix="nvd-pages") as executor:
+            in_flight = deque()
+            for start_index in islice(start_indexes, parallel_pages):
+                in_flight.append((start_index, executor.submit(self.search_cve, cpe_name, page_size, start_index)))
+            while in_flight:
+                start_index, future = in_flight.popleft()
+                next_index = next(start_indexes, None)
+                if next_index is not None:
+                    in_flight.append((next_index, executor.submit(self.search_cve, cpe_name, page_size, next_index)))
+                page = future.result()
+                if page is None:
+                    logger.warning(f"No se pudo obtener la página startIndex={start_index} de {cpe_name}: los resultados estarán incompletos.")
+                    continue
+                yield from self.parse_and_summarize_cve_data(page)
+
+    def search_all_cves(self, cpe_name: str, max_results: Optional[int] = None, page_size: int = 500,
+                        parallel_pages: int = 3) -> List[Dict[str, Any]]:
+        """
+        Retorna todos los CVEs de un CPE ordenados por CVSS descendente. Con `max_results`
+        solo se conservan los N más graves (heap de tamaño N mientras se recorren las páginas).
+        """
+        def cvss_key(cve: Dict[str, Any]) -> float:
+            return cve['cvss_score'] if isinstance(cve['cvss_score'], (int, float)) else -1.0
+
+        cves = self.iter_cves(cpe_name, page_size=page_size, parallel_pages=parallel_pages)
+        if max_results:
+            return heapq.nlargest(max_results, cves, key=cvss_key)
+        return sorted(cves, key=cvss_key, reverse=True)
+
+def construct_cpe_name_simplified(service_name: str, version: str, generic: bool = False,
+                                  cpe_dictionary: Optional["CPEDictionary"] = None) -> Optional[str]:
     """
     Construye un CPE (Common Platform Enumeration) simplificado a partir del nombre
-    del servicio y su versión.
+    del servicio y su versión. Si se indica un CPEDictionary, el vendor/product se toman
+    del diccionario (a partir del producto que aparece en la versión de Nmap); si el diccionario
+    no lo reconoce, solo se usa el vendor_map interno para los servicios que contiene, y si no
+    se retorna None en lugar de un CPE inventado que costaría una consulta inútil al NVD.
+    Con diccionario el resultado se memoriza por (service_name, version, generic).
     """
     if not service_name or not version:
         return None
+    if cpe_dictionary is not None:
+        return _memoized_cpe_name(service_name, version, generic, cpe_dictionary)
+    return _build_cpe_name(service_name, version, generic, None)
+
+
+@lru_cache(maxsize=8192)
+def _memoized_cpe_name(service_name: str, version: str, generic: bool, cpe_dictionary: "CPEDictionary") -> Optional[str]:
+    return _build_cpe_name(service_name, version, generic, cpe_dictionary)
+
+
+def _build_cpe_name(service_name: str, version: str, generic: bool, cpe_dictionary: Optional["CPEDictionary"]) -> Optional[str]:
+    # Paso 0: Windows y productos cuya versión es la de un componente (ver cpe_dictionary.special_case_cpe_name)
+    handled, special_cpe = special_case_cpe_name(version)
+    if handled:
+        logger.info(f"CPE especial: {special_cpe} (Servicio: '{service_name}', Versión original: '{version}')")
+        return special_cpe
 
     # Paso 1: Limpiar texto entre paréntesis (ej. "(Ubuntu Linux; protocol 2.0)")
     version_without_parentheses = re.sub(r'\s*\(.*?\)\s*', '', version).strip()
@@ -167,6 +359,73 @@ def construct_cpe_name_simplified(service_name: str, version: str, generic: bool
     elif normalized_service == "ms-wbt-server":
         product = "windows_server"
 
-    cpe = f"cpe:2.3:a:{vendor}:{product}:{normalized_version}:*:*:*:*:*:*:*"
+    part = "a"
+    resolved_product = cpe_dictionary.lookup_product(service_name, version) if cpe_dictionary else None
+    if resolved_product:
+        part, vendor, product = resolved_product
+    elif cpe_dictionary and normalized_service not in vendor_map:
+        logger.info(f"CPE no resuelto: el diccionario no reconoce '{version}' (Servicio: '{service_name}').")
+        return None
+
+    cpe = f"cpe:2.3:{part}:{vendor}:{product}:{normalized_version}:*:*:*:*:*:*:*"
     logger.info(f"CPE construido: {cpe} (Servicio: '{service_name}', Versión original: '{version}', Versión limpia final: '{normalized_version}', Genérico: {generic})")
     return cpe
+
+
+# Ejemplo de uso (para pruebas) contra un servidor HTTP local que simula la API del NVD
+if __name__ == '__main__':
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    request_count = {"n": 0}
+
+    class StubNVDHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive, como la API real
+
+        def do_GET(self):
+            request_count["n"] += 1
+            # Las dos primeras peticiones simulan cuota agotada (una con Retry-After, otra sin él)
+            if request_count["n"] <= 2:
+                self.send_response(429 if request_count["n"] == 1 else 503)
+                if request_count["n"] == 1:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            # Catálogo simulado de 12 CVEs paginado según startIndex/resultsPerPage
+            query = parse_qs(urlparse(self.path).query)
+            start_index, page_size = int(query["startIndex"][0]), int(query["resultsPerPage"][0])
+            total = 12
+            vulnerabilities = [{"cve": {
+                "id": f"CVE-2024-{1000 + i}", "descriptions": [{"lang": "en", "value": f"Demo vulnerability {i}"}],
+                "metrics": {"cvssMetricV31": [{"cvssData": {"baseScore": round(1 + (i * 7) % 9 + 0.5, 1), "baseSeverity": "DEMO"}}]}}}
+                for i in range(start_index, min(total, start_index + page_size))]
+            body = json.dumps({"totalResults": total, "resultsPerPage": page_size, "startIndex": start_index,
+                               "vulnerabilities": vulnerabilities}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNVDHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = SimpleNVDAPIClient(
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0",
+        rate_limiter=TokenBucket(rate=10, per_seconds=1, capacity=1),
+        backoff_base_seconds=0.2
+    )
+    response = client.search_cve("cpe:2.3:a:openbsd:openssh:7.6p1:*:*:*:*:*:*:*")
+    print("Primera página:", [c['cve_id'] for c in client.parse_and_summarize_cve_data(response)])
+    all_cves = client.search_all_cves("cpe:2.3:a:openbsd:openssh:7.6p1:*:*:*:*:*:*:*", page_size=5)
+    print("Todas las páginas:", [(c['cve_id'], c['cvss_score']) for c in all_cves])
+    top_cves = client.search_all_cves("cpe:2.3:a:openbsd:openssh:7.6p1:*:*:*:*:*:*:*", max_results=3, page_size=5)
+    print("Top 3 por CVSS:", [(c['cve_id'], c['cvss_score']) for c in top_cves])
+    print("Métricas:", client.get_metrics())
+    server.shutdown()
@@ -0,0 +1,357 @@
+# src/modules/cve_lookup/nvd_mirror.py
+"""
+Réplica local del NVD para buscar CVEs sin red.
+
+Importar feeds JSON 2.0 completos (ficheros .json o .json.gz descargados del NVD o respuestas guardadas de la API):
+    python -m modules.cve_lookup.nvd_mirror import nvdcve-2.0-2023.json.gz nvdcve-2.0-2024.json.gz
+Consultar un CPE:
+    python -m modules.cve_lookup.nvd_mirror lookup cpe:2.3:a:openbsd:openssh:7.6p1:*:*:*:*:*:*:*
+"""
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from modules.cve_lookup.cve_summary import summarize_cve
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cpe(cpe_name: str) -> Optional[Dict[str, str]]:
+    """Descompone un CPE 2.3 formateado. Retorna {"part", "vendor", "product", "version", "update"} o None."""
+    # Los ':' escapados (\:) forman parte del valor, no separan campos
+    fields = re.split(r'(?<!\\):', cpe_name)
+    if len(fields) < 6 or fields[0] != 'cpe' or fields[1] != '2.3':
+        return None
+    return {"part": fields[2], "vendor": fields[3], "product": fields[4], "version": fields[5],
+            "update": fields[6] if len(fields) > 6 else '*'}
+
+
+def _version_key(version: str) -> List[Tuple[int, Any]]:
+    # "7.6p1" -> [(1, 7), (1, 6), (0, 'p'), (1, 1)]. Los segmentos alfabéticos ordenan antes que los numéricos.
+    return [(1, int(token)) if token.isdigit() else (0, token.lower())
+            for token in re.findall(r'\d+|[A-Za-z]+', version)]
+
+
+def compare_versions(version_a: str, version_b: str) -> int:
+    """
+    Compara dos versiones segmento a segmento (números como enteros, letras como texto).
+    Retorna -1, 0 o 1. Es una aproximación: no conoce semánticas propias de cada producto.
+    """
+    key_a, key_b = _version_key(version_a), _version_key(version_b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+class NVDMirror:
+    """
+    Almacén SQLite con los CVEs del NVD y sus criterios cpeMatch (incluidos los rangos de versión).
+    Los criterios se indexan por (vendor, product) para que la búsqueda por servicio no recorra la tabla.
+    """
+    def __init__(self, db_name: str = 'nvd_mirror.db'):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self._create_tables()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_tables(self):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cves (
+                    cve_id TEXT PRIMARY KEY,
+                    summary_json TEXT NOT NULL,
+                    cvss_score REAL,
+                    published TEXT,
+                    last_modified TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cpe_matches (
+                    cve_id TEXT NOT NULL,
+                    vendor TEXT NOT NULL,
+                    product TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    version_start_including TEXT,
+                    version_start_excluding TEXT,
+                    version_end_including TEXT,
+                    version_end_excluding TEXT,
+                    criteria TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cpe_matches_vendor_product ON cpe_matches (vendor, product)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cpe_matches_cve_id ON cpe_matches (cve_id)")
+            # Productos con criterios importados desde feeds completos. Los deltas de la sincronización
+            # incremental solo traen los CVEs modificados recientemente, así que no bastan para dar por
+            # cubierto un producto en las búsquedas híbridas.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS full_feed_products (
+                    vendor TEXT NOT NULL,
+                    product TEXT NOT NULL,
+                    PRIMARY KEY (vendor, product)
+                )
+            """)
+            # Estado de la sincronización incremental (ej. fin de la última ventana lastModified consultada)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+
+    @staticmethod
+    def load_feed(path: str) -> Dict[str, Any]:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _extract_matches(cve_data: Dict[str, Any]) -> List[Tuple]:
+        """
+        Extrae los criterios cpeMatch vulnerables de todas las configuraciones del CVE.
+        Los nodos AND (ej. "aplicación X sobre el SO Y") se aplanan: basta con que coincida la aplicación.
+        """
+        matches = []
+        for configuration in cve_data.get('configurations', []):
+            for node in configuration.get('nodes', []):
+                if node.get('negate'):
+                    continue
+                for cpe_match in node.get('cpeMatch', []):
+                    if not cpe_match.get('vulnerable'):
+                        continue
+                    cpe = parse_cpe(cpe_match.get('criteria', ''))
+                    if not cpe:
+                        continue
+                    version = cpe['version']
+                    if version not in ('*', '-') and cpe['update'] not in ('*', '-'):
+                        # El NVD separa "8.9p1" en version=8.9 y update=p1; Molly los construye juntos
+                        version = f"{version}{cpe['update']}"
+                    matches.append((
+                        cve_data['id'], cpe['vendor'], cpe['product'], version,
+                        cpe_match.get('versionStartIncluding'), cpe_match.get('versionStartExcluding'),
+                        cpe_match.get('versionEndIncluding'), cpe_match.get('versionEndExcluding'),
+                        cpe_match['criteria']
+                    ))
+        return matches
+
+    def import_vulnerabilities(self, vulnerabilities: List[Dict[str, Any]], full_feed: bool = False) -> int:
+        """
+        Inserta o actualiza una lista de entradas {"cve": {...}} en una sola transacción.
+        Los criterios anteriores de cada CVE se reemplazan. Con `full_feed` los productos de los
+        criterios se marcan como cubiertos (ver has_product). Retorna el número de CVEs importados.
+        """
+        cve_rows = []
+        match_rows = []
+        for vuln_entry in vulnerabilities:
+            cve_data = vuln_entry.get('cve')
+            if not cve_data or not cve_data.get('id'):
+                continue
+            summary = summarize_cve(cve_data)
+            cvss_score = summary['cvss_score'] if isinstance(summary['cvss_score'], (int, float)) else None
+            cve_rows.append((cve_data['id'], json.dumps(summary), cvss_score,
+                             cve_data.get('published'), cve_data.get('lastModified')))
+            match_rows.extend(self._extract_matches(cve_data))
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM cpe_matches WHERE cve_id = ?", [(row[0],) for row in cve_rows])
+            cursor.executemany(
+                "INSERT OR REPLACE INTO cves (cve_id, summary_json, cvss_score, published, last_modified) VALUES (?, ?, ?, ?, ?)",
+                cve_rows
+            )
+            cursor.executemany(
+                """INSERT INTO cpe_matches (cve_id, vendor, product, version, version_start_including, version_start_excluding,
+                version_end_including, version_end_excluding, criteria) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                match_rows
+            )
+            if full_feed:
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO full_feed_products (vendor, product) VALUES (?, ?)",
+                    {(row[1], row[2]) for row in match_rows}
+                )
+            conn.commit()
+        return len(cve_rows)
+
+    def import_feed(self, path: str) -> int:
+        """Importa un fichero de feed JSON 2.0 completo (.json o .json.gz). Retorna el número de CVEs importados."""
+        start_time = time.time()
+        feed = self.load_feed(path)
+        imported = self.import_vulnerabilities(feed.get('vulnerabilities', []), full_feed=True)
+        logger.info(f"[NVDMirror] {imported} CVEs importados desde {path} en {time.time() - start_time:.1f}s.")
+        return imported
+
+    def get_matches_for_product(self, vendor: str, product: str) -> List[Dict[str, Any]]:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT m.*, c.summary_json, c.cvss_score FROM cpe_matches m
+                JOIN cves c ON c.cve_id = m.cve_id
+                WHERE m.vendor = ? AND m.product = ?
+            """, (vendor, product))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_matches_for_cves(self, cve_ids: List[str]) -> List[Dict[str, Any]]:
+        """Obtiene los criterios cpeMatch (con el resumen del CVE) de una lista de CVEs."""
+        matches = []
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            # Por lotes para no superar el límite de parámetros de SQLite
+            for offset in range(0, len(cve_ids), 500):
+                batch = cve_ids[offset:offset + 500]
+                cursor.execute(f"""
+                    SELECT m.*, c.summary_json, c.cvss_score FROM cpe_matches m
+                    JOIN cves c ON c.cve_id = m.cve_id
+                    WHERE m.cve_id IN ({','.join('?' * len(batch))})
+                """, batch)
+                matches.extend(dict(row) for row in cursor.fetchall())
+        return matches
+
+    def get_sync_state(self, key: str) -> Optional[str]:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM sync_state WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def set_sync_state(self, key: str, value: str):
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+
+    def has_product(self, vendor: str, product: str) -> bool:
+        """Indica si el producto llegó en algún feed completo (los deltas de la sincronización no cuentan)."""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM full_feed_products WHERE vendor = ? AND product = ?", (vendor, product))
+            return cursor.fetchone() is not None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*), MAX(last_modified) FROM cves")
+            cve_count, last_modified = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*) FROM cpe_matches")
+            match_count = cursor.fetchone()[0]
+        return {"cves": cve_count, "cpe_matches": match_count, "last_modified": last_modified}
+
+
+class LocalCVEMatcher:
+    """
+    Resuelve CVEs contra la réplica local evaluando los rangos versionStart*/versionEnd* en memoria.
+    Los criterios de cada (vendor, product) se cargan una sola vez y se memorizan, de modo que
+    las búsquedas repetidas del mismo producto no tocan SQLite.
+    """
+    def __init__(self, mirror: NVDMirror):
+        self.mirror = mirror
+        self._product_matches: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._known_products: Dict[Tuple[str, str], bool] = {}
+        self._lock = threading.Lock()
+
+    def clear_cache(self):
+        """Olvida los criterios memorizados (llamar tras importar feeds nuevos)."""
+        with self._lock:
+            self._product_matches.clear()
+            self._known_products.clear()
+
+    def _get_product_matches(self, vendor: str, product: str) -> List[Dict[str, Any]]:
+        key = (vendor, product)
+        with self._lock:
+            if key in self._product_matches:
+                return self._product_matches[key]
+        matches = self.mirror.get_matches_for_product(vendor, product)
+        for match in matches:
+            match['summary'] = json.loads(match.pop('summary_json'))
+        with self._lock:
+            self._product_matches[key] = matches
+        return matches
+
+    def knows_product(self, cpe_name: str) -> bool:
+        """
+        Indica si la réplica cubre el vendor/product del CPE, es decir, si llegó en un feed completo.
+        Un producto que solo aparece en deltas de la sincronización tiene únicamente sus CVEs recientes.
+        """
+        cpe = parse_cpe(cpe_name)
+        if not cpe:
+            return False
+        key = (cpe['vendor'], cpe['product'])
+        with self._lock:
+            if key in self._known_products:
+                return self._known_products[key]
+        known = self.mirror.has_product(*key)
+        with self._lock:
+            self._known_products[key] = known
+        return known
+
+    @staticmethod
+    def version_matches(match: Dict[str, Any], version: str) -> bool:
+        criteria_version = match['version']
+        if criteria_version not in ('*', '-'):
+            # Criterio de versión concreta
+            return compare_versions(version, criteria_version) == 0
+        has_range = any(match[bound] for bound in ('version_start_including', 'version_start_excluding',
+                                                   'version_end_including', 'version_end_excluding'))
+        if not has_range:
+            # Sin versión ni rango: afecta a todas las versiones del producto
+            return True
+        if match['version_start_including'] and compare_versions(version, match['version_start_including']) < 0:
+            return False
+        if match['version_start_excluding'] and compare_versions(version, match['version_start_excluding']) <= 0:
+            return False
+        if match['version_end_including'] and compare_versions(version, match['version_end_including']) > 0:
+            return False
+        if match['version_end_excluding'] and compare_versions(version, match['version_end_excluding']) >= 0:
+            return False
+        return True
+
+    def search_cpe(self, cpe_name: str) -> List[Dict[str, Any]]:
+        """
+        Retorna los CVEs que afectan al CPE, con el mismo formato que
+        SimpleNVDAPIClient.parse_and_summarize_cve_data, ordenados por CVSS descendente.
+        """
+        cpe = parse_cpe(cpe_name)
+        if not cpe or cpe['version'] in ('*', '-', ''):
+            return []
+
+        found: Dict[str, Dict[str, Any]] = {}
+        for match in self._get_product_matches(cpe['vendor'], cpe['product']):
+            if match['cve_id'] not in found and self.version_matches(match, cpe['version']):
+                found[match['cve_id']] = match
+        ranked = sorted(found.values(), key=lambda m: m['cvss_score'] or 0, reverse=True)
+        return [match['summary'] for match in ranked]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('import', 'lookup'):
+        print(__doc__)
+        return 1
+
+    mirror = NVDMirror()
+    if argv[0] == 'import':
+        total = sum(mirror.import_feed(path) for path in argv[1:])
+        print(f"{total} CVEs importados. Estado de la réplica: {mirror.get_stats()}")
+    else:
+        matcher = LocalCVEMatcher(mirror)
+        for cpe_name in argv[1:]:
+            start_time = time.perf_counter()
+            cves = matcher.search_cpe(cpe_name)
+            print(f"{cpe_name}: {len(cves)} CVEs ({(time.perf_counter() - start_time) * 1000:.2f} ms)")
+            for cve in cves:
+                print(f"  {cve['cve_id']} [{cve['cvss_severity']} {cve['cvss_score']}] {cve['description'][:100]}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -1,5 +1,7 @@
 # src/modules/nmap_tool/nmap_parser.py
+import io
 import re
+import xml.etree.ElementTree as ET
 from typing import Dict, Any, List
 
 class NmapParser:
@@ -94,6 +96,54 @@ class NmapParser:
         
         return hosts_data
 
+    def parse_nmap_xml_output(self, nmap_xml_output: str) -> Dict[str, Any]:
+        """
+        Parsea la salida XML de Nmap (-oX) y retorna la misma estructura que parse_nmap_output.
+        Se procesa host a host con iterparse y se liberan los elementos ya leídos, por lo que
+        la memoria no crece con el número de hosts más allá del resultado.
+        """
+        hosts_data: Dict[str, Any] = {"hosts": {}}
+
+        for _, elem in ET.iterparse(io.StringIO(nmap_xml_output), events=('end',)):
+            if elem.tag != 'host':
+                continue
+
+            status = elem.find('status')
+            address = next((a.get('addr') for a in elem.findall('address') if a.get('addrtype') in ('ipv4', 'ipv6')), None)
+            if address is None or (status is not None and status.get('state') != 'up'):
+                elem.clear()
+                continue
+
+            hostname_elem = elem.find('hostnames/hostname')
+            osmatch_elem = elem.find('os/osmatch')
+            ports: List[Dict[str, Any]] = []
+            for port_elem in elem.iter('port'):
+                state_elem = port_elem.find('state')
+                service_elem = port_elem.find('service')
+                service_name = "unknown"
+                version = "N/A"
+                if service_elem is not None:
+                    service_name = service_elem.get('name') or "unknown"
+                    extrainfo = service_elem.get('extrainfo')
+                    version_parts = [service_elem.get('product'), service_elem.get('version'), f"({extrainfo})" if extrainfo else None]
+                    version = " ".join(part for part in version_parts if part) or "N/A"
+                ports.append({
+                    "port": int(port_elem.get('portid')),
+                    "protocol": port_elem.get('protocol'),
+                    "state": state_elem.get('state') if state_elem is not None else "unknown",
+                    "service_name": service_name,
+                    "version": version
+                })
+
+            hosts_data["hosts"][address] = {
+                "hostname": hostname_elem.get('name') if hostname_elem is not None else address,
+                "os_info": osmatch_elem.get('name') if osmatch_elem is not None else None,
+                "ports": ports
+            }
+            elem.clear()
+
+        return hosts_data
+
 # Ejemplo de uso (para pruebas)
 if __name__ == '__main__':
     parser = NmapParser()
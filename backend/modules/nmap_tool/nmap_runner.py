@@ -1,6 +1,6 @@
 # src/modules/nmap_tool/nmap_runner.py
 from utils.command_runner import CommandRunner, CommandResult
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class NmapRunner:
     """
@@ -11,13 +11,24 @@ class NmapRunner:
         self.nmap_executable = "nmap" # Podría ser configurable
         print("[NmapRunner] Inicializado.")
 
-    def build_command(self, target: str, profile: str = 'default_scan', ports: str = None) -> str:
+    # Tasas por defecto (paquetes/s) de cada perfil cuando no hay un ScanRateGovernor que las asigne.
+    DEFAULT_PROFILE_RATES = {
+        'default_scan': (500, 1000),
+        'full_tcp_udp_scan': (None, 500),
+    }
+
+    def build_command(self, target: str, profile: str = 'default_scan', ports: str = None,
+                      min_rate: Optional[int] = None, max_rate: Optional[int] = None,
+                      max_parallelism: Optional[int] = None) -> str:
         """
         Construye un comando Nmap basado en un perfil predefinido.
         Args:
             target (str): Dirección IP o rango de red objetivo.
             profile (str): Nombre del perfil de escaneo (ej. 'default_scan', 'os_detection').
             ports (str, optional): Puertos específicos a escanear (ej. "22,80,443").
+            min_rate (int, optional): --min-rate asignado (ej. por el ScanRateGovernor).
+            max_rate (int, optional): --max-rate asignado. Sobrescribe la tasa por defecto del perfil.
+            max_parallelism (int, optional): --max-parallelism para limitar sondas simultáneas.
 
         Returns:
             str: El comando Nmap completo a ejecutar.
@@ -29,19 +40,38 @@ class NmapRunner:
             # -p- escanea todos los puertos (1-65535). Usar con cuidado o definir un rango.
             # --max-rate para no inundar. --open para mostrar solo puertos abiertos.
             # Puedes ajustar los timeouts según tu necesidad y entorno.
-            command_options = "-sS -sV -O --min-rate 500 --max-rate 1000 --min-rtt-timeout 100ms --max-rtt-timeout 1000ms --initial-rtt-timeout 500ms --open"
+            command_options = "-sS -sV -O --min-rtt-timeout 100ms --max-rtt-timeout 1000ms --initial-rtt-timeout 500ms --open"
         elif profile == 'os_detection':
             # Solo detección de SO.
             command_options = "-O"
         elif profile == 'full_tcp_udp_scan':
             # Escaneo TCP y UDP de puertos comunes. Requires root/sudo.
-            command_options = "-sS -sU -p 1-1024 --max-rate 500 --open" # Puede ser muy lento, ajustar.
+            command_options = "-sS -sU -p 1-1024 --open" # Puede ser muy lento, ajustar.
+        elif profile == 'service_detection':
+            # Solo versiones sobre puertos ya descubiertos (ej. por AsyncConnectScanner). -sT no requiere root.
+            command_options = "-sT -sV -Pn --open"
+        elif profile == 'service_os_detection':
+            # Versiones + SO sobre puertos ya descubiertos. -O requiere root/sudo.
+            command_options = "-sS -sV -O -Pn --open"
         elif profile == 'vulnerability_script_scan':
             # Escaneo con scripts de vulnerabilidades básicas (requiere root/sudo).
             command_options = "-sV -sC --script vuln" # -sC: default scripts, --script vuln: common vulns
         else:
             # Perfil por defecto o un perfil personalizado simple.
             command_options = "-sS -sV" 
+
+        default_min_rate, default_max_rate = self.DEFAULT_PROFILE_RATES.get(profile, (None, None))
+        effective_max_rate = max_rate if max_rate is not None else default_max_rate
+        effective_min_rate = min_rate if min_rate is not None else default_min_rate
+        if effective_min_rate is not None and effective_max_rate is not None:
+            # --min-rate nunca debe superar el techo asignado
+            effective_min_rate = min(effective_min_rate, effective_max_rate)
+        if effective_min_rate is not None:
+            command_options += f" --min-rate {effective_min_rate}"
+        if effective_max_rate is not None:
+            command_options += f" --max-rate {effective_max_rate}"
+        if max_parallelism is not None:
+            command_options += f" --max-parallelism {max_parallelism}"
         
         if ports:
             # Si se especifican puertos, sobrescriben el comportamiento de escaneo de puertos del perfil.
@@ -0,0 +1,200 @@
+# src/modules/nmap_tool/rate_governor.py
+import ipaddress
+import itertools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class RateLease:
+    """
+    Asignación de tasa de paquetes concedida a un escaneo (o shard de escaneo) activo.
+    Los valores se traducen directamente a --min-rate / --max-rate / --max-parallelism de Nmap.
+    """
+    def __init__(self, lease_id: int, target: str, networks: Optional[List[Any]], max_rate: int, min_rate: int, max_parallelism: Optional[int]):
+        self.lease_id = lease_id
+        self.target = target
+        self.networks = networks
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_parallelism = max_parallelism
+        self.acquired_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "lease_id": self.lease_id,
+            "target": self.target,
+            "max_rate": self.max_rate,
+            "min_rate": self.min_rate,
+            "max_parallelism": self.max_parallelism,
+            "running_seconds": round(time.time() - self.acquired_at, 1)
+        }
+
+
+class ScanRateGovernor:
+    """
+    Reparte un presupuesto global de paquetes por segundo entre todos los procesos Nmap
+    activos y limita cuántos escaneos pueden sondear simultáneamente el mismo host o subred.
+
+    Nmap no permite cambiar la tasa de un proceso en ejecución, por lo que el reparto se
+    recalcula cada vez que un escaneo o shard arranca o termina: los escaneos largos se
+    dividen en shards (ver split_target_into_shards) y cada shard pide una nueva asignación.
+    """
+    def __init__(self, global_max_rate: int = 2000, min_rate_per_scan: int = 100,
+                 max_rate_per_scan: int = 1000, max_scans_per_subnet: int = 1,
+                 max_parallelism: Optional[int] = None, acquire_timeout: Optional[float] = None):
+        self.global_max_rate = global_max_rate
+        self.min_rate_per_scan = min(min_rate_per_scan, global_max_rate)
+        self.max_rate_per_scan = max_rate_per_scan
+        self.max_scans_per_subnet = max_scans_per_subnet
+        self.max_parallelism = max_parallelism
+        self.acquire_timeout = acquire_timeout
+
+        self._condition = threading.Condition()
+        self._active_leases: Dict[int, RateLease] = {}
+        self._waiting = 0
+        self._lease_ids = itertools.count(1)
+        logger.info(f"[ScanRateGovernor] Inicializado. Presupuesto global: {global_max_rate} pps, "
+                    f"máximo por escaneo: {max_rate_per_scan} pps, escaneos por subred: {max_scans_per_subnet}.")
+
+    @staticmethod
+    def _parse_networks(target: str) -> Optional[List[Any]]:
+        """
+        Convierte el objetivo (una o varias IPs/CIDR separadas por espacios o comas) en redes ipaddress.
+        Retorna None si algún elemento no es una IP/CIDR (ej. un hostname).
+        """
+        networks = []
+        for item in re.split(r"[,\s]+", target.strip()):
+            if not item:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(item, strict=False))
+            except ValueError:
+                return None
+        return networks or None
+
+    def _overlapping_leases(self, target: str, networks: Optional[List[Any]]) -> int:
+        count = 0
+        for lease in self._active_leases.values():
+            if networks is not None and lease.networks is not None:
+                if any(network.version == other.version and network.overlaps(other)
+                       for network in networks for other in lease.networks):
+                    count += 1
+            elif lease.target.lower() == target.lower():
+                count += 1
+        return count
+
+    def _available_rate(self) -> int:
+        return self.global_max_rate - sum(lease.max_rate for lease in self._active_leases.values())
+
+    def _can_start(self, target: str, networks: Optional[List[Any]]) -> bool:
+        if self._overlapping_leases(target, networks) >= self.max_scans_per_subnet:
+            return False
+        return self._available_rate() >= self.min_rate_per_scan
+
+    def acquire(self, target: str, timeout: Optional[float] = None) -> RateLease:
+        """
+        Bloquea hasta que haya presupuesto de paquetes y el objetivo no tenga ya demasiados
+        escaneos concurrentes. La tasa concedida es la parte justa del presupuesto global
+        entre los escaneos activos, limitada por lo que queda libre y por el máximo por escaneo.
+        `timeout` acota la espera de esta petición (ej. el plazo restante del escaneo) además de acquire_timeout.
+        """
+        networks = self._parse_networks(target)
+        wait_limits = [limit for limit in (self.acquire_timeout or None, timeout) if limit is not None]
+        wait_limit = min(wait_limits) if wait_limits else None
+        deadline = time.time() + wait_limit if wait_limit is not None else None
+
+        with self._condition:
+            self._waiting += 1
+            try:
+                while not self._can_start(target, networks):
+                    remaining = deadline - time.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No se obtuvo presupuesto de escaneo para {target} en {wait_limit:.0f}s.")
+                    logger.info(f"[ScanRateGovernor] Esperando presupuesto para {target} "
+                                f"(activos: {len(self._active_leases)}, libre: {self._available_rate()} pps).")
+                    self._condition.wait(timeout=remaining)
+            finally:
+                self._waiting -= 1
+
+            # Los escaneos en espera también cuentan: así el siguiente shard de un escaneo largo cede parte del presupuesto
+            fair_share = self.global_max_rate // (len(self._active_leases) + self._waiting + 1)
+            max_rate = min(self._available_rate(), self.max_rate_per_scan, max(fair_share, self.min_rate_per_scan))
+            min_rate = min(self.min_rate_per_scan, max_rate)
+
+            lease = RateLease(next(self._lease_ids), target, networks, max_rate, min_rate, self.max_parallelism)
+            self._active_leases[lease.lease_id] = lease
+
+        logger.info(f"[ScanRateGovernor] Asignados {max_rate} pps a {target} (lease {lease.lease_id}, escaneos activos: {len(self._active_leases)}).")
+        return lease
+
+    def release(self, lease: RateLease):
+        """Libera la asignación y despierta a los escaneos en espera para que se recalcule el reparto."""
+        with self._condition:
+            self._active_leases.pop(lease.lease_id, None)
+            self._condition.notify_all()
+        logger.info(f"[ScanRateGovernor] Liberados {lease.max_rate} pps de {lease.target} (lease {lease.lease_id}).")
+
+    @contextmanager
+    def lease(self, target: str, timeout: Optional[float] = None) -> Iterator[RateLease]:
+        acquired = self.acquire(target, timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            self.release(acquired)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Retorna el estado actual del reparto (útil para diagnóstico)."""
+        with self._condition:
+            return {
+                "global_max_rate": self.global_max_rate,
+                "available_rate": self._available_rate(),
+                "active_leases": [lease.to_dict() for lease in self._active_leases.values()]
+            }
+
+
+def split_target_into_shards(target: str, shard_prefix: Optional[int]) -> List[str]:
+    """
+    Divide un rango CIDR en subredes más pequeñas para que cada shard negocie su propia
+    tasa con el ScanRateGovernor. Los objetivos que no son CIDR (IPs sueltas, hostnames,
+    rangos estilo Nmap) se devuelven tal cual.
+    """
+    if not shard_prefix or '/' not in target:
+        return [target]
+    try:
+        network = ipaddress.ip_network(target.strip(), strict=False)
+    except ValueError:
+        return [target]
+    if network.version != 4 or network.prefixlen >= shard_prefix:
+        return [target]
+    return [str(subnet) for subnet in network.subnets(new_prefix=shard_prefix)]
+
+
+# Ejemplo de uso (para pruebas)
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    governor = ScanRateGovernor(global_max_rate=2000, min_rate_per_scan=100, max_rate_per_scan=1000, max_scans_per_subnet=1)
+
+    print("--- Shards de 192.168.1.0/24 con prefijo /26 ---")
+    print(split_target_into_shards("192.168.1.0/24", 26))
+
+    def simulated_scan(target: str, seconds: float):
+        with governor.lease(target) as lease:
+            print(f"{target}: {lease.max_rate} pps")
+            time.sleep(seconds)
+
+    threads = [
+        threading.Thread(target=simulated_scan, args=("10.0.0.0/24", 0.5)),
+        threading.Thread(target=simulated_scan, args=("10.0.1.0/24", 0.5)),
+        threading.Thread(target=simulated_scan, args=("10.0.0.5", 0.2)),  # Se solapa con 10.0.0.0/24: espera
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(governor.get_status())
@@ -0,0 +1,223 @@
+# src/modules/scan_engines/async_connect_scanner.py
+import asyncio
+import ipaddress
+import logging
+import re
+import socket
+import time
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+from modules.scan_engines.scanner_engine import ScannerEngine
+from modules.nmap_tool.rate_governor import ScanRateGovernor
+
+logger = logging.getLogger(__name__)
+
+# Puertos TCP más habituales. Se usan cuando no se especifica una lista de puertos.
+DEFAULT_CONNECT_PORTS = (
+    "21-23,25,53,80,81,88,110,111,135,139,143,389,443,445,465,587,593,636,873,993,995,"
+    "1025,1080,1433,1521,1723,2049,2082,2083,2181,2375,2376,3000,3128,3306,3389,4443,"
+    "5000,5432,5601,5672,5900,5985,5986,6379,6443,7001,8000,8008,8080,8081,8443,8888,"
+    "9000,9090,9200,9300,9443,10000,11211,27017"
+)
+
+MAX_EXPANDED_HOSTS = 65536
+
+
+def parse_port_list(ports: str) -> List[int]:
+    """
+    Convierte una lista de puertos estilo Nmap ("22,80,8000-8100") en una lista ordenada de enteros.
+    """
+    result = set()
+    for chunk in ports.split(','):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        if '-' in chunk:
+            start, end = chunk.split('-', 1)
+            start_port, end_port = int(start or 1), int(end or 65535)
+            result.update(range(max(start_port, 1), min(end_port, 65535) + 1))
+        else:
+            port = int(chunk)
+            if 1 <= port <= 65535:
+                result.add(port)
+    return sorted(result)
+
+
+def expand_targets(target: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Expande un objetivo (IP, CIDR, rango de último octeto "192.168.1.10-20" o hostname,
+    separados por comas o espacios) en una lista de (ip, hostname).
+    """
+    expanded: List[Tuple[str, Optional[str]]] = []
+    range_pattern = re.compile(r"^(\d+\.\d+\.\d+\.)(\d+)-(\d+)$")
+
+    for item in re.split(r"[,\s]+", target.strip()):
+        if not item:
+            continue
+        range_match = range_pattern.match(item)
+        if range_match:
+            prefix, start, end = range_match.group(1), int(range_match.group(2)), int(range_match.group(3))
+            expanded.extend((f"{prefix}{octet}", None) for octet in range(start, min(end, 255) + 1))
+            continue
+        try:
+            network = ipaddress.ip_network(item, strict=False)
+        except ValueError:
+            network = None
+        if network is not None:
+            if network.num_addresses > MAX_EXPANDED_HOSTS:
+                raise ValueError(f"El rango {item} supera el máximo de {MAX_EXPANDED_HOSTS} hosts.")
+            hosts = list(network.hosts()) if network.num_addresses > 2 else list(network)
+            expanded.extend((str(ip), None) for ip in hosts)
+            continue
+        try:
+            resolved_ip = socket.gethostbyname(item)
+            expanded.append((resolved_ip, item))
+        except socket.gaierror:
+            logger.warning(f"[AsyncConnectScanner] No se pudo resolver el hostname '{item}'. Se omite.")
+    return expanded
+
+
+def guess_service_name(port: int) -> str:
+    try:
+        return socket.getservbyport(port, 'tcp')
+    except OSError:
+        return "unknown"
+
+
+class AsyncConnectScanner(ScannerEngine):
+    """
+    Descubrimiento de puertos TCP mediante connect() con asyncio. No necesita privilegios
+    de root ni Nmap, y es rápido barriendo muchos puertos gracias a la concurrencia.
+    Solo detecta puertos abiertos: la identificación de versiones/SO se deja a Nmap.
+    Con un ScanRateGovernor, el objetivo se divide en shards como en NmapScannerEngine y cada shard
+    abre conexiones como mucho a la tasa (pps) que le asigna el gobernador, compartiendo el
+    presupuesto global y el límite de escaneos por subred con los procesos Nmap.
+    """
+    name = "connect"
+
+    def __init__(self, concurrency: int = 500, timeout: float = 1.0, ports: str = DEFAULT_CONNECT_PORTS,
+                 per_host_concurrency: int = 100, rate_governor: Optional[ScanRateGovernor] = None,
+                 shard_prefix: Optional[int] = 26):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.default_ports = ports
+        self.per_host_concurrency = per_host_concurrency
+        self.rate_governor = rate_governor
+        self.shard_prefix = shard_prefix
+        logger.info(f"[AsyncConnectScanner] Inicializado. Concurrencia: {concurrency}, timeout: {timeout}s, "
+                    f"máx. conexiones por host: {per_host_concurrency}.")
+
+    async def _probe(self, ip: str, port: int, host_semaphore: asyncio.Semaphore) -> bool:
+        async with host_semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=self.timeout)
+            except (asyncio.TimeoutError, OSError):
+                return False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return True
+
+    async def scan_async(self, hosts: List[Tuple[str, Optional[str]]], ports: List[int], max_rate: Optional[int] = None) -> Dict[str, List[int]]:
+        """
+        Sondea todas las combinaciones (host, puerto) con un número fijo de workers,
+        sin crear una tarea por combinación. Con `max_rate` las conexiones se inician
+        como mucho a esa tasa por segundo. Retorna {ip: [puertos abiertos]}.
+        """
+        open_ports: Dict[str, List[int]] = {}
+        host_semaphores = {ip: asyncio.Semaphore(self.per_host_concurrency) for ip, _ in hosts}
+        # Se recorre por puerto y luego por host para repartir la carga entre hosts
+        pairs: Iterator[Tuple[str, int]] = ((ip, port) for port in ports for ip, _ in hosts)
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / max_rate if max_rate else 0.0
+        next_start = [loop.time()]
+
+        async def throttle():
+            # Un único hilo de eventos: reservar el siguiente hueco no necesita cerrojo
+            slot = max(loop.time(), next_start[0])
+            next_start[0] = slot + interval
+            if slot > loop.time():
+                await asyncio.sleep(slot - loop.time())
+
+        async def worker():
+            for ip, port in pairs:
+                if interval:
+                    await throttle()
+                if await self._probe(ip, port, host_semaphores[ip]):
+                    open_ports.setdefault(ip, []).append(port)
+
+        worker_count = max(1, min(self.concurrency, len(hosts) * len(ports)))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        return {ip: sorted(found) for ip, found in open_ports.items()}
+
+    def scan(self, target: str, ports: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+        if not self.rate_governor:
+            return self._scan_shard(target, ports)
+        return self._scan_in_shards(target, lambda shard, lease, deadline: self._scan_shard(shard, ports, max_rate=lease.max_rate))
+
+    def _scan_shard(self, target: str, ports: Optional[str] = None, max_rate: Optional[int] = None) -> Dict[str, Any]:
+        try:
+            hosts = expand_targets(target)
+            port_list = parse_port_list(ports or self.default_ports)
+        except ValueError as e:
+            return {"success": False, "stdout": "", "stderr": str(e), "parsed": {"hosts": {}}}
+
+        if not hosts or not port_list:
+            return {"success": False, "stdout": "", "stderr": f"No hay hosts o puertos válidos para '{target}'.", "parsed": {"hosts": {}}}
+
+        logger.info(f"[AsyncConnectScanner] Escaneando {len(hosts)} hosts x {len(port_list)} puertos"
+                    f"{f' (máx. {max_rate} conexiones/s)' if max_rate else ''}...")
+        start_time = time.time()
+        open_ports = asyncio.run(self.scan_async(hosts, port_list, max_rate=max_rate))
+        duration = time.time() - start_time
+
+        hostnames = {ip: hostname for ip, hostname in hosts}
+        parsed_hosts: Dict[str, Any] = {}
+        report_lines: List[str] = []
+        for ip in sorted(open_ports, key=lambda value: ipaddress.ip_address(value)):
+            ports_for_host = [
+                {"port": port, "protocol": "tcp", "state": "open", "service_name": guess_service_name(port), "version": "N/A"}
+                for port in open_ports[ip]
+            ]
+            parsed_hosts[ip] = {"hostname": hostnames.get(ip) or ip, "os_info": None, "ports": ports_for_host}
+
+            # Salida en el mismo formato de texto que Nmap para que sea re-parseable por NmapParser
+            header = f"Nmap scan report for {ip}" + (f" ({hostnames[ip]})" if hostnames.get(ip) else "")
+            report_lines.append(header)
+            report_lines.append("PORT     STATE SERVICE")
+            report_lines.extend(f"{p['port']}/tcp open {p['service_name']}" for p in ports_for_host)
+            report_lines.append("")
+
+        report_lines.append(f"# AsyncConnectScanner: {len(hosts)} hosts, {len(port_list)} puertos, "
+                            f"{len(parsed_hosts)} hosts con puertos abiertos, {duration:.2f}s")
+        logger.info(f"[AsyncConnectScanner] Escaneo completado en {duration:.2f}s. Hosts con puertos abiertos: {len(parsed_hosts)}.")
+
+        return {"success": True, "stdout": "\n".join(report_lines), "stderr": "", "parsed": {"hosts": parsed_hosts}}
+
+
+# Ejemplo de uso (para pruebas) contra listeners en localhost
+if __name__ == '__main__':
+    import json
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    listeners = []
+    for _ in range(3):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        listeners.append(sock)
+    listening_ports = [s.getsockname()[1] for s in listeners]
+    print(f"Listeners abiertos en: {listening_ports}")
+
+    scanner = AsyncConnectScanner(concurrency=200, timeout=0.5)
+    port_spec = ",".join(str(p) for p in listening_ports) + ",1-1024"
+    result = scanner.scan("127.0.0.1", ports=port_spec)
+    print(json.dumps(result["parsed"], indent=2))
+    found = [p["port"] for p in result["parsed"]["hosts"].get("127.0.0.1", {}).get("ports", [])]
+    assert all(p in found for p in listening_ports), "No se detectaron todos los listeners."
+    print("--- Todos los listeners detectados ---")
+
+    for sock in listeners:
+        sock.close()
@@ -0,0 +1,269 @@
+# src/modules/scan_engines/banner_grabber.py
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import os
+import sqlite3
+import ssl
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from modules.scan_engines.service_fingerprints import match_fingerprint, normalize_banner
+from modules.nmap_tool.rate_governor import ScanRateGovernor
+
+logger = logging.getLogger(__name__)
+
+# Puertos donde se habla TLS directamente (la sonda HTTP se envía sobre TLS)
+TLS_PORTS = {443, 465, 636, 993, 995, 4443, 5986, 6443, 8443, 9443}
+
+
+class BannerCache:
+    """
+    Caché persistente de identificaciones de servicio por (ip, puerto, hash del banner).
+    El banner se lee siempre (la clave incluye su hash); si coincide con el de un escaneo
+    anterior, se reutiliza su identificación (venga de la tabla de huellas o de Nmap -sV),
+    lo que ahorra el cotejo de huellas y, sobre todo, la invocación de Nmap -sV para ese puerto.
+    """
+    def __init__(self, db_name: str = 'banner_cache.db', ttl_hours: float = 168):
+        self.db_path = os.path.join('data', db_name)
+        os.makedirs('data', exist_ok=True)
+        self.ttl_seconds = ttl_hours * 3600
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS banner_cache (
+                    ip_address TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    banner_hash TEXT NOT NULL,
+                    service_name TEXT,
+                    version TEXT,
+                    source TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (ip_address, port, banner_hash)
+                )
+            """)
+            conn.commit()
+
+    def get(self, ip_address: str, port: int, banner_hash: str) -> Optional[Dict[str, Any]]:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT * FROM banner_cache WHERE ip_address = ? AND port = ? AND banner_hash = ? AND updated_at >= ?",
+                (ip_address, port, banner_hash, time.time() - self.ttl_seconds)
+            )
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def store(self, ip_address: str, port: int, banner_hash: str, service_name: str, version: str, source: str):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT OR REPLACE INTO banner_cache (ip_address, port, banner_hash, service_name, version, source, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (ip_address, port, banner_hash, service_name, version, source, time.time())
+            )
+            conn.commit()
+
+
+class AsyncBannerGrabber:
+    """
+    Conecta en paralelo a los puertos abiertos, lee el banner inicial (SSH, FTP, SMTP, MySQL...)
+    o, si el servicio no habla primero, envía una sonda HTTP HEAD y lee la cabecera Server.
+    El banner se compara con la tabla local de huellas para rellenar service_name/version.
+    Con un ScanRateGovernor, los puertos se agrupan por subred (shard_prefix) y cada grupo
+    pide su asignación antes de conectar, abriendo conexiones como mucho a lease.max_rate por segundo.
+    """
+    def __init__(self, concurrency: int = 200, connect_timeout: float = 2.0, read_timeout: float = 2.0,
+                 max_banner_bytes: int = 2048, cache: Optional[BannerCache] = None,
+                 rate_governor: Optional[ScanRateGovernor] = None, shard_prefix: Optional[int] = 26):
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_banner_bytes = max_banner_bytes
+        self.cache = cache
+        self.rate_governor = rate_governor
+        self.shard_prefix = shard_prefix
+        self._tls_context = ssl.create_default_context()
+        # Solo se lee el banner: no se valida el certificado del objetivo
+        self._tls_context.check_hostname = False
+        self._tls_context.verify_mode = ssl.CERT_NONE
+        logger.info(f"[AsyncBannerGrabber] Inicializado. Concurrencia: {concurrency}, timeouts: {connect_timeout}s/{read_timeout}s.")
+
+    async def _read(self, reader: asyncio.StreamReader) -> bytes:
+        try:
+            return await asyncio.wait_for(reader.read(self.max_banner_bytes), timeout=self.read_timeout)
+        except (asyncio.TimeoutError, OSError):
+            return b""
+
+    async def _grab(self, ip: str, port: int) -> Optional[str]:
+        use_tls = port in TLS_PORTS
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port, ssl=self._tls_context if use_tls else None),
+                timeout=self.connect_timeout
+            )
+        except (asyncio.TimeoutError, OSError, ssl.SSLError):
+            return None
+
+        try:
+            data = b"" if use_tls else await self._read(reader)
+            if not data:
+                # El servicio no habla primero: probar una petición HTTP mínima
+                writer.write(f"HEAD / HTTP/1.0\r\nHost: {ip}\r\nUser-Agent: Molly\r\n\r\n".encode())
+                await writer.drain()
+                data = await self._read(reader)
+            return data.decode('latin-1') if data else None
+        except (OSError, ssl.SSLError):
+            return None
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    async def grab_many_async(self, targets: List[Tuple[str, int]], max_rate: Optional[int] = None) -> Dict[Tuple[str, int], Optional[str]]:
+        """Lee los banners con un número fijo de workers. Con `max_rate` las conexiones se inician como mucho a esa tasa por segundo."""
+        banners: Dict[Tuple[str, int], Optional[str]] = {}
+        pending = iter(targets)
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / max_rate if max_rate else 0.0
+        next_start = [loop.time()]
+
+        async def throttle():
+            # Un único hilo de eventos: reservar el siguiente hueco no necesita cerrojo
+            slot = max(loop.time(), next_start[0])
+            next_start[0] = slot + interval
+            if slot > loop.time():
+                await asyncio.sleep(slot - loop.time())
+
+        async def worker():
+            for ip, port in pending:
+                if interval:
+                    await throttle()
+                banners[(ip, port)] = await self._grab(ip, port)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(self.concurrency, len(targets))))))
+        return banners
+
+    def _group_by_subnet(self, targets: List[Tuple[str, int]]) -> Dict[str, List[Tuple[str, int]]]:
+        """Agrupa los (ip, puerto) por subred de prefijo shard_prefix; lo que no es una IP se agrupa por sí mismo."""
+        groups: Dict[str, List[Tuple[str, int]]] = {}
+        for ip, port in targets:
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                groups.setdefault(ip, []).append((ip, port))
+                continue
+            prefix = min(self.shard_prefix or address.max_prefixlen, address.max_prefixlen)
+            subnet = str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+            groups.setdefault(subnet, []).append((ip, port))
+        return groups
+
+    def grab_many(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Optional[str]]:
+        """
+        Lee los banners de todos los objetivos. Con ScanRateGovernor, cada subred toma su
+        asignación y se sondea a la tasa concedida, compartiendo el presupuesto con Nmap y el motor 'connect'.
+        """
+        if not self.rate_governor:
+            return asyncio.run(self.grab_many_async(targets))
+
+        banners: Dict[Tuple[str, int], Optional[str]] = {}
+        for subnet, group in self._group_by_subnet(targets).items():
+            try:
+                with self.rate_governor.lease(subnet) as lease:
+                    banners.update(asyncio.run(self.grab_many_async(group, max_rate=lease.max_rate)))
+            except TimeoutError as e:
+                logger.error(f"[AsyncBannerGrabber] {e}")
+                banners.update({target: None for target in group})
+        return banners
+
+    @staticmethod
+    def banner_hash(banner: str) -> str:
+        return hashlib.sha256(normalize_banner(banner).encode('utf-8', errors='replace')).hexdigest()
+
+    def identify(self, targets: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """
+        Identifica los servicios de los (ip, puerto) indicados. Para cada uno retorna
+        {"banner", "banner_hash", "service_name", "version", "source"}, donde source es
+        'cache', 'fingerprint' o None si no se pudo identificar.
+        """
+        if not targets:
+            return {}
+        start_time = time.time()
+        banners = self.grab_many(targets)
+
+        results: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        cache_hits = 0
+        for (ip, port), banner in banners.items():
+            entry = {"banner": banner, "banner_hash": None, "service_name": None, "version": None, "source": None}
+            if banner:
+                entry["banner_hash"] = self.banner_hash(banner)
+                cached = self.cache.get(ip, port, entry["banner_hash"]) if self.cache else None
+                fingerprint = match_fingerprint(banner, is_tls=port in TLS_PORTS)
+                if cached and cached['source'] == 'fingerprint' and fingerprint != (cached['service_name'], cached['version']):
+                    # Identificación guardada con una tabla de huellas anterior: manda la tabla actual
+                    cached = None
+                if cached:
+                    entry.update(service_name=cached['service_name'], version=cached['version'], source='cache')
+                    cache_hits += 1
+                elif fingerprint:
+                    entry.update(service_name=fingerprint[0], version=fingerprint[1], source='fingerprint')
+                    if self.cache:
+                        self.cache.store(ip, port, entry["banner_hash"], fingerprint[0], fingerprint[1], 'fingerprint')
+            results[(ip, port)] = entry
+
+        identified = sum(1 for e in results.values() if e["source"])
+        logger.info(f"[AsyncBannerGrabber] {len(targets)} puertos sondeados en {time.time() - start_time:.2f}s: "
+                    f"{identified} identificados ({cache_hits} desde caché).")
+        return results
+
+
+# Ejemplo de uso (para pruebas) contra listeners en localhost
+if __name__ == '__main__':
+    import json
+    import threading
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    async def serve_banner(banner: bytes, http: bool = False):
+        async def handler(reader, writer):
+            if http:
+                await reader.readuntil(b"\r\n\r\n")
+            writer.write(banner)
+            await writer.drain()
+            writer.close()
+        server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        return server, server.sockets[0].getsockname()[1]
+
+    ports: Dict[str, int] = {}
+    ready = threading.Event()
+
+    def run_servers():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        for name, banner, http in [
+            ("ssh", b"SSH-2.0-OpenSSH_7.6p1 Ubuntu-4ubuntu0.3\r\n", False),
+            ("ftp", b"220 (vsFTPd 3.0.3)\r\n", False),
+            ("smtp", b"220 mail.example.com ESMTP Postfix (Ubuntu)\r\n", False),
+            ("http", b"HTTP/1.0 200 OK\r\nServer: nginx/1.18.0\r\nDate: Mon, 19 Oct 2026 10:00:00 GMT\r\n\r\n", True),
+        ]:
+            _, ports[name] = loop.run_until_complete(serve_banner(banner, http))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run_servers, daemon=True).start()
+    ready.wait()
+
+    cache = BannerCache(db_name='banner_cache_demo.db')
+    grabber = AsyncBannerGrabber(read_timeout=0.5, cache=cache)
+    targets = [("127.0.0.1", port) for port in ports.values()]
+    for attempt in (1, 2):
+        print(f"--- Ronda {attempt} ---")
+        identified = grabber.identify(targets)
+        print(json.dumps({f"{ip}:{port}": {k: v for k, v in e.items() if k != 'banner'} for (ip, port), e in identified.items()}, indent=2))
+    os.remove(cache.db_path)
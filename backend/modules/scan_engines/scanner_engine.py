@@ -0,0 +1,137 @@
+# src/modules/scan_engines/scanner_engine.py
+import contextvars
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from utils.command_runner import CommandRunner
+from modules.nmap_tool.nmap_runner import NmapRunner
+from modules.nmap_tool.nmap_parser import NmapParser
+from modules.nmap_tool.rate_governor import ScanRateGovernor, RateLease, split_target_into_shards
+
+logger = logging.getLogger(__name__)
+
+
+class ScannerEngine(ABC):
+    """
+    Interfaz común de los motores de escaneo de puertos.
+
+    Todos los motores devuelven el mismo diccionario, de modo que ScanHandler puede
+    intercambiarlos sin cambios:
+        {
+            "success": bool,
+            "stdout": str,          # Salida en texto (formato compatible con NmapParser)
+            "stderr": str,
+            "parsed": {"hosts": {...}}  # Misma estructura que NmapParser.parse_nmap_output
+        }
+    Los motores con ScanRateGovernor escanean por shards con _scan_in_shards.
+    """
+    name = "base"
+    rate_governor: Optional[ScanRateGovernor] = None
+    shard_prefix: Optional[int] = 26
+    max_concurrent_shards: int = 1
+    scan_deadline: Optional[float] = None
+
+    @abstractmethod
+    def scan(self, target: str, ports: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+        """Escanea el objetivo y retorna el diccionario común descrito en la clase."""
+
+    def _scan_in_shards(self, target: str, run_shard: Callable[[str, RateLease, Optional[float]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Divide el objetivo en shards, ejecuta `run_shard(shard, lease, deadline)` para cada uno con la
+        asignación que conceda el gobernador (hasta max_concurrent_shards en paralelo) y combina los resultados.
+        Con scan_deadline, los shards que no obtienen asignación antes del plazo global se omiten y se
+        informan en stderr; `run_shard` recibe el plazo para acotar su propio timeout.
+        """
+        shards = split_target_into_shards(target, self.shard_prefix)
+        deadline = time.time() + self.scan_deadline if self.scan_deadline else None
+        if len(shards) > 1:
+            logger.info(f"[{type(self).__name__}] Objetivo {target} dividido en {len(shards)} shards para el reparto de tasa "
+                        f"(hasta {self.max_concurrent_shards} en paralelo).")
+
+        def scan_shard(shard: str) -> Dict[str, Any]:
+            remaining = deadline - time.time() if deadline else None
+            if remaining is not None and remaining <= 0:
+                return {"success": False, "stdout": "", "stderr": f"Shard {shard} omitido: se agotó el plazo del escaneo.", "parsed": {"hosts": {}}}
+            try:
+                with self.rate_governor.lease(shard, timeout=remaining) as lease:
+                    return run_shard(shard, lease, deadline)
+            except TimeoutError as e:
+                logger.error(f"[{type(self).__name__}] {e}")
+                return {"success": False, "stdout": "", "stderr": str(e), "parsed": {"hosts": {}}}
+
+        if len(shards) == 1 or self.max_concurrent_shards <= 1:
+            results = [scan_shard(shard) for shard in shards]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(shards), self.max_concurrent_shards)) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, scan_shard, shard) for shard in shards]
+                results = [future.result() for future in futures]
+
+        combined_hosts: Dict[str, Any] = {}
+        stdout_parts: List[str] = []
+        stderr_parts: List[str] = []
+        any_success = False
+        for result in results:
+            if not result["success"]:
+                stderr_parts.append(result["stderr"])
+                continue
+            any_success = True
+            stdout_parts.append(result["stdout"])
+            combined_hosts.update(result["parsed"]["hosts"])
+
+        return {
+            "success": any_success,
+            "stdout": "\n".join(stdout_parts),
+            "stderr": "\n".join(part for part in stderr_parts if part),
+            "parsed": {"hosts": combined_hosts}
+        }
+
+
+class NmapScannerEngine(ScannerEngine):
+    """
+    Motor basado en el ejecutable Nmap. Divide el objetivo en shards y cada shard negocia
+    su tasa con el ScanRateGovernor justo antes de arrancar, de modo que el reparto del
+    presupuesto global se ajusta a medida que otros escaneos empiezan y terminan.
+    Los shards se lanzan en paralelo (hasta max_concurrent_shards; el gobernador decide cuántos
+    arrancan realmente) y todo el escaneo tiene un plazo global: los shards que no llegan a
+    empezar antes de `scan_deadline` segundos se omiten y se informan en stderr.
+    """
+    name = "nmap"
+
+    def __init__(self, command_runner: CommandRunner, rate_governor: ScanRateGovernor,
+                 shard_prefix: Optional[int] = 26, timeout: int = 600,
+                 max_concurrent_shards: Optional[int] = None, scan_deadline: Optional[float] = None):
+        self.command_runner = command_runner
+        self.nmap_runner = NmapRunner(command_runner=command_runner)
+        self.nmap_parser = NmapParser()
+        self.rate_governor = rate_governor
+        self.shard_prefix = shard_prefix
+        self.timeout = timeout
+        # Por defecto, tantos shards como asignaciones mínimas caben en el presupuesto global
+        self.max_concurrent_shards = max_concurrent_shards or max(1, rate_governor.global_max_rate // rate_governor.min_rate_per_scan)
+        self.scan_deadline = scan_deadline
+
+    def scan(self, target: str, ports: Optional[str] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+        profile = profile or 'default_scan'
+        return self._scan_in_shards(target, lambda shard, lease, deadline: self._run_nmap(shard, lease, deadline, ports, profile))
+
+    def _run_nmap(self, shard: str, lease: RateLease, deadline: Optional[float], ports: Optional[str], profile: str) -> Dict[str, Any]:
+        """Ejecuta Nmap sobre un shard con la tasa concedida, sin pasarse del plazo global del escaneo."""
+        nmap_command = self.nmap_runner.build_command(
+            shard, profile=profile, ports=ports,
+            min_rate=lease.min_rate, max_rate=lease.max_rate,
+            max_parallelism=lease.max_parallelism
+        )
+        timeout = self.timeout
+        if deadline:
+            timeout = max(1, min(timeout, int(deadline - time.time())))
+        nmap_result = self.command_runner.run_command(nmap_command, timeout=timeout)
+
+        if not nmap_result.success:
+            logger.error(f"ERROR: Nmap falló para el shard {shard}. STDERR:\n{nmap_result.stderr}")
+            return {"success": False, "stdout": "", "stderr": nmap_result.stderr, "parsed": {"hosts": {}}}
+
+        parsed_shard = self.nmap_parser.parse_nmap_output(nmap_result.stdout)
+        return {"success": True, "stdout": nmap_result.stdout, "stderr": "", "parsed": {"hosts": parsed_shard.get('hosts', {})}}
@@ -0,0 +1,97 @@
+# src/modules/scan_engines/service_fingerprints.py
+import re
+from typing import Optional, Tuple, List, Pattern
+
+# Tabla local de huellas de servicios. Cada entrada es (service_name, patrón, plantilla de versión).
+# La plantilla usa {1}, {2}... para los grupos del patrón y produce cadenas con el mismo estilo que
+# el campo VERSION de Nmap (ej. "OpenSSH 7.6p1 Ubuntu 4"), para que construct_cpe_name_simplified
+# funcione igual con ambas fuentes. El orden importa: las entradas específicas van antes que las genéricas.
+# No hay patrones comodín (ej. "SSH-2.0-<lo que sea>" o cualquier cabecera Server): los banners que no
+# coinciden con un producto conocido se dejan a Nmap -sV en lugar de pasar texto libre a la construcción del CPE.
+SERVICE_FINGERPRINTS: List[Tuple[str, str, str]] = [
+    # SSH
+    ("ssh", r"^SSH-[\d.]+-OpenSSH_([\w.]+)(?:[ -]+([^\s-]+)(?:[ -]+(\S+))?)?", "OpenSSH {1} {2} {3}"),
+    ("ssh", r"^SSH-[\d.]+-dropbear_([\w.]+)", "Dropbear sshd {1}"),
+    ("ssh", r"^SSH-[\d.]+-Cisco-([\w.]+)", "Cisco SSH {1}"),
+    # FTP
+    ("ftp", r"^220.*\(vsFTPd ([\d.]+)\)", "vsftpd {1}"),
+    ("ftp", r"^220.*ProFTPD ([\d.]+\w*)", "ProFTPD {1}"),
+    ("ftp", r"^220.*Pure-FTPd", "Pure-FTPd"),
+    ("ftp", r"^220.*FileZilla Server(?: version)? ([\d.]+\w*)", "FileZilla ftpd {1}"),
+    ("ftp", r"^220 Microsoft FTP Service", "Microsoft ftpd"),
+    # SMTP
+    ("smtp", r"^220 .*ESMTP Postfix", "Postfix smtpd"),
+    ("smtp", r"^220 .*Exim ([\d.]+)", "Exim smtpd {1}"),
+    ("smtp", r"^220 .*Sendmail ([\w./]+)", "Sendmail {1}"),
+    ("smtp", r"^220 .*Microsoft ESMTP MAIL Service", "Microsoft Exchange smtpd"),
+    # POP3 / IMAP
+    ("pop3", r"^\+OK .*Dovecot", "Dovecot pop3d"),
+    ("imap", r"^\* OK .*Dovecot", "Dovecot imapd"),
+    # Bases de datos (saludo binario decodificado como latin-1)
+    ("mysql", r"^[\s\S]{4}\x0a([0-9][\w.\-~+]*MariaDB[\w.\-~+]*)\x00", "MariaDB {1}"),
+    ("mysql", r"^[\s\S]{4}\x0a([0-9][\w.\-~+]*)\x00", "MySQL {1}"),
+    # HTTP (cabecera Server de la respuesta a la sonda HEAD)
+    ("http", r"^Server:\s*Apache/([\d.]+)(?:\s*\(([^)]+)\))?", "Apache httpd {1} ({2})"),
+    ("http", r"^Server:\s*nginx/([\d.]+)", "nginx {1}"),
+    ("http", r"^Server:\s*Microsoft-IIS/([\d.]+)", "Microsoft IIS httpd {1}"),
+    ("http", r"^Server:\s*lighttpd/([\d.]+)", "lighttpd {1}"),
+    # La versión de Coyote es la del conector, no la de Tomcat: no se reporta
+    ("http", r"^Server:\s*Apache-Coyote/", "Apache Tomcat/Coyote JSP engine"),
+    ("http", r"^Server:\s*Jetty\(([\w.\-]+)\)", "Jetty {1}"),
+]
+
+_COMPILED_FINGERPRINTS: List[Tuple[str, Pattern, str]] = [
+    (service, re.compile(pattern, re.MULTILINE | re.IGNORECASE), template)
+    for service, pattern, template in SERVICE_FINGERPRINTS
+]
+
+
+def _render_version(template: str, match: re.Match) -> str:
+    rendered = template
+    for index in range(1, (match.re.groups or 0) + 1):
+        rendered = rendered.replace(f"{{{index}}}", match.group(index) or "")
+    # Eliminar paréntesis vacíos y espacios sobrantes de grupos opcionales no capturados
+    rendered = rendered.replace("()", "")
+    return re.sub(r"\s+", " ", rendered).strip()
+
+
+def match_fingerprint(banner: str, is_tls: bool = False) -> Optional[Tuple[str, str]]:
+    """
+    Busca el banner en la tabla de huellas. Retorna (service_name, version) o None.
+    Si la conexión fue TLS, los servicios HTTP se reportan como 'https', como hace Nmap.
+    """
+    if not banner:
+        return None
+    for service, pattern, template in _COMPILED_FINGERPRINTS:
+        match = pattern.search(banner)
+        if match:
+            if service == "http" and is_tls:
+                service = "https"
+            return service, _render_version(template, match)
+    return None
+
+
+# Patrones de fecha/hora que cambian en cada conexión y no deben alterar el hash del banner
+_VOLATILE_PATTERNS = [
+    re.compile(r"\b\d{1,2}:\d{2}(:\d{2})?\b"),
+    re.compile(r"\b\d{1,2} (Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{2,4}\b", re.IGNORECASE),
+    re.compile(r"\b(Mon|Tue|Wed|Thu|Fri|Sat|Sun)[a-z]*,?", re.IGNORECASE),
+]
+
+
+def normalize_banner(banner: str) -> str:
+    """
+    Reduce un banner a la parte estable que identifica al servicio: la primera línea para
+    banners pasivos y la línea de estado + cabecera Server para respuestas HTTP.
+    """
+    lines = [line.strip() for line in banner.splitlines() if line.strip()]
+    if not lines:
+        return ""
+    if lines[0].upper().startswith("HTTP/"):
+        stable = [lines[0]] + [line for line in lines[1:] if line.lower().startswith("server:")]
+    else:
+        stable = lines[:1]
+    text = " ".join(stable)
+    for pattern in _VOLATILE_PATTERNS:
+        text = pattern.sub("", text)
+    return re.sub(r"\s+", " ", text).strip()
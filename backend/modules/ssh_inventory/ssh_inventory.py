@@ -0,0 +1,308 @@
+# src/modules/ssh_inventory/ssh_inventory.py
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import paramiko
+
+from core.data_manager import DataManager
+
+logger = logging.getLogger(__name__)
+
+# Un solo comando por host: SO, kernel y paquetes instalados separados por marcadores.
+INVENTORY_COMMAND = (
+    "cat /etc/os-release 2>/dev/null; "
+    "echo '---MOLLY-KERNEL---'; uname -sr 2>/dev/null; "
+    "echo '---MOLLY-PACKAGES---'; "
+    "if command -v dpkg-query >/dev/null 2>&1; then echo dpkg; dpkg-query -W -f='${Package}\\t${Version}\\n' 2>/dev/null; "
+    "elif command -v rpm >/dev/null 2>&1; then echo rpm; rpm -qa --qf '%{NAME}\\t%{VERSION}-%{RELEASE}\\n' 2>/dev/null; "
+    "elif command -v apk >/dev/null 2>&1; then echo apk; apk info -v 2>/dev/null; "
+    "fi"
+)
+
+
+class TrustOnFirstUsePolicy(paramiko.MissingHostKeyPolicy):
+    """
+    Acepta la clave de un host la primera vez que se ve y la guarda en la caché de
+    claves compartida. Si más adelante el host presenta otra clave, paramiko rechaza la conexión.
+    Con contraseña nunca se acepta una clave nueva: un host suplantado la recibiría en claro.
+    """
+    def __init__(self, pool: 'SSHConnectionPool', password_auth: bool = False):
+        self.pool = pool
+        self.password_auth = password_auth
+
+    def missing_host_key(self, client, hostname, key):
+        if self.password_auth:
+            raise paramiko.SSHException(
+                f"Clave de host desconocida para {hostname}: no se envía la contraseña a un host nuevo. "
+                f"Añade su clave a {self.pool.known_hosts_file} o usa autenticación por clave."
+            )
+        self.pool.remember_host_key(hostname, key)
+
+
+class SSHConnectionPool:
+    """
+    Pool de sesiones SSH reutilizables por (host, puerto, usuario). Las claves de host se
+    cargan una vez desde disco y se comparten entre todas las conexiones. Por defecto solo se
+    conecta a hosts cuya clave ya está en known_hosts_file (ej. rellenado con ssh-keyscan);
+    con trust_on_first_use se aceptan claves nuevas, salvo cuando se autentica con contraseña.
+    """
+    def __init__(self, known_hosts_file: str = os.path.join('data', 'ssh_known_hosts'),
+                 connect_timeout: float = 10.0, idle_timeout: float = 300.0, max_idle_per_host: int = 2,
+                 trust_on_first_use: bool = False):
+        self.known_hosts_file = known_hosts_file
+        self.trust_on_first_use = trust_on_first_use
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_host = max_idle_per_host
+
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, int, str], List[Tuple[paramiko.SSHClient, float]]] = {}
+        self.host_keys = paramiko.HostKeys()
+        os.makedirs(os.path.dirname(known_hosts_file) or '.', exist_ok=True)
+        if os.path.exists(known_hosts_file):
+            self.host_keys.load(known_hosts_file)
+        logger.info(f"[SSHConnectionPool] Inicializado con {len(self.host_keys)} claves de host conocidas "
+                    f"(claves nuevas: {'confianza en el primer uso' if trust_on_first_use else 'rechazadas'}).")
+
+    def remember_host_key(self, hostname: str, key: paramiko.PKey):
+        with self._lock:
+            self.host_keys.add(hostname, key.get_name(), key)
+            self.host_keys.save(self.known_hosts_file)
+        logger.info(f"[SSHConnectionPool] Clave de host registrada para {hostname} ({key.get_name()}).")
+
+    def _connect(self, host: str, port: int, username: str, password: Optional[str], key_filename: Optional[str]) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client_host_keys = client.get_host_keys()
+        with self._lock:
+            for hostname, keys in self.host_keys.items():
+                for key_type, host_key in keys.items():
+                    client_host_keys.add(hostname, key_type, host_key)
+        if self.trust_on_first_use:
+            client.set_missing_host_key_policy(TrustOnFirstUsePolicy(self, password_auth=bool(password)))
+        else:
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+        client.connect(
+            host, port=port, username=username, password=password, key_filename=key_filename,
+            timeout=self.connect_timeout, banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout,
+            look_for_keys=False, allow_agent=False
+        )
+        return client
+
+    @contextmanager
+    def session(self, host: str, port: int, username: str, password: Optional[str] = None,
+                key_filename: Optional[str] = None) -> Iterator[paramiko.SSHClient]:
+        """
+        Entrega una sesión SSH del pool (o abre una nueva) y la devuelve al pool al terminar.
+        Las sesiones que fallan durante el uso se cierran en lugar de devolverse.
+        """
+        key = (host, port, username)
+        client = None
+        with self._lock:
+            idle_clients = self._idle.get(key, [])
+            while idle_clients and client is None:
+                candidate, last_used = idle_clients.pop()
+                transport = candidate.get_transport()
+                if transport and transport.is_active() and time.time() - last_used < self.idle_timeout:
+                    client = candidate
+                else:
+                    candidate.close()
+        if client is None:
+            client = self._connect(host, port, username, password, key_filename)
+
+        healthy = True
+        try:
+            yield client
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            with self._lock:
+                idle_clients = self._idle.setdefault(key, [])
+                if healthy and len(idle_clients) < self.max_idle_per_host:
+                    idle_clients.append((client, time.time()))
+                else:
+                    client.close()
+
+    def close_all(self):
+        with self._lock:
+            for idle_clients in self._idle.values():
+                for client, _ in idle_clients:
+                    client.close()
+            self._idle.clear()
+
+
+def parse_inventory_output(output: str) -> Dict[str, Any]:
+    """
+    Parsea la salida de INVENTORY_COMMAND. Retorna {"os_info", "kernel", "package_manager", "packages"}.
+    """
+    os_section, _, rest = output.partition('---MOLLY-KERNEL---')
+    kernel_section, _, packages_section = rest.partition('---MOLLY-PACKAGES---')
+
+    os_release = {}
+    for line in os_section.splitlines():
+        if '=' in line:
+            field, value = line.split('=', 1)
+            os_release[field.strip()] = value.strip().strip('"')
+    kernel = kernel_section.strip() or None
+    os_info = os_release.get('PRETTY_NAME') or " ".join(filter(None, [os_release.get('NAME'), os_release.get('VERSION_ID')])) or None
+    if os_info and kernel:
+        os_info = f"{os_info} ({kernel})"
+    elif kernel:
+        os_info = kernel
+
+    package_lines = [line.strip() for line in packages_section.strip().splitlines() if line.strip()]
+    package_manager = package_lines[0] if package_lines else None
+    packages = []
+    apk_pattern = re.compile(r"^(.+)-(\d[^-]*-r\d+)$")
+    for line in package_lines[1:]:
+        if '\t' in line:
+            name, version = line.split('\t', 1)
+        elif package_manager == 'apk':
+            match = apk_pattern.match(line)
+            if not match:
+                continue
+            name, version = match.group(1), match.group(2)
+        else:
+            continue
+        packages.append({"name": name.strip(), "version": version.strip(), "package_manager": package_manager})
+
+    return {"os_info": os_info, "kernel": kernel, "package_manager": package_manager, "packages": packages}
+
+
+class SSHInventoryCollector:
+    """
+    Recoge el inventario autenticado (SO y paquetes instalados) de varios hosts por SSH en
+    paralelo, con concurrencia acotada, y lo guarda en DataManager a medida que cada host termina.
+    """
+    def __init__(self, data_manager: DataManager, pool: Optional[SSHConnectionPool] = None,
+                 max_workers: int = 10, command_timeout: float = 60.0):
+        self.data_manager = data_manager
+        self.pool = pool or SSHConnectionPool()
+        self.max_workers = max_workers
+        self.command_timeout = command_timeout
+        logger.info(f"[SSHInventoryCollector] Inicializado. Hosts en paralelo: {max_workers}.")
+
+    def _collect_host(self, ip_address: str, port: int, username: str, password: Optional[str], key_filename: Optional[str]) -> Dict[str, Any]:
+        with self.pool.session(ip_address, port, username, password, key_filename) as client:
+            _, stdout, stderr = client.exec_command(INVENTORY_COMMAND, timeout=self.command_timeout)
+            output = stdout.read().decode('utf-8', errors='replace')
+            exit_status = stdout.channel.recv_exit_status()
+            if exit_status != 0 and not output:
+                raise RuntimeError(stderr.read().decode('utf-8', errors='replace') or f"Código de salida {exit_status}")
+        return parse_inventory_output(output)
+
+    def collect(self, hosts: List[Dict[str, Any]], username: str, password: Optional[str] = None,
+                key_filename: Optional[str] = None, port: int = 22) -> Dict[str, Any]:
+        """
+        Recoge el inventario de los hosts indicados ({"ip_address", "id"} como los devuelve DataManager).
+        Retorna un resumen {"hosts_collected", "hosts_failed", "packages_count", "errors"}.
+        """
+        summary = {"hosts_collected": 0, "hosts_failed": 0, "packages_count": 0, "errors": {}}
+        if not hosts:
+            return summary
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._collect_host, host['ip_address'], port, username, password, key_filename): host
+                for host in hosts
+            }
+            for future in as_completed(futures):
+                host = futures[future]
+                try:
+                    inventory = future.result()
+                except Exception as e:
+                    summary["hosts_failed"] += 1
+                    summary["errors"][host['ip_address']] = str(e)
+                    logger.warning(f"[SSHInventoryCollector] No se pudo recoger el inventario de {host['ip_address']}: {e}")
+                    continue
+
+                # Se guarda en cuanto llega cada host, sin esperar al resto
+                if inventory["os_info"]:
+                    self.data_manager.update_host_os_info(host['id'], inventory["os_info"])
+                inserted = self.data_manager.add_packages(host['id'], inventory["packages"])
+                summary["hosts_collected"] += 1
+                summary["packages_count"] += inserted
+                logger.info(f"[SSHInventoryCollector] {host['ip_address']}: {inserted} paquetes ({inventory['package_manager']}), SO: {inventory['os_info']}")
+
+        logger.info(f"[SSHInventoryCollector] Inventario completado en {time.time() - start_time:.2f}s: "
+                    f"{summary['hosts_collected']} hosts, {summary['packages_count']} paquetes, {summary['hosts_failed']} fallos.")
+        return summary
+
+
+# Ejemplo de uso (para pruebas) contra un servidor SSH local basado en paramiko
+if __name__ == '__main__':
+    import socket
+    import tempfile
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    CANNED_OUTPUT = (
+        'PRETTY_NAME="Ubuntu 18.04.6 LTS"\nNAME="Ubuntu"\nVERSION_ID="18.04"\n'
+        "---MOLLY-KERNEL---\nLinux 4.15.0-213-generic\n"
+        "---MOLLY-PACKAGES---\ndpkg\nopenssh-server\t1:7.6p1-4ubuntu0.7\nopenssl\t1.1.1-1ubuntu2.1~18.04.23\nvsftpd\t3.0.3-9build1\n"
+    )
+
+    class StandInServer(paramiko.ServerInterface):
+        """Servidor SSH mínimo que responde a cualquier comando con un inventario fijo."""
+        def check_channel_request(self, kind, chanid):
+            return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+        def get_allowed_auths(self, username):
+            return 'password'
+
+        def check_auth_password(self, username, password):
+            return paramiko.AUTH_SUCCESSFUL if (username, password) == ('molly', 'molly') else paramiko.AUTH_FAILED
+
+        def check_channel_exec_request(self, channel, command):
+            def respond():
+                time.sleep(0.05)
+                channel.sendall(CANNED_OUTPUT.encode())
+                channel.send_exit_status(0)
+                channel.close()
+            threading.Thread(target=respond, daemon=True).start()
+            return True
+
+    server_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(10)
+    server_port = listener.getsockname()[1]
+
+    def drain_channels(transport: paramiko.Transport):
+        while transport.is_active():
+            transport.accept(1)
+
+    def serve():
+        while True:
+            connection, _ = listener.accept()
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(server_key)
+            transport.start_server(server=StandInServer())
+            threading.Thread(target=drain_channels, args=(transport,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        data_manager = DataManager()
+        scan_id = data_manager.create_scan_session("demo_inventario", "Network Scan", "127.0.0.1")
+        host_id = data_manager.add_host(scan_id, "127.0.0.1")
+
+        pool = SSHConnectionPool(known_hosts_file=os.path.join(tmp_dir, 'known_hosts'))
+        collector = SSHInventoryCollector(data_manager, pool=pool, max_workers=4)
+        print("--- Host con clave desconocida: se rechaza ---")
+        print(collector.collect([{"id": host_id, "ip_address": "127.0.0.1"}], username='molly', password='molly', port=server_port))
+        pool.remember_host_key(f"[127.0.0.1]:{server_port}", server_key)  # Equivale a pre-cargar known_hosts con ssh-keyscan
+        for attempt in (1, 2):  # La segunda ronda reutiliza la sesión del pool
+            print(f"--- Ronda {attempt} ---")
+            print(collector.collect([{"id": host_id, "ip_address": "127.0.0.1"}], username='molly', password='molly', port=server_port))
+        print(data_manager.get_host(host_id))
+        print(data_manager.get_packages_for_host(host_id))
+        pool.close_all()
@@ -60,6 +60,62 @@ class ReportFormatter:
         
         return report_content
 
+    def format_scan_chat_summary(self, scan_info: Dict[str, Any], hosts: List[Dict[str, Any]], services_by_host: Dict[str, List[Dict[str, Any]]],
+                                 findings: List[Dict[str, Any]], cves_by_service: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                                 max_hosts: int = 20, max_cves: int = 10) -> str:
+        """
+        Resumen breve de un escaneo para el chat, construido solo con los datos guardados (sin IA).
+        Se usa cuando el modelo no responde a tiempo: totales, hosts con sus servicios, hallazgos por
+        severidad y los CVEs más graves. Con muchos hosts solo se listan los `max_hosts` con más servicios.
+        """
+        total_services = sum(len(services) for services in services_by_host.values())
+        report_content = f"**Escaneo de {scan_info.get('target', 'N/A')}** (sesión {scan_info.get('session_name', 'N/A')}): "
+        report_content += f"{len(hosts)} hosts activos, {total_services} servicios abiertos y {len(findings)} hallazgos.\n\n"
+
+        if hosts:
+            report_content += "**Hosts y servicios:**\n"
+            ranked_hosts = sorted(hosts, key=lambda h: len(services_by_host.get(h.get('ip_address'), [])), reverse=True)
+            for host in ranked_hosts[:max_hosts]:
+                ip = host.get('ip_address', 'N/A')
+                services = services_by_host.get(ip, [])
+                hostname = f" ({host['hostname']})" if host.get('hostname') else ""
+                service_list = ", ".join(
+                    f"{service.get('port')}/{service.get('service_name') or '?'}"
+                    + (f" {service['version']}" if service.get('version') else "")
+                    for service in sorted(services, key=lambda s: s.get('port') or 0)
+                ) or "sin servicios abiertos"
+                report_content += f"- {ip}{hostname}: {service_list}\n"
+            if len(hosts) > max_hosts:
+                report_content += f"- ... y {len(hosts) - max_hosts} hosts más.\n"
+            report_content += "\n"
+
+        if findings:
+            severity_order = {'Critical': 1, 'High': 2, 'Medium': 3, 'Low': 4, 'Informational': 5}
+            counts: Dict[str, int] = {}
+            for finding in findings:
+                severity = finding.get('severity') or 'Informational'
+                counts[severity] = counts.get(severity, 0) + 1
+            report_content += "**Hallazgos por severidad:** " + ", ".join(
+                f"{severity}: {count}" for severity, count in sorted(counts.items(), key=lambda item: severity_order.get(item[0], 6))
+            ) + "\n"
+            for finding in sorted(findings, key=lambda f: severity_order.get(f.get('severity'), 6))[:5]:
+                report_content += f"- {finding.get('title') or finding.get('description', 'Hallazgo sin título')} ({finding.get('severity', 'N/A')})\n"
+            report_content += "\n"
+
+        cves = {cve['cve_id']: (cve, service) for service, service_cves in (cves_by_service or {}).items() for cve in service_cves if cve.get('cve_id')}
+        if cves:
+            def cvss(item):
+                try:
+                    return float(item[0].get('cvss_score'))
+                except (TypeError, ValueError):
+                    return 0.0
+            report_content += f"**CVEs encontrados:** {len(cves)}. Los más graves:\n"
+            for cve, service in sorted(cves.values(), key=cvss, reverse=True)[:max_cves]:
+                report_content += f"- {cve['cve_id']} (CVSS {cve.get('cvss_score', 'N/A')}) en {service}\n"
+            report_content += "\n"
+
+        return report_content.rstrip() + "\n"
+
     def format_detailed_host_report(self, host_info: Dict[str, Any], services: List[Dict[str, Any]], findings: List[Dict[str, Any]]) -> str:
         """
         Formatea un informe detallado para un host específico, incluyendo servicios y hallazgos.
@@ -1,8 +1,10 @@
 # routes.py
-from flask import request, jsonify, current_app, send_from_directory, url_for, make_response
+from flask import request, jsonify, current_app, send_from_directory, url_for, make_response, Response, stream_with_context
 from flask_cors import CORS
+import json
 import logging
 import os
+import time
 
 from core.auth_session_manager import AuthSessionManager
 
@@ -152,6 +154,45 @@ def register_routes(app):
             current_app.logger.error(f"Error en /api/chat: {e}", exc_info=True)
             return jsonify({"error": "Error interno"}), 500
 
+    # ------------------------------
+    # 4b. CHAT CON MOLLY EN STREAMING (Server-Sent Events)
+    # ------------------------------
+    @app.route('/api/chat/stream', methods=['POST'])
+    def chat_stream_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+
+        data = request.get_json()
+        user_message = data.get("message")
+
+        if not user_message:
+            return jsonify({"error": "Mensaje vacio"}), 400
+
+        chat_session_id = f"chat-{get_user_token()}"
+        orchestrator = current_app.orchestrator
+        session_manager = current_app.session_manager
+
+        def sse(event: dict) -> str:
+            return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+        def generate():
+            try:
+                for event in orchestrator.handle_user_query_stream(user_message, chat_session_id=chat_session_id):
+                    if event['type'] == 'done':
+                        scan_info = session_manager.get_current_scan_info()
+                        event = {**event, "session_status": scan_info, "active_project": scan_info.get("session_name")}
+                    yield sse(event)
+            except Exception as e:
+                current_app.logger.error(f"Error en /api/chat/stream: {e}", exc_info=True)
+                yield sse({"type": "error", "message": "Error interno"})
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            # Sin caché ni buffering de proxies (nginx), para que cada evento llegue en cuanto se genera
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     # ------------------------------
     # 5. CHECK SCAN STATUS
     # ------------------------------
@@ -203,6 +244,79 @@ def register_routes(app):
         scans = current_app.data_manager.get_all_scan_sessions()
         return jsonify(scans), 200
 
+    # ------------------------------
+    # 7b. SINCRONIZACIÓN INCREMENTAL DE CVES
+    # ------------------------------
+    @app.route('/api/cve_sync', methods=['POST'])
+    def cve_sync_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+
+        # La descarga de ventanas del NVD puede tardar minutos: se ejecuta en segundo plano
+        result = current_app.orchestrator.scan_handler.start_cve_feed_sync()
+        return jsonify(result), 202 if result["status"] == "started" else 409
+
+    @app.route('/api/cve_sync', methods=['GET'])
+    def cve_sync_status_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+
+        return jsonify(current_app.orchestrator.scan_handler.get_cve_sync_status()), 200
+
+    # ------------------------------
+    # 7c. ANÁLISIS IA APLAZADOS POR CUOTA
+    # ------------------------------
+    @app.route('/api/ai_analysis_queue', methods=['GET'])
+    def ai_analysis_queue_status_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+
+        return jsonify(current_app.orchestrator.scan_handler.ai_analysis_queue.get_stats()), 200
+
+    @app.route('/api/ai_analysis_queue/process', methods=['POST'])
+    def ai_analysis_queue_process_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+
+        chat_session_id = f"chat-{get_user_token()}"
+        summary = current_app.orchestrator.scan_handler.process_deferred_ai_analyses(chat_session_id)
+        return jsonify(summary), 200
+
+    # ------------------------------
+    # 7d. MÉTRICAS DE LLAMADAS AL MODELO
+    # ------------------------------
+    def llm_metrics_filters():
+        hours = request.args.get('hours', type=float)
+        return {
+            "scan_id": request.args.get('scan_id', type=int),
+            "chat_session_id": request.args.get('chat_session_id'),
+            "since": time.time() - hours * 3600 if hours else None
+        }
+
+    @app.route('/api/llm_metrics', methods=['GET'])
+    def llm_metrics_summary_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+        if not current_app.llm_metrics:
+            return jsonify({"error": "Métricas de llamadas al modelo deshabilitadas (LLM_METRICS_ENABLED)."}), 404
+
+        group_by = request.args.get('group_by', 'purpose')
+        try:
+            summary = current_app.llm_metrics.get_summary(group_by, **llm_metrics_filters())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"group_by": group_by, "groups": summary, "call_guard": current_app.model_call_guard.get_stats()}), 200
+
+    @app.route('/api/llm_metrics/calls', methods=['GET'])
+    def llm_metrics_calls_api():
+        if not require_auth():
+            return jsonify({"error": "Sesion no valida"}), 401
+        if not current_app.llm_metrics:
+            return jsonify({"error": "Métricas de llamadas al modelo deshabilitadas (LLM_METRICS_ENABLED)."}), 404
+
+        limit = min(request.args.get('limit', 200, type=int), 1000)
+        return jsonify(current_app.llm_metrics.get_calls(limit=limit, **llm_metrics_filters())), 200
+
     # ------------------------------
     # 8. VIEW PDF
     # ------------------------------
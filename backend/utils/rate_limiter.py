@@ -0,0 +1,122 @@
+# src/utils/rate_limiter.py
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket, seguro entre hilos.
+    Se reponen `rate` tokens cada `per_seconds` segundos hasta un máximo de `capacity`;
+    cada petición consume uno. Con capacity=1 las peticiones quedan espaciadas de forma
+    uniforme, lo que respeta cuotas por ventana deslizante (ej. 5 peticiones / 30 s del NVD).
+    """
+    def __init__(self, rate: float, per_seconds: float = 1.0, capacity: Optional[float] = None):
+        if rate <= 0 or per_seconds <= 0:
+            raise ValueError("rate y per_seconds deben ser positivos.")
+        self.refill_per_second = rate / per_seconds
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_per_second)
+        self._last_refill = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Consume `tokens` si están disponibles. No bloquea."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquea hasta poder consumir `tokens`. Retorna False si se agota `timeout`
+        (None = esperar indefinidamente).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.refill_per_second
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """
+        Vacía el cubo y retrasa la reposición `seconds` segundos (ej. tras un Retry-After del servidor),
+        para que el resto de hilos también esperen en lugar de seguir golpeando el servicio.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.refill_per_second
+
+
+class SlidingWindowLimiter:
+    """
+    Limitador por ventana deslizante, seguro entre hilos: nunca se consumen más de `limit` unidades
+    en cualquier intervalo de `window_seconds`. Sirve para cuotas "por minuto" que cuentan peticiones
+    o tokens (ej. RPM/TPM de Gemini) y permite agotar la cuota sin superarla.
+    """
+    def __init__(self, limit: float, window_seconds: float = 60.0):
+        if limit <= 0 or window_seconds <= 0:
+            raise ValueError("limit y window_seconds deben ser positivos.")
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._events = deque()  # (instante, unidades)
+        self._used = 0.0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._events and self._events[0][0] <= now - self.window_seconds:
+            self._used -= self._events.popleft()[1]
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Bloquea hasta poder consumir `amount` unidades dentro de la ventana. Una petición mayor que
+        el límite se recorta al límite (ocupa la ventana completa). Retorna False si se agota `timeout`.
+        """
+        amount = min(amount, self.limit)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                if now >= self._blocked_until and self._used + amount <= self.limit:
+                    self._events.append((now, amount))
+                    self._used += amount
+                    return True
+                # Esperar a que caduquen suficientes eventos o termine la penalización
+                wait = max(self._blocked_until - now, 0.0)
+                if self._used + amount > self.limit:
+                    needed, released = self._used + amount - self.limit, 0.0
+                    for timestamp, units in self._events:
+                        released += units
+                        if released >= needed:
+                            wait = max(wait, timestamp + self.window_seconds - now)
+                            break
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.001))
+
+    def penalize(self, seconds: float):
+        """Bloquea nuevas adquisiciones durante `seconds` segundos (ej. tras un 429 del servidor)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
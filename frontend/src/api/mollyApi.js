@@ -34,3 +34,60 @@ export async function sendMessageToMolly(message) {
     return { error: "Error de conexion con Molly" };
   }
 }
+
+
+// Chat en streaming (Server-Sent Events sobre POST): los fragmentos de la respuesta
+// y los estados intermedios ("Ejecutando nmap...", "Buscando CVEs...") llegan a medida que se generan.
+// Retorna false si el streaming no está disponible (para usar sendMessageToMolly en su lugar).
+export async function streamMessageToMolly(message, { onToken, onStatus, onDone, onError } = {}) {
+  let res;
+  try {
+    res = await fetch("http://192.168.1.38:5000/api/chat/stream", {
+      method: "POST",
+      credentials: "include",
+      headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+      body: JSON.stringify({ message }),
+    });
+  } catch (error) {
+    console.error("Error abriendo el streaming con Molly:", error);
+    return false;
+  }
+
+  if (!res.ok || !res.body) {
+    return false;
+  }
+
+  const handlers = { token: onToken, status: onStatus, done: onDone, error: onError };
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  try {
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Cada evento SSE termina con una línea en blanco
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        const dataLines = frame
+          .split("\n")
+          .filter((line) => line.startsWith("data:"))
+          .map((line) => line.slice(5).trimStart());
+        if (dataLines.length === 0) continue;
+
+        const event = JSON.parse(dataLines.join("\n"));
+        handlers[event.type]?.(event);
+      }
+    }
+  } catch (error) {
+    console.error("Error leyendo el streaming de Molly:", error);
+    onError?.({ type: "error", message: "Error de conexion con Molly" });
+  }
+
+  return true;
+}
@@ -1,29 +1,50 @@
 import { useState } from "react";
-import { sendMessageToMolly } from "../api/mollyApi";
+import { sendMessageToMolly, streamMessageToMolly } from "../api/mollyApi";
 
 export function useMollyChat() {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [status, setStatus] = useState("");
+
+  // Actualiza el último mensaje (la respuesta de Molly en curso)
+  function updateLastMessage(update) {
+    setMessages((prev) => {
+      const last = prev[prev.length - 1];
+      return [...prev.slice(0, -1), { ...last, ...update(last) }];
+    });
+  }
 
   async function sendMessage(text) {
     const userMsg = { sender: "user", text };
-    setMessages((prev) => [...prev, userMsg]);
+    setMessages((prev) => [...prev, userMsg, { sender: "molly", text: "" }]);
 
     setLoading(true);
-    const res = await sendMessageToMolly(text);
-    setLoading(false);
+    setStatus("");
 
-    const botMsg = {
-      sender: "molly",
-      text: res?.response?.response || "Error en la respuesta",
-    };
+    const streamed = await streamMessageToMolly(text, {
+      onToken: (event) => {
+        setStatus("");
+        updateLastMessage((last) => ({ text: last.text + event.text }));
+      },
+      onStatus: (event) => setStatus(event.message),
+      // La respuesta completa sustituye a los fragmentos (incluye acciones que no se retransmiten)
+      onDone: (event) => updateLastMessage((last) => ({ text: event.response || last.text || "Error en la respuesta" })),
+      onError: (event) => updateLastMessage(() => ({ text: event.message || "Error en la respuesta" })),
+    });
 
-    setMessages((prev) => [...prev, botMsg]);
+    if (!streamed) {
+      const res = await sendMessageToMolly(text);
+      updateLastMessage(() => ({ text: res?.response?.response || "Error en la respuesta" }));
+    }
+
+    setLoading(false);
+    setStatus("");
   }
 
   return {
     messages,
     loading,
+    status,
     sendMessage,
   };
 }
@@ -1,10 +1,10 @@
 // src/pages/Dashboard/ChatPage.jsx
 import { useState, useRef, useEffect } from "react";
 import { Loader2, Send } from "lucide-react";
-import { sendMessageToMolly } from "../../api/mollyApi";
+import { useMollyChat } from "../../hooks/useMollyChat";
 
 // -------------- Componente de Chat Panel --------------
-const ChatPanel = ({ sendMessage, messages, isSending }) => {
+const ChatPanel = ({ sendMessage, messages, isSending, status }) => {
   const [inputMessage, setInputMessage] = useState('');
   const messagesEndRef = useRef(null);
 
@@ -27,7 +27,7 @@ const ChatPanel = ({ sendMessage, messages, isSending }) => {
 
       {/* Lista de mensajes */}
       <div className="flex-grow overflow-y-auto space-y-4 pr-2">
-        {messages.map((msg, index) => (
+        {messages.filter((msg) => msg.text).map((msg, index) => (
           <div 
             key={index} 
             className={`flex ${msg.sender === 'user' ? 'justify-end' : 'justify-start'}`}
@@ -49,12 +49,12 @@ const ChatPanel = ({ sendMessage, messages, isSending }) => {
           </div>
         ))}
 
-        {/* Indicador escribiendo */}
-        {isSending && (
+        {/* Indicador escribiendo / etapa en curso (mientras no llegan fragmentos de la respuesta) */}
+        {isSending && (status || !messages[messages.length - 1]?.text) && (
           <div className="flex justify-start">
             <div className="max-w-xs p-3 rounded-xl bg-gray-700 text-gray-100 rounded-tl-none flex items-center space-x-2">
               <Loader2 className="w-4 h-4 animate-spin text-indigo-400" />
-              <span>Molly está escribiendo...</span>
+              <span>{status || "Molly está escribiendo..."}</span>
             </div>
           </div>
         )}
@@ -93,35 +93,16 @@ const ChatPanel = ({ sendMessage, messages, isSending }) => {
 // --------------------------------------------------------
 
 export default function ChatPage() {
-  const [messages, setMessages] = useState([]);
-  const [isSending, setIsSending] = useState(false);
-
-  // --- CONEXION REAL CON BACKEND ---
-  const sendMessage = async (text) => {
-    // añadir mensaje del usuario
-    setMessages(prev => [...prev, { sender: "user", text }]);
-    setIsSending(true);
-
-    // llamar API real
-    const res = await sendMessageToMolly(text);
-
-    let reply = "Error al obtener respuesta";
-
-    if (res?.response?.response) {
-      reply = res.response.response;
-    }
-
-    // añadir respuesta de Molly
-    setMessages(prev => [...prev, { sender: "molly", text: reply }]);
-    setIsSending(false);
-  };
+  // --- CONEXION REAL CON BACKEND (respuestas en streaming) ---
+  const { messages, loading, status, sendMessage } = useMollyChat();
 
   return (
     <div className="h-full">
       <ChatPanel
         sendMessage={sendMessage}
         messages={messages}
-        isSending={isSending}
+        isSending={loading}
+        status={status}
       />
     </div>
   );